@@ -0,0 +1,131 @@
+"""
+Achievement rules driven by config.ACHIEVEMENTS.
+
+Usage:
+    python achievements.py backfill [--dry-run]
+
+The backfill evaluates every rule across all users, one field at a time, and pays out
+whatever has been earned but not unlocked, e.g. after adding an achievement to the config.
+Run it with the bot stopped. numpy speeds it up but isn't required.
+"""
+
+import argparse
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import ACHIEVEMENTS
+from database import db
+from models import ACHIEVEMENT_BITS, UserRecord
+from wallet import grant
+
+
+class AchievementEngine:
+    """
+    Threshold rules from ACHIEVEMENTS, indexed by the field each one watches.
+
+    After a bet, settlement passes the fields it changed with their new values; only the
+    rules on those fields are looked at, lowest threshold first, stopping at the first one
+    the value falls short of. Unlocks are bits in UserRecord.achievement_bits, and rewards
+    are granted under f"achievement:{user_id}:{achievement_id}" so none is paid twice.
+    """
+
+    def __init__(self, definitions: Mapping[str, dict] = ACHIEVEMENTS):
+        self.definitions = definitions
+        self._rules: Dict[str, List[Tuple[float, int, str]]] = {}
+        for achievement_id, definition in definitions.items():
+            if 'field' in definition:
+                self._rules.setdefault(definition['field'], []).append(
+                    (definition['threshold'], ACHIEVEMENT_BITS[achievement_id], achievement_id)
+                )
+        for rules in self._rules.values():
+            rules.sort()
+
+    def check(self, user_data: UserRecord, changed: Mapping[str, float],
+              commit: bool = True) -> List[Tuple[str, float]]:
+        """Unlock what the changed field values now qualify for; returns (achievement_id, reward) pairs"""
+        unlocked = []
+        for field, value in changed.items():
+            for threshold, bit, achievement_id in self._rules.get(field, ()):
+                if value < threshold:
+                    break
+                if not user_data.achievement_bits & bit:
+                    unlocked.append((achievement_id, self.unlock(user_data, achievement_id, commit)))
+        if unlocked:
+            # Rewards raise the balance, which can qualify for a balance achievement in turn
+            unlocked += self.recheck(user_data, ('balance',), commit)
+        return unlocked
+
+    def recheck(self, user_data: UserRecord, fields: Sequence[str], commit: bool = True) -> List[Tuple[str, float]]:
+        """check() the given fields at their current values, for changes made outside settlement"""
+        return self.check(user_data, {field: user_data[field] for field in fields}, commit)
+
+    def unlock(self, user_data: UserRecord, achievement_id: str, commit: bool = True) -> Optional[float]:
+        """Set the achievement's bit and grant its reward; None if the user already had it"""
+        bit = ACHIEVEMENT_BITS[achievement_id]
+        if user_data.achievement_bits & bit:
+            return None
+        user_data.achievement_bits |= bit
+        reward = self.definitions[achievement_id]['reward']
+        grant(user_data.user_id, reward, f"achievement:{user_data.user_id}:{achievement_id}", 'achievement', commit)
+        return reward
+
+    def backfill(self, users: Sequence[UserRecord], dry_run: bool = False) -> Dict[str, int]:
+        """Evaluate every rule on a stored field across all users at once; returns unlocks per achievement"""
+        bits = _column([user_data.achievement_bits for user_data in users], int)
+        counts = {}
+        unlocked = set()
+        for field, rules in self._rules.items():
+            if field not in UserRecord.FIELDS:
+                continue  # Per-bet values like 'stake' aren't stored, so there's nothing to backfill from
+            values = _column([user_data[field] or 0 for user_data in users], float)
+            for threshold, bit, achievement_id in rules:
+                due = _due(values, bits, threshold, bit)
+                counts[achievement_id] = len(due)
+                if not dry_run:
+                    for i in due:
+                        self.unlock(users[i], achievement_id, commit=False)
+                        unlocked.add(users[i].user_id)
+        db.commit(*unlocked)
+        return counts
+
+
+def _column(values: list, kind: type):
+    return np.array(values, dtype=np.int64 if kind is int else np.float64) if np is not None else values
+
+
+def _due(values, bits, threshold: float, bit: int) -> Sequence[int]:
+    """Indexes of users whose value reaches the threshold and who don't have the bit yet"""
+    if np is not None:
+        return np.flatnonzero((values >= threshold) & ((bits & bit) == 0)).tolist()
+    return [i for i, (value, held) in enumerate(zip(values, bits)) if value >= threshold and not held & bit]
+
+
+# Global achievement engine
+achievement_engine = AchievementEngine()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Achievement maintenance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill = commands.add_parser('backfill', help="unlock earned achievements across all users")
+    backfill.add_argument('--dry-run', action='store_true', help="only count what would unlock")
+    args = parser.parse_args()
+
+    users = db.all_users()
+    counts = achievement_engine.backfill(users, args.dry_run)
+    if not args.dry_run:
+        db.save_data()
+
+    print(f"{'Would unlock' if args.dry_run else 'Unlocked'} across {len(users)} users:")
+    for achievement_id, count in counts.items():
+        print(f"  {ACHIEVEMENTS[achievement_id]['name']}: {count}")
+    if np is None:
+        print("(numpy not installed; evaluated without it)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,675 @@
+"""
+Benchmarks for Antaria Casino internals.
+
+Usage:
+    python benchmarks.py persistence [--users 10000 100000 1000000]
+    python benchmarks.py memory [--users 100000]
+    python benchmarks.py stress [--users 20] [--bets 5000]
+    python benchmarks.py ledger [--entries 200000]
+    python benchmarks.py ratelimit [--users 100000] [--updates 1000000]
+    python benchmarks.py fairness [--users 100] [--bets 200000]
+    python benchmarks.py blackjack [--hands 2000000] [--decks 6]
+    python benchmarks.py roulette [--spins 10000] [--players 20] [--bets 8]
+    python benchmarks.py latency [--bets 50] [--rtt 0.05] [--interval 0.2]
+    python benchmarks.py settlement [--users 1000] [--bets 100000] [--batch 1 20 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+from telegram import Update
+from telegram.ext import ExtBot
+
+import settlement
+import text_handler
+import wallet
+from config import ACHIEVEMENTS, STARTING_BALANCE
+from database import Database
+from fairness import FairnessEngine, digest_draws, replay
+from games import BlackjackGame, BlackjackHand, BlackjackShoe, CrashGame, RouletteGame, RouletteSlip
+from ledger import HOUSE, Ledger
+from ratelimit import ALLOWED, RateLimiter
+from send_queue import SendQueue
+from models import UserRecord
+
+
+def _sample_user(user_id: int) -> dict:
+    """A user in the old dict layout Database.get_user used to create, with some play history"""
+    now = datetime.now().isoformat()
+    return {
+        'balance': 1000.0 + user_id % 977,
+        'username': f"player{user_id}",
+        'total_wagered': float(user_id % 5000),
+        'total_won': float(user_id % 3000),
+        'games_played': user_id % 400,
+        'last_bonus': None,
+        'bonus_streak': user_id % 7,
+        'ltc_address': f"LTC{user_id % 1000000}xyz",
+        'achievements': ['first_bet'],
+        'referrals': [],
+        'referred_by': None,
+        'level': 1 + user_id % 50,
+        'xp': user_id % 10000,
+        'win_streak': user_id % 5,
+        'max_win_streak': user_id % 12,
+        'created_at': now,
+        'last_seen': now,
+        'bonus_locked': 0.0,
+        'playthrough_required': 0.0,
+        'bonus_wagered': 0.0,
+    }
+
+
+def _populated_db(directory: str, users: int) -> Database:
+    database = Database(os.path.join(directory, 'bench.json'), backend='json')
+    database.users = {user_id: UserRecord.from_dict(user_id, _sample_user(user_id)) for user_id in range(users)}
+    return database
+
+
+async def _max_loop_stall(work) -> float:
+    """Run work() on the loop while a probe measures the longest gap between its ticks"""
+    longest = 0.0
+    running = True
+
+    async def probe():
+        nonlocal longest
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            longest = max(longest, now - last)
+            last = now
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0)
+    await work()
+    running = False
+    await probe_task
+    return longest
+
+
+def bench_persistence(args):
+    """Event-loop stall of the old full pretty-printed rewrite versus dirty, off-loop snapshots"""
+    print(f"{'users':>10} {'full rewrite':>14} {'cold snapshot':>14} {'1% dirty':>10}")
+
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as directory:
+            database = _populated_db(directory, users)
+
+            legacy_users = {user_id: _sample_user(user_id) for user_id in range(users)}
+
+            async def full_rewrite():
+                data = {
+                    'users': {str(k): v for k, v in legacy_users.items()},
+                    'jackpot_pool': database.jackpot_pool,
+                    'global_stats': database.global_stats,
+                    'version': '2.1'
+                }
+                with open(database.filename, 'w') as f:
+                    json.dump(data, f, indent=2, default=str)
+
+            before = asyncio.run(_max_loop_stall(full_rewrite))
+            del legacy_users
+
+            database.storage._dirty = set(database.users)
+            cold = asyncio.run(_max_loop_stall(database.save_data_async))
+
+            for user_id in range(0, users, 100):
+                database.users[user_id]['balance'] += 1
+                database.storage._dirty.add(user_id)
+            warm = asyncio.run(_max_loop_stall(database.save_data_async))
+
+        print(f"{users:>10} {before * 1000:>12.1f}ms {cold * 1000:>12.1f}ms {warm * 1000:>8.1f}ms")
+
+
+def _traced_bytes(build) -> int:
+    tracemalloc.start()
+    try:
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        del kept
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(args):
+    """Resident bytes per user for the old dict layout versus UserRecord"""
+    users = args.users
+    samples = [_sample_user(user_id) for user_id in range(users)]
+
+    dict_bytes = _traced_bytes(lambda: {
+        user_id: {**sample, 'created_at': datetime.now().isoformat(), 'last_seen': datetime.now().isoformat()}
+        for user_id, sample in enumerate(samples)
+    })
+    record_bytes = _traced_bytes(lambda: {
+        user_id: UserRecord.from_dict(user_id, sample) for user_id, sample in enumerate(samples)
+    })
+
+    print(f"{users} users")
+    print(f"  dict layout: {dict_bytes / users:>7.0f} bytes/user")
+    print(f"  UserRecord:  {record_bytes / users:>7.0f} bytes/user ({record_bytes / dict_bytes:.0%})")
+
+
+def bench_stress(args):
+    """Thousands of concurrent bets per user through the wallet; balances must reconcile exactly"""
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'stress.json'), backend='json')
+        wallet.db = database
+        expected = {user_id: database.get_user(user_id)['balance'] for user_id in range(args.users)}
+        overdrawn = []
+
+        async def bet(user_id: int):
+            stake = float(random.randint(1, 100))
+            if not await wallet.place_bet(user_id, stake):
+                return
+            if database.users[user_id]['balance'] < 0:
+                overdrawn.append(user_id)
+            expected[user_id] -= stake
+
+            await asyncio.sleep(random.random() / 1000)
+            payout = stake * random.choice((0, 0, 2, 3))
+            if payout:
+                await wallet.credit(user_id, payout)
+                expected[user_id] += payout
+
+        async def run():
+            bets = [bet(user_id) for user_id in range(args.users) for _ in range(args.bets)]
+            random.shuffle(bets)
+            start = time.perf_counter()
+            await asyncio.gather(*bets)
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(run())
+        mismatched = [
+            user_id for user_id, balance in expected.items()
+            if database.users[user_id]['balance'] != balance or database.ledger.balance(user_id) != balance
+        ]
+
+    total = args.users * args.bets
+    print(f"{total} bets across {args.users} users in {elapsed:.2f}s ({total / elapsed:,.0f} bets/s)")
+    print(f"  overdrawn balances seen: {len(overdrawn)}")
+    print(f"  users not reconciling:   {len(mismatched)}")
+    if overdrawn or mismatched:
+        raise SystemExit(1)
+
+
+def bench_ledger(args):
+    """Append rate with group-committed fsync, duplicate rejection and balance replay"""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'bench.ledger')
+        ledger = Ledger(filename)
+
+        async def run():
+            syncer = asyncio.create_task(ledger.run())
+            await asyncio.sleep(0)
+            start = time.perf_counter()
+            for i in range(args.entries):
+                user_id = i % 1000
+                ledger.transfer(f"update:{i}", user_id, HOUSE, 1.0, 'stake')
+                if i % 1000 == 999:
+                    await asyncio.sleep(0)  # Let the syncer run, as handlers would
+            elapsed = time.perf_counter() - start
+            syncer.cancel()
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        ledger.close()  # Also writes the checkpoint
+        duplicates = sum(
+            not ledger.transfer(f"update:{i}", i % 1000, HOUSE, 1.0)
+            for i in range(args.entries - 1000, args.entries)
+        )
+
+        start = time.perf_counter()
+        resumed = Ledger(filename)
+        resumed.load()
+        resume = time.perf_counter() - start
+
+        os.remove(resumed.checkpoint_filename)
+        start = time.perf_counter()
+        replayed = Ledger(filename)
+        replayed.load()
+        replay = time.perf_counter() - start
+
+    print(f"{args.entries} entries in {elapsed:.2f}s ({args.entries / elapsed:,.0f} entries/s)")
+    print(f"  duplicates rejected: {duplicates}/1000")
+    print(f"  full replay:         {replay:.2f}s, house balance {replayed.balance(HOUSE):,.0f}")
+    print(f"  from checkpoint:     {resume:.2f}s, house balance {resumed.balance(HOUSE):,.0f}")
+    if duplicates != 1000 or {replayed.balance(HOUSE), resumed.balance(HOUSE)} != {args.entries}:
+        raise SystemExit(1)
+
+
+def bench_ratelimit(args):
+    """Per-update cost of the token bucket and cooldown check, and how many idle users get evicted"""
+    limiter = RateLimiter()
+    user_ids = [random.randrange(args.users) for _ in range(args.updates)]
+    games = [random.choice((None, None, 'dice', 'coinflip')) for _ in range(args.updates)]
+
+    now = 0.0
+    allowed = 0
+    start = time.perf_counter()
+    for user_id, game in zip(user_ids, games):
+        now += 0.001
+        allowed += limiter.check(user_id, game, now) == ALLOWED
+    elapsed = time.perf_counter() - start
+
+    flooder = RateLimiter()
+    start = time.perf_counter()
+    for _ in range(args.updates):
+        flooder.check(1, None, 1.0)
+    flood_elapsed = time.perf_counter() - start
+
+    print(f"{args.updates} updates from {args.users} users: {elapsed / args.updates * 1e9:,.0f} ns/update")
+    print(f"  allowed: {allowed}, rejected: {limiter.rejected}")
+    print(f"  users tracked at the end: {len(limiter)} (idle users evicted)")
+    print(f"  single flooding user: {flood_elapsed / args.updates * 1e9:,.0f} ns/rejected update")
+
+
+def bench_fairness(args):
+    """Per-bet cost of provably-fair outcomes against the random module and one digest per draw"""
+    user_ids = [random.randrange(args.users) for _ in range(args.bets)]
+
+    start = time.perf_counter()
+    for _ in range(args.bets):
+        CrashGame.generate_multiplier()
+    baseline = time.perf_counter() - start
+
+    class _DigestPerDraw:
+        """What an unbatched engine would do: a fresh HMAC for every draw"""
+        nonce = 0
+
+        def random(self):
+            self.nonce += 1
+            return digest_draws('00' * 32, 'client', self.nonce)[0]
+
+        def uniform(self, a, b):
+            return a + (b - a) * self.random()
+
+    unbatched_rng = _DigestPerDraw()
+    start = time.perf_counter()
+    for _ in range(args.bets):
+        CrashGame.generate_multiplier(unbatched_rng)
+    unbatched = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = FairnessEngine(os.path.join(directory, 'bench.seeds'))
+        for user_id in range(args.users):
+            # Seed creation and the first nonce reservation are one-offs per user, not per bet
+            engine.rng(user_id).random()
+        outcomes = []
+        start = time.perf_counter()
+        for user_id in user_ids:
+            rng = engine.rng(user_id)
+            outcomes.append((user_id, rng.nonce, CrashGame.generate_multiplier(rng)))
+        fair = time.perf_counter() - start
+
+        commitments = {user_id: engine.commitment(user_id) for user_id in range(args.users)}
+        revealed = {user_id: engine.rotate(user_id) for user_id in range(args.users)}
+        mismatches = sum(
+            replay(revealed[u]['server_seed'], revealed[u]['client_seed'], nonce, CrashGame.generate_multiplier) != m
+            for u, nonce, m in outcomes
+        )
+        hashes_match = all(revealed[u]['server_seed_hash'] == commitments[u]['server_seed_hash'] for u in revealed)
+        engine.close()
+
+    for name, elapsed in (('random module', baseline), ('HMAC per draw', unbatched), ('batched HMAC', fair)):
+        print(f"{name:>14}: {elapsed / args.bets * 1e9:,.0f} ns/bet")
+    print(f"{args.bets} crash rounds across {args.users} users; replay mismatches: {mismatches}, "
+          f"revealed seeds match commitments: {hashes_match}")
+    if mismatches or not hashes_match:
+        raise SystemExit(1)
+
+
+def _basic_strategy_hits(total: int, soft: bool, dealer_up: str) -> bool:
+    """Hit/stand basic strategy (the bot offers no doubles or splits)"""
+    up = BlackjackGame.CARD_VALUES[dealer_up]
+    if soft:
+        return total <= 17 or (total == 18 and up >= 9)
+    if total <= 11:
+        return True
+    if total == 12:
+        return not 4 <= up <= 6
+    if total <= 16:
+        return up >= 7
+    return False
+
+
+def _play_shoe_hand(shoe: BlackjackShoe) -> float:
+    """One round dealt from the shoe with incremental hands; returns the player's net per unit"""
+    if shoe.needs_shuffle():
+        shoe.shuffle()
+    player = BlackjackHand((shoe.draw(), shoe.draw()))
+    dealer = BlackjackHand((shoe.draw(), shoe.draw()))
+    if player.is_blackjack:
+        return 0.0 if dealer.is_blackjack else 1.5
+    if dealer.is_blackjack:
+        return -1.0
+    while _basic_strategy_hits(player.total, player.is_soft, dealer.cards[0]):
+        if player.add(shoe.draw()) > 21:
+            return -1.0
+    while dealer.total < 17:
+        dealer.add(shoe.draw())
+    if dealer.total > 21 or player.total > dealer.total:
+        return 1.0
+    return 0.0 if player.total == dealer.total else -1.0
+
+
+def _play_resum_hand() -> float:
+    """The same round the old way: infinite deck, whole hand re-summed after every card"""
+    value = BlackjackGame.calculate_hand_value
+    player = [BlackjackGame.deal_card(), BlackjackGame.deal_card()]
+    dealer = [BlackjackGame.deal_card(), BlackjackGame.deal_card()]
+    if BlackjackGame.is_blackjack(player):
+        return 0.0 if BlackjackGame.is_blackjack(dealer) else 1.5
+    if BlackjackGame.is_blackjack(dealer):
+        return -1.0
+    while True:
+        total = value(player)
+        hard = sum(BlackjackGame.CARD_VALUES[card] for card in player) - 10 * player.count('A')
+        soft = 'A' in player and total == hard + 10
+        if not _basic_strategy_hits(total, soft, dealer[0]):
+            break
+        player.append(BlackjackGame.deal_card())
+        if value(player) > 21:
+            return -1.0
+    while value(dealer) < 17:
+        dealer.append(BlackjackGame.deal_card())
+    player_value, dealer_value = value(player), value(dealer)
+    if dealer_value > 21 or player_value > dealer_value:
+        return 1.0
+    return 0.0 if player_value == dealer_value else -1.0
+
+
+def bench_blackjack(args):
+    """Basic-strategy hands from a multi-deck shoe with incremental totals, against the old dealing"""
+    shoe = BlackjackShoe(args.decks)
+    start = time.perf_counter()
+    shoe_net = sum(_play_shoe_hand(shoe) for _ in range(args.hands))
+    shoe_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resum_net = sum(_play_resum_hand() for _ in range(args.hands))
+    resum_elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = FairnessEngine(os.path.join(directory, 'bench.seeds'))
+        fair_shoe = BlackjackShoe(args.decks, rng=engine.rng(0))
+        revealed = engine.rotate(0)
+        engine.close()
+    replayed = replay(revealed['server_seed'], revealed['client_seed'], fair_shoe.shuffle_nonce,
+                      lambda rng: BlackjackShoe(args.decks, rng=rng).cards)
+
+    print(f"{args.hands} hands, {args.decks}-deck shoe: {args.hands / shoe_elapsed:,.0f} hands/s, "
+          f"RTP {100 + shoe_net / args.hands * 100:.2f}%")
+    print(f"infinite deck, re-summed: {args.hands / resum_elapsed:,.0f} hands/s, "
+          f"RTP {100 + resum_net / args.hands * 100:.2f}%")
+    print(f"provably-fair shoe replays identically: {replayed == fair_shoe.cards}")
+
+
+def _chained_roulette_payout(bet_type, bet_number, result, amount):
+    """RouletteGame.calculate_payout as it was before the payout table, for comparison"""
+    if bet_type == "number" and bet_number == result:
+        return amount * 35
+    elif bet_type == "red" and result in RouletteGame.RED_NUMBERS:
+        return amount
+    elif bet_type == "black" and result in RouletteGame.BLACK_NUMBERS:
+        return amount
+    elif bet_type == "odd" and result % 2 == 1 and result != 0:
+        return amount
+    elif bet_type == "even" and result % 2 == 0 and result != 0:
+        return amount
+    elif bet_type == "dozen":
+        if bet_number == 1 and 1 <= result <= 12:
+            return amount * 2
+        elif bet_number == 2 and 13 <= result <= 24:
+            return amount * 2
+        elif bet_number == 3 and 25 <= result <= 36:
+            return amount * 2
+    return 0.0
+
+
+def bench_roulette(args):
+    """Settling full betting slips from the payout table against one if/elif evaluation per bet"""
+    kinds = [('number', n) for n in range(37)] + [('dozen', d) for d in (1, 2, 3)]
+    kinds += [('red', None), ('black', None), ('odd', None), ('even', None)]
+    slips = []
+    for _ in range(args.players):
+        slip = RouletteSlip()
+        for bet_type, selection in random.sample(kinds, args.bets):
+            slip.add(bet_type, selection, random.randint(1, 100))
+        slips.append(slip)
+    bets = [[(RouletteGame.BETS[i][0], amount) for i, amount in slip.bets] for slip in slips]
+    results = [RouletteGame.spin() for _ in range(args.spins)]
+
+    start = time.perf_counter()
+    table_total = sum(slip.returned(result) for result in results for slip in slips)
+    table_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chain_total = 0.0
+    for result in results:
+        for player_bets in bets:
+            for (bet_type, selection), amount in player_bets:
+                won = _chained_roulette_payout(bet_type, selection, result, amount)
+                if won:
+                    chain_total += amount + won
+    chain_elapsed = time.perf_counter() - start
+
+    settled = args.spins * args.players * args.bets
+    print(f"{args.spins} spins x {args.players} slips x {args.bets} bets")
+    print(f"  payout table: {table_elapsed / settled * 1e9:,.0f} ns/bet")
+    print(f"  if/elif chain: {chain_elapsed / settled * 1e9:,.0f} ns/bet")
+    print(f"  totals agree: {abs(table_total - chain_total) < 1e-6}")
+
+
+class _StubBotAPI:
+    """Just enough of the Bot API over local HTTP, answering every call after `rtt` seconds"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.results: dict = {}  # chat_id -> time the bet's result message arrived
+        self._message_ids = iter(range(1, 1 << 62))
+
+    def _answer(self, method: str, params: dict):
+        chat = {'id': int(params.get('chat_id', 0)), 'type': 'private'}
+        message = {'message_id': next(self._message_ids), 'date': int(time.time()), 'chat': chat}
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+        if method == 'sendDice':
+            return dict(message, dice={'emoji': '🎲', 'value': random.randint(1, 6)})
+        if method == 'sendMessage':
+            self.results[chat['id']] = time.perf_counter()
+            return dict(message, text=params.get('text', ''))
+        return True
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readuntil(b'\r\n\r\n')
+                head = request.decode('latin-1').split('\r\n')
+                headers = dict(line.lower().split(': ', 1) for line in head[1:] if ': ' in line)
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                params = dict(parse_qsl(body.decode()))
+                await asyncio.sleep(self.rtt)
+                payload = json.dumps({'ok': True, 'result': self._answer(head[0].split()[1].rsplit('/', 1)[1], params)})
+                writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(payload.encode())}\r\n\r\n".encode() + payload.encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+def _bet_update(bot, update_id: int, user_id: int, amount: float) -> Update:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"player{user_id}"}
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': str(amount),
+        'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+    }}, bot)
+
+
+def bench_latency(args):
+    """Time from a dice bet to its result message, animated versus turbo, against a stub Bot API"""
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'latency.json'), backend='json')
+        text_handler.db = wallet.db = database
+        stub = _StubBotAPI(args.rtt)
+
+        async def run(turbo: bool, first_update: int):
+            bot = ExtBot('0:stub', base_url=f"http://127.0.0.1:{port}/bot", rate_limiter=SendQueue())
+            await bot.initialize()
+            stub.results.clear()
+            started = {}
+
+            async def bet(user_id: int):
+                # Bets arrive spread out, so this times one bet rather than a queue of them
+                await asyncio.sleep(user_id * args.interval)
+                player = database.get_user(user_id)
+                player['turbo'] = turbo
+                # Veterans with every achievement, so no unlock rewards ride along with the timing
+                player['achievements'] = list(ACHIEVEMENTS)
+                context = SimpleNamespace(bot=bot, chat_data={},
+                                          user_data={'game_state': {'type': 'dice', 'number': 3}})
+                started[user_id] = time.perf_counter()
+                await text_handler.handle_text_bet(_bet_update(bot, first_update + user_id, user_id, 1.0), context)
+
+            settler = asyncio.create_task(text_handler.settlements.run())
+            await asyncio.gather(*(bet(user_id) for user_id in range(args.bets)))
+            while len(stub.results) < args.bets:
+                await asyncio.sleep(0.01)
+            settler.cancel()
+            await bot.shutdown()
+            return [stub.results[user_id] - started[user_id] for user_id in range(args.bets)]
+
+        async def compare():
+            nonlocal port
+            port = await stub.start()
+            try:
+                return await run(False, 0), await run(True, args.bets)
+            finally:
+                await stub.stop()
+
+        port = 0
+        animated, turbo = asyncio.run(compare())
+        database.fairness.close()
+
+    print(f"{args.bets} dice bets, {args.rtt * 1000:.0f}ms per Bot API call")
+    for label, latencies in (('animated', animated), ('turbo', turbo)):
+        latencies.sort()
+        print(f"  {label:<9} median {statistics.median(latencies) * 1000:>7.0f}ms   "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:>7.0f}ms")
+
+
+def bench_settlement(args):
+    """Bets/s through settlement.settle at several batch sizes; balances and stats must reconcile"""
+    print(f"{'batch':>7} {'bets/s':>12} {'per bet':>10}")
+    for batch in args.batch:
+        with tempfile.TemporaryDirectory() as directory:
+            database = Database(os.path.join(directory, 'settle.json'), backend='json')
+            settlement.db = wallet.db = database
+            rng = random.Random(batch)
+            for user_id in range(args.users):
+                # Veterans with every achievement, so unlock rewards don't skew the comparison
+                database.get_user(user_id)['achievements'] = list(ACHIEVEMENTS)
+            records = [
+                settlement.Settlement(i % args.users, 'dice', 10.0, rng.choice((0.0, 0.0, 10.0, 20.0, 60.0)), f"bench:{i}")
+                for i in range(args.bets)
+            ]
+
+            async def run():
+                start = time.perf_counter()
+                for i in range(0, len(records), batch):
+                    await settlement.settle(records[i:i + batch])
+                return time.perf_counter() - start
+
+            elapsed = asyncio.run(run())
+            paid = sum(record.payout for record in records)
+            balances = sum(database.users[user_id]['balance'] for user_id in range(args.users))
+            wagered = sum(database.users[user_id]['total_wagered'] for user_id in range(args.users))
+            database.fairness.close()
+
+        print(f"{batch:>7} {args.bets / elapsed:>12,.0f} {elapsed / args.bets * 1e6:>8.1f}us")
+        # Stakes aren't taken here, so every balance is the starting one plus what it was paid
+        if abs(balances - (args.users * STARTING_BALANCE + paid)) > 1e-6 or wagered != 10.0 * args.bets:
+            raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Antaria Casino benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    persistence = commands.add_parser('persistence', help=bench_persistence.__doc__)
+    persistence.add_argument('--users', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    persistence.set_defaults(func=bench_persistence)
+
+    memory = commands.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('--users', type=int, default=100_000)
+    memory.set_defaults(func=bench_memory)
+
+    stress = commands.add_parser('stress', help=bench_stress.__doc__)
+    stress.add_argument('--users', type=int, default=20)
+    stress.add_argument('--bets', type=int, default=5000)
+    stress.set_defaults(func=bench_stress)
+
+    ledger = commands.add_parser('ledger', help=bench_ledger.__doc__)
+    ledger.add_argument('--entries', type=int, default=200_000)
+    ledger.set_defaults(func=bench_ledger)
+
+    ratelimit = commands.add_parser('ratelimit', help=bench_ratelimit.__doc__)
+    ratelimit.add_argument('--users', type=int, default=100_000)
+    ratelimit.add_argument('--updates', type=int, default=1_000_000)
+    ratelimit.set_defaults(func=bench_ratelimit)
+
+    fairness = commands.add_parser('fairness', help=bench_fairness.__doc__)
+    fairness.add_argument('--users', type=int, default=100)
+    fairness.add_argument('--bets', type=int, default=200_000)
+    fairness.set_defaults(func=bench_fairness)
+
+    blackjack = commands.add_parser('blackjack', help=bench_blackjack.__doc__)
+    blackjack.add_argument('--hands', type=int, default=2_000_000)
+    blackjack.add_argument('--decks', type=int, default=6)
+    blackjack.set_defaults(func=bench_blackjack)
+
+    roulette = commands.add_parser('roulette', help=bench_roulette.__doc__)
+    roulette.add_argument('--spins', type=int, default=10_000)
+    roulette.add_argument('--players', type=int, default=20)
+    roulette.add_argument('--bets', type=int, default=8)
+    roulette.set_defaults(func=bench_roulette)
+
+    latency = commands.add_parser('latency', help=bench_latency.__doc__)
+    latency.add_argument('--bets', type=int, default=50)
+    latency.add_argument('--rtt', type=float, default=0.05, help="seconds the stub takes per Bot API call")
+    latency.add_argument('--interval', type=float, default=0.2, help="seconds between bets")
+    latency.set_defaults(func=bench_latency)
+
+    settle = commands.add_parser('settlement', help=bench_settlement.__doc__)
+    settle.add_argument('--users', type=int, default=1000)
+    settle.add_argument('--bets', type=int, default=100_000)
+    settle.add_argument('--batch', type=int, nargs='+', default=[1, 20, 200])
+    settle.set_defaults(func=bench_settlement)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
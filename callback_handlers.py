@@ -1,22 +1,49 @@
 import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ChatType
 from telegram.ext import ContextTypes
 
 from database import db
 from games import (
-    RouletteGame, BlackjackGame, BasketballGame, SoccerGame,
+    RouletteGame, BlackjackHand, BlackjackShoe, BasketballGame, SoccerGame,
     BowlingGame, CrashGame, DiceGame, CoinFlipGame
 )
-from utils import check_achievements, get_xp_for_bet, format_number
+from utils import format_number
 from config import JACKPOT_CONTRIBUTION
+from escrow import pending_bets
+from settlement import Settlement, settle
+from wallet import place_bet, already_settled
+from tables import CRASH, TableBet, tables
+
+
+def _fairness_line(nonces) -> str:
+    """The draws a round used, checkable with /fair once the server seed is revealed"""
+    return f"\n🔐 Nonce {', '.join(str(n) for n in nonces)} · /fair to verify"
+
+
+def _achievement_lines(record: Settlement) -> str:
+    return "".join(f"\n\n🏆 Achievement unlocked!\n+${reward}" for _, reward in record.unlocked)
+
+
+def _shoe_line(shoe: BlackjackShoe, first_card: int) -> str:
+    """Where a blackjack round's cards sit in a shoe shuffled from the player's seeds"""
+    return (
+        f"\n🔐 Shoe shuffled at nonce {shoe.shuffle_nonce}, "
+        f"cards {first_card + 1}-{shoe.position} · /fair to verify"
+    )
 
 
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
+
+    # A redelivered callback must not move money twice
+    key = f"callback:{query.id}"
+    if already_settled(key):
+        return
     
     user_id = query.from_user.id
-    user_data = db.get_user(user_id)
+    user_data = db.get_user(user_id, query.from_user.username)
     data = query.data
     
     if 'game_state' not in context.user_data:
@@ -54,6 +81,27 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Now enter your bet amount (e.g., 25)"
         )
     
+    elif data == "dice_view_challenges":
+        username = query.from_user.username or ''
+        incoming = [c for _, c in db.dice_challenges.for_target(username) if c['status'] == 'pending'] if username else []
+        outgoing = [c for _, c in db.dice_challenges.for_challenger(user_id) if c['status'] == 'pending']
+
+        if not incoming and not outgoing:
+            await query.edit_message_text(
+                "📋 No open challenges.\n\n"
+                "Start one with /dice_challenge @username [amount] [number]"
+            )
+            return
+
+        lines = ["📋 <b>OPEN CHALLENGES</b>"]
+        if incoming:
+            lines.append("\n⚔️ Challenging you:")
+            lines += [f"• @{c['challenger_username']} - ${c['amount']:.2f}" for c in incoming]
+        if outgoing:
+            lines.append("\n⏳ Waiting on:")
+            lines += [f"• @{c['target_username']} - ${c['amount']:.2f}" for c in outgoing]
+        await query.edit_message_text("\n".join(lines), parse_mode='HTML')
+
     elif data.startswith("dice_"):
         prediction = data.split("_")[1]
         context.user_data['game_state'] = {'type': 'dice', 'prediction': prediction}
@@ -70,113 +118,115 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Now enter your bet amount (e.g., 20)"
         )
     
-    elif data.startswith("crash_"):
-        amount = int(data.split("_")[1])
+    elif data.startswith("crash_cashout_"):
+        parts = data.split("_")
+        amount = int(parts[2])
+        cashout_multiplier = float(parts[3])
+        if not CrashGame.valid_cashout(cashout_multiplier):
+            await query.edit_message_text("❌ Invalid cashout multiplier.")
+            return
         
-        if user_data['balance'] < amount:
+        if query.message is not None and query.message.chat.type != ChatType.PRIVATE:
+            # In groups everyone rides the table's shared round instead of a private one
+            error = await tables.bet(context.bot, query.message.chat_id, CRASH, TableBet(
+                user_id, query.from_user.first_name, key, amount, cashout=cashout_multiplier
+            ))
+            await query.edit_message_text(
+                error or f"🚀 You're in this crash round: ${amount} @ {cashout_multiplier}x"
+            )
+            return
+        
+        if not await place_bet(user_id, amount, key):
             await query.edit_message_text(
                 f"❌ Insufficient balance.\n"
                 f"💰 You have: {format_number(user_data['balance'])}"
             )
             return
         
-        keyboard = [
-            [InlineKeyboardButton("1.5x", callback_data=f"crash_cashout_{amount}_1.5"),
-             InlineKeyboardButton("2x", callback_data=f"crash_cashout_{amount}_2"),
-             InlineKeyboardButton("5x", callback_data=f"crash_cashout_{amount}_5")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            f"🚀 Crash - Bet: ${amount}\n\n"
-            f"Select your cashout multiplier:",
-            reply_markup=reply_markup
-        )
-    
-    elif data.startswith("crash_cashout_"):
-        parts = data.split("_")
-        amount = int(parts[2])
-        cashout_multiplier = float(parts[3])
+        # Settled before the animation, so a failed edit or a cancelled task can't strand the stake
+        rng = db.fairness.rng(user_id)
+        first_nonce = rng.nonce
+        actual_multiplier = CrashGame.generate_multiplier(rng)
+        nonces = range(first_nonce, rng.nonce)
+        success, payout_multiplier = CrashGame.did_crash(actual_multiplier, cashout_multiplier)
+        record, = await settle([Settlement(user_id, 'crash', amount, amount * payout_multiplier, key)])
         
         await query.edit_message_text("🚀 Launching...")
         await asyncio.sleep(2)
         
-        actual_multiplier = CrashGame.generate_multiplier()
-        success, payout_multiplier = CrashGame.did_crash(actual_multiplier, cashout_multiplier)
-        
         if success:
-            winnings = amount * (cashout_multiplier - 1)
-            user_data['balance'] += winnings
-            user_data['total_won'] += winnings
-            user_data['win_streak'] += 1
-            if user_data['win_streak'] > user_data['max_win_streak']:
-                user_data['max_win_streak'] = user_data['win_streak']
             msg = (
                 f"🚀 Multiplier reached: {actual_multiplier}x\n"
                 f"💰 Cashed out at: {cashout_multiplier}x\n\n"
-                f"🎉 YOU WIN ${winnings:.2f}!\n"
+                f"🎉 YOU WIN ${record.winnings:.2f}!\n"
                 f"💳 Balance: {format_number(user_data['balance'])}"
+                f"{_fairness_line(nonces)}"
             )
         else:
-            user_data['balance'] -= amount
-            user_data['win_streak'] = 0
             msg = (
                 f"💥 CRASHED at {actual_multiplier}x!\n"
                 f"Target was: {cashout_multiplier}x\n\n"
                 f"😔 You lose ${amount:.2f}\n"
                 f"💳 Balance: {format_number(user_data['balance'])}"
+                f"{_fairness_line(nonces)}"
             )
         
-        user_data['total_wagered'] += amount
-        user_data['games_played'] += 1
-        db.global_stats['total_bets'] += 1
-        db.global_stats['total_wagered'] += amount
+        await query.edit_message_text(msg + _achievement_lines(record))
+    
+    elif data.startswith("crash_"):
+        amount = int(data.split("_")[1])
         
-        db.add_xp(user_id, get_xp_for_bet(amount))
+        if user_data['balance'] < amount:
+            await query.edit_message_text(
+                f"❌ Insufficient balance.\n"
+                f"💰 You have: {format_number(user_data['balance'])}"
+            )
+            return
         
-        unlocked = check_achievements(user_id)
-        if unlocked:
-            for ach_id, reward in unlocked:
-                msg += f"\n\n🏆 Achievement unlocked!\n+${reward}"
+        keyboard = [
+            [InlineKeyboardButton("1.5x", callback_data=f"crash_cashout_{amount}_1.5"),
+             InlineKeyboardButton("2x", callback_data=f"crash_cashout_{amount}_2"),
+             InlineKeyboardButton("5x", callback_data=f"crash_cashout_{amount}_5")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(msg)
+        await query.edit_message_text(
+            f"🚀 Crash - Bet: ${amount}\n\n"
+            f"Select your cashout multiplier:",
+            reply_markup=reply_markup
+        )
     
     elif data.startswith("blackjack_"):
-        await handle_blackjack_callback(query, context, data, user_id, user_data)
+        await handle_blackjack_callback(query, context, data, user_id, user_data, key)
 
 
-async def handle_blackjack_callback(query, context, data, user_id, user_data):
+async def handle_blackjack_callback(query, context, data, user_id, user_data, key):
     if data == "blackjack_hit":
         game_state = context.user_data.get('blackjack_hand', {})
         if not game_state:
             await query.edit_message_text("❌ No active game. Start with /blackjack")
             return
         
-        player_cards = game_state['player_cards']
-        new_card = BlackjackGame.deal_card()
-        player_cards.append(new_card)
-        
-        player_value = BlackjackGame.calculate_hand_value(player_cards)
-        dealer_cards = game_state['dealer_cards']
+        player, dealer = game_state['player'], game_state['dealer']
+        shoe = context.user_data['blackjack_shoe']
+        player_value = player.add(shoe.draw())
         bet_amount = game_state['bet']
         
         if player_value > 21:
-            user_data['balance'] -= bet_amount
-            user_data['total_wagered'] += bet_amount
-            user_data['games_played'] += 1
-            user_data['win_streak'] = 0
-            db.global_stats['total_bets'] += 1
-            db.global_stats['total_wagered'] += bet_amount
-            
+            # Settled under the deal's key, which took the stake; the hand is gone before any await
+            del context.user_data['blackjack_hand']
+            record, = await settle([Settlement(user_id, 'blackjack', bet_amount, 0.0, game_state['key'])])
+            pending_bets.close(game_state['key'])
             msg = (
                 f"🃏 <b>BLACKJACK - BUST</b>\n\n"
-                f"Your cards: {' '.join(player_cards)} = {player_value}\n"
-                f"Dealer: {' '.join(dealer_cards)}\n\n"
+                f"Your cards: {' '.join(player.cards)} = {player_value}\n"
+                f"Dealer: {' '.join(dealer.cards)}\n\n"
                 f"💥 BUST! You lose ${bet_amount:.2f}\n"
                 f"💳 Balance: {format_number(user_data['balance'])}"
+                f"{_shoe_line(shoe, game_state['first_card'])}"
+                f"{_achievement_lines(record)}"
             )
             await query.edit_message_text(msg, parse_mode='HTML')
-            del context.user_data['blackjack_hand']
         else:
             keyboard = [
                 [InlineKeyboardButton("🎴 Hit", callback_data="blackjack_hit"),
@@ -186,13 +236,11 @@ async def handle_blackjack_callback(query, context, data, user_id, user_data):
             
             msg = (
                 f"🃏 <b>BLACKJACK</b>\n\n"
-                f"Your cards: {' '.join(player_cards)} = {player_value}\n"
-                f"Dealer: {dealer_cards[0]} ?\n\n"
+                f"Your cards: {' '.join(player.cards)} = {player_value}\n"
+                f"Dealer: {dealer.cards[0]} ?\n\n"
                 f"What's your move?"
             )
             await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode='HTML')
-            game_state['player_cards'] = player_cards
-            context.user_data['blackjack_hand'] = game_state
     
     elif data == "blackjack_stand":
         game_state = context.user_data.get('blackjack_hand', {})
@@ -200,116 +248,105 @@ async def handle_blackjack_callback(query, context, data, user_id, user_data):
             await query.edit_message_text("❌ No active game. Start with /blackjack")
             return
         
-        player_cards = game_state['player_cards']
-        dealer_cards = game_state['dealer_cards']
+        player, dealer = game_state['player'], game_state['dealer']
+        shoe = context.user_data['blackjack_shoe']
         bet_amount = game_state['bet']
         
-        while BlackjackGame.calculate_hand_value(dealer_cards) < 17:
-            dealer_cards.append(BlackjackGame.deal_card())
+        while dealer.total < 17:
+            dealer.add(shoe.draw())
         
-        player_value = BlackjackGame.calculate_hand_value(player_cards)
-        dealer_value = BlackjackGame.calculate_hand_value(dealer_cards)
+        player_value = player.total
+        dealer_value = dealer.total
         
         if dealer_value > 21:
-            winnings = bet_amount
-            user_data['balance'] += winnings
-            user_data['total_won'] += winnings
-            user_data['win_streak'] += 1
-            if user_data['win_streak'] > user_data['max_win_streak']:
-                user_data['max_win_streak'] = user_data['win_streak']
-            db.global_stats['total_won'] += winnings
-            result = f"🎉 Dealer BUST! You win ${winnings:.2f}!"
+            returned = bet_amount * 2
+            result = f"🎉 Dealer BUST! You win ${bet_amount:.2f}!"
         elif player_value > dealer_value:
-            winnings = bet_amount
-            user_data['balance'] += winnings
-            user_data['total_won'] += winnings
-            user_data['win_streak'] += 1
-            if user_data['win_streak'] > user_data['max_win_streak']:
-                user_data['max_win_streak'] = user_data['win_streak']
-            db.global_stats['total_won'] += winnings
-            result = f"🎉 You WIN! +${winnings:.2f}"
+            returned = bet_amount * 2
+            result = f"🎉 You WIN! +${bet_amount:.2f}"
         elif player_value == dealer_value:
+            returned = bet_amount
             result = "🤝 PUSH! Bet returned."
         else:
-            user_data['balance'] -= bet_amount
-            user_data['win_streak'] = 0
+            returned = 0.0
             result = f"😔 Dealer wins. -${bet_amount:.2f}"
-        
-        user_data['total_wagered'] += bet_amount
-        user_data['games_played'] += 1
-        db.global_stats['total_bets'] += 1
-        db.global_stats['total_wagered'] += bet_amount
-        
-        db.add_xp(user_id, get_xp_for_bet(bet_amount))
+        del context.user_data['blackjack_hand']
+        record, = await settle([Settlement(user_id, 'blackjack', bet_amount, returned, game_state['key'])])
+        pending_bets.close(game_state['key'])
         
         msg = (
             f"🃏 <b>BLACKJACK - FINAL</b>\n\n"
-            f"Your cards: {' '.join(player_cards)} = {player_value}\n"
-            f"Dealer: {' '.join(dealer_cards)} = {dealer_value}\n\n"
+            f"Your cards: {' '.join(player.cards)} = {player_value}\n"
+            f"Dealer: {' '.join(dealer.cards)} = {dealer_value}\n\n"
             f"{result}\n"
             f"💳 Balance: {format_number(user_data['balance'])}"
+            f"{_shoe_line(shoe, game_state['first_card'])}"
+            f"{_achievement_lines(record)}"
         )
-        
-        unlocked = check_achievements(user_id)
-        if unlocked:
-            for ach_id, reward in unlocked:
-                msg += f"\n\n🏆 Achievement unlocked!\n+${reward}"
-        
         await query.edit_message_text(msg, parse_mode='HTML')
-        del context.user_data['blackjack_hand']
     
     else:
         amount = int(data.split("_")[1])
         
-        if user_data['balance'] < amount:
+        if context.user_data.get('blackjack_hand'):
+            await query.edit_message_text("❌ Finish your current hand first: hit or stand.")
+            return
+        
+        if not await place_bet(user_id, amount, key):
             await query.edit_message_text(
                 f"❌ Insufficient balance.\n"
                 f"💰 You have: {format_number(user_data['balance'])}"
             )
             return
         
-        player_cards = [BlackjackGame.deal_card(), BlackjackGame.deal_card()]
-        dealer_cards = [BlackjackGame.deal_card(), BlackjackGame.deal_card()]
+        # Shuffled from the player's provably-fair stream, and again whenever their seed changes
+        rng = db.fairness.rng(user_id)
+        shoe = context.user_data.get('blackjack_shoe')
+        if shoe is None:
+            shoe = context.user_data['blackjack_shoe'] = BlackjackShoe(rng=rng)
+        elif shoe.needs_shuffle() or shoe.seed_hash != rng.server_seed_hash:
+            shoe.shuffle(rng)
+        first_card = shoe.position
+        player = BlackjackHand([shoe.draw(), shoe.draw()])
+        dealer = BlackjackHand([shoe.draw(), shoe.draw()])
         
-        player_value = BlackjackGame.calculate_hand_value(player_cards)
+        player_value = player.total
         
-        if BlackjackGame.is_blackjack(player_cards):
-            if BlackjackGame.is_blackjack(dealer_cards):
+        if player.is_blackjack:
+            # A natural pays 3:2 unless the dealer has one too
+            returned = amount if dealer.is_blackjack else amount * 2.5
+            record, = await settle([Settlement(user_id, 'blackjack', amount, returned, key)])
+            if dealer.is_blackjack:
                 msg = (
                     f"🃏 <b>BLACKJACK</b>\n\n"
-                    f"Your cards: {' '.join(player_cards)} = BLACKJACK!\n"
-                    f"Dealer: {' '.join(dealer_cards)} = BLACKJACK!\n\n"
+                    f"Your cards: {' '.join(player.cards)} = BLACKJACK!\n"
+                    f"Dealer: {' '.join(dealer.cards)} = BLACKJACK!\n\n"
                     f"🤝 PUSH! Both have blackjack.\n"
                     f"💳 Balance: {format_number(user_data['balance'])}"
+                    f"{_shoe_line(shoe, first_card)}"
                 )
             else:
-                winnings = amount * 1.5
-                user_data['balance'] += winnings
-                user_data['total_won'] += winnings
-                user_data['win_streak'] += 1
                 msg = (
                     f"🃏 <b>BLACKJACK</b>\n\n"
-                    f"Your cards: {' '.join(player_cards)} = BLACKJACK!\n"
-                    f"Dealer: {' '.join(dealer_cards)}\n\n"
-                    f"🎰 BLACKJACK! You win ${winnings:.2f}!\n"
+                    f"Your cards: {' '.join(player.cards)} = BLACKJACK!\n"
+                    f"Dealer: {' '.join(dealer.cards)}\n\n"
+                    f"🎰 BLACKJACK! You win ${record.winnings:.2f}!\n"
                     f"💳 Balance: {format_number(user_data['balance'])}"
+                    f"{_shoe_line(shoe, first_card)}"
                 )
-            user_data['games_played'] += 1
-            db.add_xp(user_id, get_xp_for_bet(amount))
-            await query.edit_message_text(msg, parse_mode='HTML')
+            await query.edit_message_text(msg + _achievement_lines(record), parse_mode='HTML')
             return
         
-        elif BlackjackGame.is_blackjack(dealer_cards):
-            user_data['balance'] -= amount
-            user_data['total_wagered'] += amount
-            user_data['games_played'] += 1
-            user_data['win_streak'] = 0
+        elif dealer.is_blackjack:
+            record, = await settle([Settlement(user_id, 'blackjack', amount, 0.0, key)])
             msg = (
                 f"🃏 <b>BLACKJACK</b>\n\n"
-                f"Your cards: {' '.join(player_cards)} = {player_value}\n"
-                f"Dealer: {' '.join(dealer_cards)} = BLACKJACK!\n\n"
+                f"Your cards: {' '.join(player.cards)} = {player_value}\n"
+                f"Dealer: {' '.join(dealer.cards)} = BLACKJACK!\n\n"
                 f"😔 Dealer has blackjack. You lose ${amount:.2f}\n"
                 f"💳 Balance: {format_number(user_data['balance'])}"
+                f"{_shoe_line(shoe, first_card)}"
+                f"{_achievement_lines(record)}"
             )
             await query.edit_message_text(msg, parse_mode='HTML')
             return
@@ -323,15 +360,19 @@ async def handle_blackjack_callback(query, context, data, user_id, user_data):
         msg = (
             f"🃏 <b>BLACKJACK</b>\n\n"
             f"💰 Bet: ${amount}\n\n"
-            f"Your cards: {' '.join(player_cards)} = {player_value}\n"
-            f"Dealer: {dealer_cards[0]} ?\n\n"
+            f"Your cards: {' '.join(player.cards)} = {player_value}\n"
+            f"Dealer: {dealer.cards[0]} ?\n\n"
             f"What's your move?"
         )
         
         context.user_data['blackjack_hand'] = {
-            'player_cards': player_cards,
-            'dealer_cards': dealer_cards,
-            'bet': amount
+            'player': player,
+            'dealer': dealer,
+            'bet': amount,
+            'first_card': first_card,
+            'key': key
         }
+        # Hands live in memory only; if a restart cuts this one off, its stake is refunded
+        pending_bets.open(key, user_id, amount, 'blackjack')
         
         await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode='HTML')
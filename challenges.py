@@ -0,0 +1,95 @@
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+Challenge = Dict[str, Any]
+
+
+class ChallengeStore:
+    """
+    PvP dice challenges by id, indexed by challenger, target username and status.
+
+    Challenges stay plain dicts so they serialize as-is. Status changes must go through
+    set_status() so the status index stays correct; Database.commit_challenge() persists them.
+    """
+
+    def __init__(self):
+        self._challenges: Dict[str, Challenge] = {}
+        self._by_challenger: Dict[int, Set[str]] = {}
+        self._by_target: Dict[str, Set[str]] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._challenges)
+
+    def __contains__(self, challenge_id: str) -> bool:
+        return challenge_id in self._challenges
+
+    def __getitem__(self, challenge_id: str) -> Challenge:
+        return self._challenges[challenge_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._challenges)
+
+    def get(self, challenge_id: str, default: Optional[Challenge] = None) -> Optional[Challenge]:
+        return self._challenges.get(challenge_id, default)
+
+    def items(self):
+        return self._challenges.items()
+
+    def values(self):
+        return self._challenges.values()
+
+    def add(self, challenge_id: str, challenge: Challenge):
+        """Insert or replace a challenge"""
+        if challenge_id in self._challenges:
+            self._unindex(challenge_id, self._challenges[challenge_id])
+        self._challenges[challenge_id] = challenge
+        self._by_challenger.setdefault(challenge['challenger_id'], set()).add(challenge_id)
+        self._by_target.setdefault(self._target_key(challenge), set()).add(challenge_id)
+        self._by_status.setdefault(challenge['status'], set()).add(challenge_id)
+
+    def set_status(self, challenge_id: str, status: str):
+        challenge = self._challenges[challenge_id]
+        self._discard(self._by_status, challenge['status'], challenge_id)
+        challenge['status'] = status
+        self._by_status.setdefault(status, set()).add(challenge_id)
+
+    def pop(self, challenge_id: str, default: Optional[Challenge] = None) -> Optional[Challenge]:
+        challenge = self._challenges.pop(challenge_id, None)
+        if challenge is None:
+            return default
+        self._unindex(challenge_id, challenge)
+        return challenge
+
+    def for_challenger(self, user_id: int) -> List[Tuple[str, Challenge]]:
+        return [(cid, self._challenges[cid]) for cid in self._by_challenger.get(user_id, ())]
+
+    def for_target(self, username: str) -> List[Tuple[str, Challenge]]:
+        return [(cid, self._challenges[cid]) for cid in self._by_target.get(username.lower(), ())]
+
+    def with_status(self, status: str) -> List[Tuple[str, Challenge]]:
+        return [(cid, self._challenges[cid]) for cid in self._by_status.get(status, ())]
+
+    def to_dict(self) -> Dict[str, Challenge]:
+        """Copy for serialization off the event loop"""
+        return {cid: dict(challenge) for cid, challenge in self._challenges.items()}
+
+    def load(self, challenges: Dict[str, Challenge]):
+        for challenge_id, challenge in challenges.items():
+            self.add(challenge_id, challenge)
+
+    @staticmethod
+    def _target_key(challenge: Challenge) -> str:
+        return (challenge.get('target_username') or '').lower()
+
+    @staticmethod
+    def _discard(index: Dict[Any, Set[str]], key, challenge_id: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(challenge_id)
+            if not ids:
+                del index[key]
+
+    def _unindex(self, challenge_id: str, challenge: Challenge):
+        self._discard(self._by_challenger, challenge['challenger_id'], challenge_id)
+        self._discard(self._by_target, self._target_key(challenge), challenge_id)
+        self._discard(self._by_status, challenge['status'], challenge_id)
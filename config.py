@@ -13,6 +13,18 @@ CONFIRMATION_DELAY = 5
 RATE_LIMIT_WINDOW = 60
 RATE_LIMIT_MAX = 10
 
+# Outbound Bot API limits: messages per second overall, and per window in each group and
+# each private chat (about one a second, with a short burst allowed)
+SEND_GLOBAL_RATE = 30
+SEND_GROUP_RATE = 20
+SEND_GROUP_WINDOW = 60
+SEND_PRIVATE_RATE = 3
+SEND_PRIVATE_WINDOW = 3
+SEND_MAX_RETRIES = 3
+
+# Updates handled at once across all chats; each chat's own updates still run one at a time
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
 GAME_COOLDOWNS = {
     'roulette': 3,
     'blackjack': 5,
@@ -24,6 +36,13 @@ GAME_COOLDOWNS = {
     'coinflip': 1
 }
 
+# Seconds Telegram's dice animation plays before the result is revealed
+ANIMATION_DELAY = 4
+
+# Unanswered PvP challenges are refunded after this many seconds
+CHALLENGE_EXPIRY = 300
+REFUND_NOTIFY_CONCURRENCY = 10
+
 STARTING_BALANCE = 1000.0
 DAILY_BONUS_MIN = 10.0
 DAILY_BONUS_MAX = 100.0
@@ -31,21 +50,69 @@ BONUS_COOLDOWN = 86400
 STREAK_BONUS_DAYS = 5
 STREAK_BONUS_AMOUNT = 200.0
 
+# Group tables (shared Crash and Roulette rounds): betting window and seats per round
+TABLE_BET_WINDOW = 15
+TABLE_MAX_BETS = 200
+
+# Most rounds one /autobet can play
+AUTOBET_MAX_ROUNDS = 1000
+
+BLACKJACK_DECKS = 6
+# Fraction of the shoe dealt before it is reshuffled
+BLACKJACK_PENETRATION = 0.75
+
+# Crash points follow P(crash point >= x) = (1 - CRASH_HOUSE_EDGE) / x, so every cash-out target
+# returns the same RTP; targets above CRASH_MAX_MULTIPLIER are refused
+CRASH_HOUSE_EDGE = 0.03
+CRASH_MAX_MULTIPLIER = 1000.0
+
 JACKPOT_STARTING = 5000.0
 JACKPOT_CONTRIBUTION = 0.02
 
 REFERRAL_BONUS = 50.0
 REFEREE_BONUS = 25.0
+# Commission on referred players' settled wagers, by level: the direct referrer first, then
+# whoever referred them, and so on. Its length is how far up the referral graph commissions reach.
+REFERRAL_COMMISSIONS = (0.005, 0.002, 0.001)
 
+# Each achievement unlocks once `field` reaches `threshold`: a user record field, or 'stake'
+# for a single bet's size. Ones without a field are awarded directly (achievements.unlock).
+# Unlocks are stored as bits in this order, so add new achievements at the end.
 ACHIEVEMENTS = {
-    'first_bet': {'name': '🎲 First Bet', 'description': 'Place your first bet', 'reward': 10},
-    'high_roller': {'name': '💎 High Roller', 'description': 'Bet $1000 in a single game', 'reward': 100},
-    'lucky_7': {'name': '🍀 Lucky Seven', 'description': 'Win 7 games in a row', 'reward': 77},
+    'first_bet': {'name': '🎲 First Bet', 'description': 'Place your first bet', 'reward': 10,
+                  'field': 'games_played', 'threshold': 1},
+    'high_roller': {'name': '💎 High Roller', 'description': 'Bet $1000 in a single game', 'reward': 100,
+                    'field': 'stake', 'threshold': 1000},
+    'lucky_7': {'name': '🍀 Lucky Seven', 'description': 'Win 7 games in a row', 'reward': 77,
+                'field': 'win_streak', 'threshold': 7},
     'jackpot_winner': {'name': '🏆 Jackpot Winner', 'description': 'Win the bowling jackpot', 'reward': 500},
-    'veteran': {'name': '⭐ Veteran', 'description': 'Play 100 games', 'reward': 200},
-    'whale': {'name': '🐋 Whale', 'description': 'Reach $10,000 balance', 'reward': 1000},
-    'streak_master': {'name': '🔥 Streak Master', 'description': '10-day login streak', 'reward': 500}
+    'veteran': {'name': '⭐ Veteran', 'description': 'Play 100 games', 'reward': 200,
+                'field': 'games_played', 'threshold': 100},
+    'whale': {'name': '🐋 Whale', 'description': 'Reach $10,000 balance', 'reward': 1000,
+              'field': 'balance', 'threshold': 10000},
+    'streak_master': {'name': '🔥 Streak Master', 'description': '10-day login streak', 'reward': 500,
+                      'field': 'bonus_streak', 'threshold': 10}
 }
 
 DATA_FILE = 'casino_data.json'
 BACKUP_INTERVAL = 300
+JOURNAL_FSYNC = False
+
+# Ledger entries are fsynced in groups: whichever of these comes first
+LEDGER_FSYNC_INTERVAL = 0.05
+LEDGER_FSYNC_BATCH = 1000
+# How many recent idempotency keys are remembered for duplicate detection
+LEDGER_RECENT_KEYS = 100000
+# Balances and recent keys are checkpointed every this many entries, so startup replays only the tail
+LEDGER_CHECKPOINT_ENTRIES = 100000
+
+# Provably-fair draws: HMAC-SHA256 digests generated per refill (8 outcomes each)
+FAIRNESS_BATCH = 32
+# Nonces recorded on disk per reservation; a restart skips whatever was left of one
+FAIRNESS_RESERVE = 65536
+
+# 'json' keeps every user in memory; 'sqlite' keeps only recently active users cached
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_FLUSH_INTERVAL = 1.0
+SQLITE_CACHE_SIZE = 50000
+SQLITE_CACHE_IDLE = 600
@@ -1,16 +1,25 @@
-import json
 import os
+import time
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from challenges import ChallengeStore
+from config import STORAGE_BACKEND, STARTING_BALANCE
+from fairness import FairnessEngine
+from ledger import Ledger
+from leaderboard import TimedLeaderboards
+from models import UserRecord
+from storage import create_storage
 
 
 class Database:
-    def __init__(self, filename='casino_data.json'):
+    def __init__(self, filename='casino_data.json', backend=STORAGE_BACKEND):
         self.filename = filename
-        self.users: Dict[int, Dict[str, Any]] = {}
+        self.storage = create_storage(backend, filename)
+        self.users: Dict[int, UserRecord] = {}
         self.pending_deposits = {}
         self.active_games = {}
-        self.dice_challenges = {}  # New for PvP
+        self.dice_challenges = ChallengeStore()  # PvP challenges, persisted with everything else
         self.jackpot_pool = 5000.0
         self.global_stats = {
             'total_bets': 0,
@@ -19,107 +28,151 @@ class Database:
             'total_players': 0
         }
         self.leaderboard = []
+        self.boards = TimedLeaderboards()
+        self.ledger = Ledger(os.path.splitext(filename)[0] + '.ledger')
+        self.fairness = FairnessEngine(os.path.splitext(filename)[0] + '.seeds')
         self.load_data()
 
-    def get_user(self, user_id: int) -> Dict[str, Any]:
-        """Get or create user data"""
+    def get_user(self, user_id: int, username: Optional[str] = None) -> UserRecord:
+        """Get or create user data; pass the Telegram username to keep the @name directory current"""
         if user_id not in self.users:
-            self.users[user_id] = {
-                'balance': 1000.0,  # Starting balance
-                'username': '',
-                'total_wagered': 0.0,
-                'total_won': 0.0,
-                'games_played': 0,
-                'last_bonus': None,
-                'bonus_streak': 0,
-                'ltc_address': f"LTC{user_id % 1000000}xyz",
-                'achievements': [],
-                'referrals': [],
-                'referred_by': None,
-                'level': 1,
-                'xp': 0,
-                'win_streak': 0,
-                'max_win_streak': 0,
-                'created_at': datetime.now().isoformat(),
-                'last_seen': datetime.now().isoformat(),
-                # New bonus system fields
-                'bonus_locked': 0.0,
-                'playthrough_required': 0.0,
-                'bonus_wagered': 0.0,
-            }
-            self.global_stats['total_players'] += 1
+            self._load_user(user_id)
 
-        self.users[user_id]['last_seen'] = datetime.now().isoformat()
-        return self.users[user_id]
+        if user_id not in self.users:
+            self.users[user_id] = UserRecord(user_id, time.time(), balance=STARTING_BALANCE)
+            self.storage.attach(self.users[user_id])
+            self.global_stats['total_players'] += 1
+            self.commit(user_id)
+
+        user_data = self.users[user_id]
+        user_data.last_seen = time.time()
+        if username and username != user_data.username:
+            self._claim_username(user_data, username)
+        return user_data
+
+    def _load_user(self, user_id: int) -> Optional[UserRecord]:
+        """Bring a stored user into the cache without touching last_seen"""
+        user_data = self.storage.fetch_user(user_id)
+        if user_data is not None:
+            self.users[user_id] = user_data
+            self.storage.attach(user_data)
+            self._sync_balance(user_data)
+        return user_data
+
+    def _claim_username(self, user_data: UserRecord, username: str):
+        """Point @username at this user; whoever held it before (usernames can be released) loses it"""
+        previous_owner = self.find_user_by_username(username)
+        if previous_owner is not None and previous_owner != user_data.user_id:
+            other = self.users.get(previous_owner) or self._load_user(previous_owner)
+            self.storage.index_username(previous_owner, other.username, '')
+            other.username = ''
+            self.commit(previous_owner)
+
+        self.storage.index_username(user_data.user_id, user_data.username, username)
+        user_data.username = username
+        self.commit(user_data.user_id)
+
+    def find_user_by_username(self, username: str) -> Optional[int]:
+        """Case-insensitive @username lookup, without scanning users"""
+        username = username.lstrip('@')
+        user_id = self.storage.lookup_username(username)
+        if user_id is None:
+            return None
+        # The directory can briefly trail a rename; the record itself is authoritative
+        user_data = self.users.get(user_id) or self.storage.fetch_user(user_id)
+        if user_data is None or (user_data.username or '').lower() != username.lower():
+            return None
+        return user_id
+
+    def _sync_balance(self, user_data: UserRecord):
+        """The ledger is authoritative; the balance on the record is a cache of it"""
+        balance = self.ledger.balance(user_data.user_id)
+        if balance is not None and balance != user_data.balance:
+            user_data.balance = balance
+
+    def all_users(self) -> List[UserRecord]:
+        """Every user, loading the ones not in memory; for offline passes like achievement backfills"""
+        users = []
+        for user_id in self.storage.user_ids(self):
+            user_data = self.load_user(user_id)
+            if user_data is not None:
+                users.append(user_data)
+        return users
+
+    def load_user(self, user_id: int) -> Optional[UserRecord]:
+        """Like find_user, but keeps the record cached for lookups that repeat, e.g. walking referrers"""
+        user_data = self.users.get(user_id)
+        if user_data is None:
+            return self._load_user(user_id)
+        # Used without being seen; the cache must not drop it before the caller commits it
+        self.storage.touch(user_id)
+        return user_data
+
+    def find_user(self, user_id: int) -> Optional[UserRecord]:
+        """Look up a user without creating them or marking them as seen"""
+        return self.users.get(user_id) or self.storage.fetch_user(user_id)
 
     def update_leaderboard(self):
         """Update the leaderboard with top players"""
-        sorted_users = sorted(
-            self.users.items(),
-            key=lambda x: x[1]['balance'],
-            reverse=True
+        self.leaderboard = self.storage.top_users(self, 'balance', 10)
+
+    def top_players(self, metric: str = 'balance', window: str = 'all', limit: int = 10) -> List[Tuple[int, float]]:
+        """Top players by a metric, all-time or over the daily/weekly window"""
+        if window == 'all':
+            return self.storage.top_users(self, metric, limit)
+        return self.boards.top(metric, window, limit, time.time())
+
+    def get_rank(self, user_id: int, metric: str = 'balance', window: str = 'all') -> Optional[int]:
+        """1-based leaderboard position, by balance unless another metric/window is given"""
+        if window == 'all':
+            return self.storage.rank(self, metric, user_id)
+        return self.boards.rank(metric, window, user_id, time.time())
+
+    def record_bet(self, user_id: int, wagered: float, won: float, xp: int):
+        """Feed a settled bet into the daily and weekly leaderboards"""
+        self.boards.record(
+            user_id, time.time(),
+            total_wagered=wagered,
+            total_won=won,
+            xp=xp,
+            max_win_streak=self.users[user_id]['win_streak']
         )
-        self.leaderboard = [(uid, data['balance']) for uid, data in sorted_users[:10]]
+
+    def commit(self, *user_ids: int, fields: Optional[Iterable[str]] = None):
+        """Persist the current state of the given users and the globals; pass the ranked fields
+        that changed, if known, to skip reindexing the rest"""
+        self.storage.commit(self, user_ids, fields)
+
+    def commit_challenge(self, challenge_id: str):
+        """Persist a challenge's current state, or its removal if it is no longer in the store"""
+        self.storage.commit_challenge(self, challenge_id)
 
     def save_data(self):
-        """Save database to JSON file"""
-        data = {
-            'users': {str(k): v for k, v in self.users.items()},
-            'jackpot_pool': self.jackpot_pool,
-            'global_stats': self.global_stats,
-            'version': '2.1'
-        }
+        """Save everything outstanding to storage"""
+        self.ledger.sync()
+        self.storage.save(self)
 
-        try:
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
-        except Exception as e:
-            print(f"Error saving database: {e}")
+    async def save_data_async(self) -> bool:
+        """Like save_data, but does the I/O in a worker thread so handlers keep running"""
+        return await self.storage.save_async(self)
 
     def load_data(self):
-        """Load database from JSON file"""
-        if not os.path.exists(self.filename):
-            print("No existing database found. Creating new one.")
-            return
-
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-
-            self.users = {int(k): v for k, v in data.get('users', {}).items()}
-            self.jackpot_pool = data.get('jackpot_pool', 5000.0)
-            self.global_stats = data.get('global_stats', {
-                'total_bets': 0,
-                'total_wagered': 0.0,
-                'total_won': 0.0,
-                'total_players': len(self.users)
-            })
-
-            # Migrate existing users to new bonus system
-            for user_id, user_data in self.users.items():
-                if 'bonus_locked' not in user_data:
-                    user_data['bonus_locked'] = 0.0
-                if 'playthrough_required' not in user_data:
-                    user_data['playthrough_required'] = 0.0
-                if 'bonus_wagered' not in user_data:
-                    user_data['bonus_wagered'] = 0.0
-
-            print(f"Database loaded: {len(self.users)} users")
-        except Exception as e:
-            print(f"Error loading database: {e}")
+        """Load database from storage, then bring cached balances in line with the ledger"""
+        self.storage.load(self)
+        self.ledger.load()
+        self.fairness.load()
+        for user_data in self.users.values():
+            self._sync_balance(user_data)
 
     def backup_data(self):
         """Create a backup of the database"""
+        self.save_data()
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f"casino_data_backup_{timestamp}.json"
 
         try:
-            with open(self.filename, 'r') as original:
-                data = original.read()
-
-            with open(backup_filename, 'w') as backup:
-                backup.write(data)
-
+            backup_filename = self.storage.backup(f"casino_data_backup_{timestamp}")
+            self.ledger.backup(f"casino_data_backup_{timestamp}")
+            self.fairness.backup(f"casino_data_backup_{timestamp}")
             print(f"Backup created: {backup_filename}")
             return backup_filename
         except Exception as e:
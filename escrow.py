@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+from config import JOURNAL_FSYNC
+from database import db
+from settlement import Settlement, settle
+from wallet import credit
+
+logger = logging.getLogger(__name__)
+
+# The journal is rewritten once it holds this many more lines than there are open bets
+_COMPACT_SLACK = 1000
+
+
+class PendingBets:
+    """
+    Stakes that have been taken but whose settlement is still waiting on something (an
+    animation, the player's next move), journaled so a restart can't strand them.
+
+    open() records a bet right after its stake is taken, and again whenever it learns
+    something settlement needs, such as a drawn outcome; close() drops it once settled. On
+    startup recover() hands every bet still open to the resolver registered for its game,
+    which rebuilds its Settlement, and refunds the stake under f"{key}:refund" when there is
+    no resolver or it can't finish the bet.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._open: Dict[str, dict] = {}
+        self._resolvers: Dict[str, Callable[[dict], Optional[Settlement]]] = {}
+        self._file = None
+        self._lines = 0
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._open
+
+    def register(self, game: str, resolver: Callable[[dict], Optional[Settlement]]):
+        """Let recover() settle open bets on `game`; resolver(bet) returns None to refund instead"""
+        self._resolvers[game] = resolver
+
+    def open(self, key: str, user_id: int, stake: float, game: str, **details):
+        """Journal a staked bet, or replace what was journaled for it"""
+        bet = dict(details, k=key, u=user_id, a=stake, g=game)
+        self._open[key] = bet
+        self._write(bet)
+
+    def close(self, key: str):
+        """Forget a settled or refunded bet"""
+        if self._open.pop(key, None) is None:
+            return
+        if not self._open or self._lines > 2 * len(self._open) + _COMPACT_SLACK:
+            self._rewrite()
+        else:
+            self._write({'k': key, 'closed': True})
+
+    def _write(self, record: dict):
+        try:
+            if self._file is None:
+                self._file = open(self.filename, 'a')
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._file.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(self._file.fileno())
+            self._lines += 1
+        except Exception as e:
+            print(f"Error writing pending bets: {e}")
+
+    def _rewrite(self):
+        """Replace the journal with just the open bets"""
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            tmp = self.filename + '.tmp'
+            with open(tmp, 'w') as f:
+                f.writelines(json.dumps(bet, separators=(',', ':')) + '\n' for bet in self._open.values())
+                if JOURNAL_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, self.filename)
+            self._lines = len(self._open)
+        except Exception as e:
+            print(f"Error compacting pending bets: {e}")
+
+    def _load(self) -> Dict[str, dict]:
+        bets: Dict[str, dict] = {}
+        if not os.path.exists(self.filename):
+            return bets
+        try:
+            with open(self.filename) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # A torn final line from a crash mid-write
+                    if record.get('closed'):
+                        bets.pop(record['k'], None)
+                    else:
+                        bets[record['k']] = record
+        except Exception as e:
+            print(f"Error loading pending bets: {e}")
+        return bets
+
+    async def recover(self):
+        """Settle or refund every bet a restart left open"""
+        self._open = self._load()
+        settled = refunded = 0
+        for bet in list(self._open.values()):
+            key = bet['k']
+            # Settled, but the close never reached the journal
+            if not db.ledger.seen(f"{key}:settled"):
+                resolver = self._resolvers.get(bet['g'])
+                record = resolver(bet) if resolver is not None else None
+                if record is not None:
+                    await settle([record])
+                    if not record.settled:
+                        continue  # Logged by settle(); tried again on the next start
+                    settled += 1
+                else:
+                    await credit(bet['u'], bet['a'], f"{key}:refund", 'refund')
+                    refunded += 1
+            del self._open[key]
+        self._rewrite()
+        if settled or refunded:
+            logger.info(f"Recovered pending bets: {settled} settled, {refunded} refunded")
+
+
+# Global pending-bet journal
+pending_bets = PendingBets(os.path.splitext(db.filename)[0] + '.pending')
@@ -0,0 +1,236 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import shutil
+import struct
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, TypeVar
+
+from config import FAIRNESS_BATCH, FAIRNESS_RESERVE
+
+T = TypeVar('T')
+
+DRAWS_PER_DIGEST = 8
+_unpack_digest = struct.Struct('>8I').unpack
+_SCALE = 2.0 ** -32
+
+
+def _block_draws(keyed, client_seed: str, block: int) -> List[float]:
+    mac = keyed.copy()
+    mac.update(f"{client_seed}:{block}".encode())
+    return [n * _SCALE for n in _unpack_digest(mac.digest())]
+
+
+def digest_draws(server_seed: str, client_seed: str, block: int) -> List[float]:
+    """The eight draws in one HMAC-SHA256(server_seed, "client_seed:block") digest, each in [0, 1)"""
+    return _block_draws(hmac.new(bytes.fromhex(server_seed), digestmod=hashlib.sha256), client_seed, block)
+
+
+def hash_seed(server_seed: str) -> str:
+    return hashlib.sha256(bytes.fromhex(server_seed)).hexdigest()
+
+
+class _Seeds:
+    __slots__ = ('server_seed', 'server_seed_hash', 'client_seed', 'nonce', 'reserved', 'draws', 'keyed')
+
+    def __init__(self, server_seed: str, client_seed: str, nonce: int = 0):
+        self.server_seed = server_seed
+        self.server_seed_hash = hash_seed(server_seed)
+        self.client_seed = client_seed
+        self.nonce = nonce         # Index of the next draw
+        self.reserved = nonce      # Draws below this are on disk as handed out
+        self.draws: Deque[float] = deque()  # Pre-generated draws for nonce, nonce + 1, ...
+        self.keyed = hmac.new(bytes.fromhex(server_seed), digestmod=hashlib.sha256)  # Copied per digest
+
+
+class FairRandom:
+    """
+    The part of the random module games.py uses, fed from one seed pair.
+
+    Draw n is word n % 8 of the digest for block n // 8, so every outcome can be re-derived
+    from the seeds and the nonce it was drawn at. Digests are generated FAIRNESS_BATCH at a
+    time; `reserve` is told how far ahead that goes before any of the draws are used.
+    """
+
+    def __init__(self, seeds: _Seeds, reserve: Optional[Callable[[_Seeds, int], None]] = None):
+        self._seeds = seeds
+        self._reserve = reserve
+
+    @property
+    def nonce(self) -> int:
+        return self._seeds.nonce
+
+    @property
+    def server_seed_hash(self) -> str:
+        return self._seeds.server_seed_hash
+
+    def _refill(self):
+        seeds = self._seeds
+        block, offset = divmod(seeds.nonce, DRAWS_PER_DIGEST)
+        end = (block + FAIRNESS_BATCH) * DRAWS_PER_DIGEST
+        if self._reserve is not None:
+            self._reserve(seeds, end)
+        for b in range(block, block + FAIRNESS_BATCH):
+            seeds.draws.extend(_block_draws(seeds.keyed, seeds.client_seed, b))
+        for _ in range(offset):
+            seeds.draws.popleft()
+
+    def random(self) -> float:
+        seeds = self._seeds
+        if not seeds.draws:
+            self._refill()
+        seeds.nonce += 1
+        return seeds.draws.popleft()
+
+    def randint(self, a: int, b: int) -> int:
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def uniform(self, a: float, b: float) -> float:
+        return a + (b - a) * self.random()
+
+
+def verify(server_seed: str, client_seed: str, nonce: int, count: int = 1) -> List[float]:
+    """Re-derive `count` draws starting at `nonce` from a revealed server seed"""
+    rng = FairRandom(_Seeds(server_seed, client_seed, nonce))
+    return [rng.random() for _ in range(count)]
+
+
+def replay(server_seed: str, client_seed: str, nonce: int, outcome: Callable[[FairRandom], T]) -> T:
+    """Re-run a game step on the draws from `nonce`, e.g. replay(..., CrashGame.generate_multiplier)"""
+    return outcome(FairRandom(_Seeds(server_seed, client_seed, nonce)))
+
+
+class FairnessEngine:
+    """
+    Per-user provably-fair seed pairs.
+
+    Each user has a secret server seed, whose SHA-256 is shown up front, a client seed they
+    may choose, and a nonce counting draws. Rotating the pair reveals the old server seed so
+    the player can check every outcome drawn from it with verify() or replay(). Seeds and
+    revealed seeds are kept in an append-only file. Nonces are reserved there FAIRNESS_RESERVE
+    at a time before any are drawn, so after a restart the nonce resumes past anything that
+    could have been shown.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._seeds: Dict[int, _Seeds] = {}
+        self._streams: Dict[int, FairRandom] = {}
+        self._revealed: Dict[str, Dict[str, Any]] = {}
+        self._file = None
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        good = 0
+        lines = 0
+        try:
+            with open(self.filename, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    lines += 1
+                    good += len(line)
+                    if 'x' in record:
+                        self._revealed[hash_seed(record['x'])] = {
+                            'server_seed': record['x'], 'client_seed': record['c'], 'nonce': record['n']
+                        }
+                    else:
+                        # Nothing past the last reservation was ever drawn
+                        seeds = _Seeds(record['s'], record['c'], record['r'])
+                        self._seeds[record['u']] = seeds
+            if lines > 2 * (len(self._seeds) + len(self._revealed)) or good < os.path.getsize(self.filename):
+                self._compact()
+        except Exception as e:
+            print(f"Error loading seeds: {e}")
+
+    def _compact(self):
+        """Rewrite the file as one line per live seed pair and per revealed seed"""
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            for record in self._revealed.values():
+                f.write(self._line({'x': record['server_seed'], 'c': record['client_seed'], 'n': record['nonce']}))
+            for user_id, seeds in self._seeds.items():
+                f.write(self._line({'u': user_id, 's': seeds.server_seed, 'c': seeds.client_seed, 'r': seeds.reserved}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+
+    @staticmethod
+    def _line(record: dict) -> str:
+        return json.dumps(record, separators=(',', ':')) + '\n'
+
+    def _write(self, record: dict):
+        """Durable before returning: a lost reservation could let a nonce be drawn twice"""
+        try:
+            if self._file is None:
+                self._file = open(self.filename, 'a')
+            self._file.write(self._line(record))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            print(f"Error writing seeds: {e}")
+
+    def _reserve_for(self, user_id: int) -> Callable[[_Seeds, int], None]:
+        def reserve(seeds: _Seeds, end: int):
+            if end > seeds.reserved:
+                # Reserve well ahead so the fsync is rare; a restart just skips the unused nonces
+                seeds.reserved = end + FAIRNESS_RESERVE
+                self._write({'u': user_id, 's': seeds.server_seed, 'c': seeds.client_seed, 'r': seeds.reserved})
+        return reserve
+
+    def _seeds_for(self, user_id: int) -> _Seeds:
+        seeds = self._seeds.get(user_id)
+        if seeds is None:
+            seeds = self._seeds[user_id] = _Seeds(secrets.token_hex(32), secrets.token_hex(8))
+            self._write({'u': user_id, 's': seeds.server_seed, 'c': seeds.client_seed, 'r': 0})
+        return seeds
+
+    def rng(self, user_id: int) -> FairRandom:
+        """The user's draw stream; pass it as `rng` to the games.py outcome functions"""
+        stream = self._streams.get(user_id)
+        if stream is None:
+            stream = self._streams[user_id] = FairRandom(self._seeds_for(user_id), self._reserve_for(user_id))
+        return stream
+
+    def commitment(self, user_id: int) -> Dict[str, Any]:
+        """What the player may see about the live pair: the server seed's hash, not the seed"""
+        seeds = self._seeds_for(user_id)
+        return {'server_seed_hash': seeds.server_seed_hash, 'client_seed': seeds.client_seed, 'nonce': seeds.nonce}
+
+    def rotate(self, user_id: int, client_seed: Optional[str] = None) -> Dict[str, Any]:
+        """Reveal the current server seed and start a new pair; returns the revealed pair"""
+        old = self._seeds_for(user_id)
+        revealed = {'server_seed': old.server_seed, 'client_seed': old.client_seed, 'nonce': old.nonce}
+        self._write({'x': old.server_seed, 'c': old.client_seed, 'n': old.nonce})
+        self._revealed[old.server_seed_hash] = revealed
+
+        new = _Seeds(secrets.token_hex(32), client_seed or secrets.token_hex(8))
+        self._seeds[user_id] = new
+        self._streams.pop(user_id, None)
+        # Record the new pair now so its hash, once shown, survives a restart
+        self._write({'u': user_id, 's': new.server_seed, 'c': new.client_seed, 'r': 0})
+        return dict(revealed, server_seed_hash=old.server_seed_hash)
+
+    def revealed(self, server_seed_hash: str) -> Optional[Dict[str, Any]]:
+        """A retired pair by the hash that was shown while it was live"""
+        return self._revealed.get(server_seed_hash)
+
+    def backup(self, name: str) -> Optional[str]:
+        if not os.path.exists(self.filename):
+            return None
+        backup_filename = f"{name}.seeds"
+        shutil.copy2(self.filename, backup_filename)
+        return backup_filename
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,17 +1,29 @@
 import asyncio
+import html
+import logging
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from telegram.constants import DiceEmoji
+from telegram.constants import ChatMemberStatus, ChatType, DiceEmoji
 
 from database import db
-from games import DiceGame, CoinFlipGame
-from utils import check_achievements, get_xp_for_bet, format_number
+from games import AutoBet, CrashGame, DiceGame, CoinFlipGame, RouletteSlip
+from fairness import verify
+from settlement import Settlement, settle
+from utils import format_number
+from wallet import place_bet, credit, already_settled
+from send_queue import NOTIFICATION
+from scheduler import DeadlineScheduler
+from tables import CRASH, ROULETTE, TableBet, tables
+from config import AUTOBET_MAX_ROUNDS, CHALLENGE_EXPIRY, CRASH_MAX_MULTIPLIER, REFUND_NOTIFY_CONCURRENCY
+
+logger = logging.getLogger(__name__)
 
 
 async def dice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced dice game with Telegram's animated dice emoji"""
     user_id = update.effective_user.id
-    user_data = db.get_user(user_id)
+    user_data = db.get_user(user_id, update.effective_user.username)
     
     keyboard = [
         [InlineKeyboardButton("🎲 Play vs Dealer", callback_data="dice_mode_bot")],
@@ -38,7 +50,7 @@ async def dice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def coinflip_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced coin flip game with Telegram's animated dice emoji"""
     user_id = update.effective_user.id
-    user_data = db.get_user(user_id)
+    user_data = db.get_user(user_id, update.effective_user.username)
     
     keyboard = [
         [InlineKeyboardButton("🦅 Heads", callback_data="coinflip_heads"),
@@ -89,32 +101,34 @@ async def dice_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Amount must be greater than 0.")
         return
     
-    user_data = db.get_user(user_id)
+    user_data = db.get_user(user_id, user.username)
+
+    target_id = db.find_user_by_username(target_username)
+    if target_id == user_id:
+        await update.message.reply_text("❌ You can't challenge yourself.")
+        return
     
-    if amount > user_data['balance']:
+    if not await place_bet(user_id, amount, f"update:{update.update_id}"):
         await update.message.reply_text(
             f"❌ Insufficient balance.\n💰 Available: ${format_number(user_data['balance'])}"
         )
         return
     
-    user_data['balance'] -= amount
-    
-    if not hasattr(db, 'dice_challenges'):
-        db.dice_challenges = {}
-    
     import uuid
     challenge_id = str(uuid.uuid4())
     
-    db.dice_challenges[challenge_id] = {
+    db.dice_challenges.add(challenge_id, {
         'challenger_id': user_id,
         'challenger_username': user.username or user.first_name,
         'target_username': target_username,
-        'target_id': None,
+        'target_id': target_id,
         'amount': amount,
         'challenger_number': challenger_number,
         'status': 'pending',
-        'created_at': asyncio.get_event_loop().time()
-    }
+        'created_at': time.time()
+    })
+    db.commit_challenge(challenge_id)
+    dealer_bot.schedule_expiry(challenge_id)
     
     keyboard = [
         [InlineKeyboardButton("✅ Accept", callback_data=f"dice_accept_{challenge_id}"),
@@ -140,36 +154,320 @@ async def dice_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def _parse_slip(args) -> RouletteSlip:
+    """'10 red 5 17 2 split 1 2 5 dozen 3' -> one slip; a bare number is a straight bet"""
+    slip = RouletteSlip()
+    i = 0
+    while i < len(args):
+        amount = float(args[i])
+        bet_type = args[i + 1].lower()
+        i += 2
+        if bet_type.isdigit():
+            bet_type, selection = 'number', int(bet_type)
+        elif bet_type == 'split':
+            selection = (int(args[i]), int(args[i + 1]))
+            i += 2
+        elif bet_type in ('number', 'dozen', 'column'):
+            selection = int(args[i])
+            i += 1
+        else:
+            selection = None
+        slip.add(bet_type, selection, amount)
+    if not slip:
+        raise ValueError("Empty slip")
+    return slip
+
+
+async def roulette_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Put a betting slip on this chat's shared roulette round"""
+    key = f"update:{update.update_id}"
+    if already_settled(key):
+        return
+    user = update.effective_user
+    db.get_user(user.id, user.username)
+
+    try:
+        slip = _parse_slip(context.args or [])
+    except (ValueError, IndexError):
+        await update.message.reply_text(
+            "❌ Usage: /roulette [amount] [bet] ...\n\n"
+            "Bets: 17 (straight), split 17 20, red, black, odd, even, dozen 1-3, column 1-3\n"
+            "Example: /roulette 10 red 5 17 2 split 17 20"
+        )
+        return
+
+    error = await tables.bet(context.bot, update.effective_chat.id, ROULETTE,
+                             TableBet(user.id, user.first_name, key, slip.stake, slip=slip))
+    if error:
+        await update.message.reply_text(error)
+
+
+async def crash_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Join this chat's shared crash round with an automatic cash-out"""
+    key = f"update:{update.update_id}"
+    if already_settled(key):
+        return
+    user = update.effective_user
+    db.get_user(user.id, user.username)
+
+    try:
+        amount = float(context.args[0])
+        cashout = float(context.args[1])
+    except (ValueError, IndexError, TypeError):
+        await update.message.reply_text("❌ Usage: /crash [amount] [cashout]\n\nExample: /crash 10 2.5")
+        return
+    if amount <= 0 or not CrashGame.valid_cashout(cashout):
+        await update.message.reply_text(
+            f"❌ Amount must be positive and cashout above 1x, up to {CRASH_MAX_MULTIPLIER:g}x."
+        )
+        return
+
+    error = await tables.bet(context.bot, update.effective_chat.id, CRASH,
+                             TableBet(user.id, user.first_name, key, amount, cashout=cashout))
+    if error:
+        await update.message.reply_text(error)
+
+
+_AUTOBET_USAGE = (
+    "❌ Usage: /autobet [dice|coinflip] [pick] [amount] x[rounds] [stop-loss N] [take-profit N]\n\n"
+    "Dice picks: a number 1-6 (5x). Coinflip picks: heads, tails.\n"
+    "Example: /autobet dice 4 10 x100 stop-loss 200 take-profit 500"
+)
+
+
+def _autobet_round(game: str, pick: str, amount: float, rng):
+    """A function that plays one round of the bet and returns its winnings, or None for a bad pick"""
+    if game == 'dice' and pick.isdigit() and 1 <= int(pick) <= 6:
+        number = int(pick)
+        # Same 5x rule as a single /dice bet on a number
+        return lambda: amount * 5 if DiceGame.roll(rng) == number else 0.0
+    # No high/low/even/odd: DiceGame.calculate_payout pays those above 100% RTP (see simulate.py)
+    if game == 'coinflip' and pick in ('heads', 'tails'):
+        return lambda: CoinFlipGame.calculate_payout(pick, CoinFlipGame.flip(rng), amount)
+    return None
+
+
+async def autobet_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Play up to AUTOBET_MAX_ROUNDS dice or coinflip rounds at once and reply with one summary"""
+    key = f"update:{update.update_id}"
+    if already_settled(key):
+        return
+    user = update.effective_user
+    user_data = db.get_user(user.id, user.username)
+    args = [arg.lower() for arg in context.args or []]
+
+    try:
+        game, pick, amount, rounds = args[0], args[1], float(args[2]), int(args[3].lstrip('x'))
+        options = dict(zip(args[4::2], (float(value) for value in args[5::2])))
+    except (ValueError, IndexError):
+        await update.message.reply_text(_AUTOBET_USAGE)
+        return
+    stop_loss = options.pop('stop-loss', None)
+    take_profit = options.pop('take-profit', None)
+    rng = db.fairness.rng(user.id)
+    play_round = _autobet_round(game, pick, amount, rng)
+    if play_round is None or options or amount <= 0 or not 1 <= rounds <= AUTOBET_MAX_ROUNDS:
+        await update.message.reply_text(_AUTOBET_USAGE)
+        return
+
+    # Escrow what the session could need at most: a stop-loss caps it below stop_loss + one bet
+    exposure = amount * rounds
+    if stop_loss is not None:
+        exposure = min(exposure, stop_loss + amount)
+    escrow = min(exposure, user_data['balance'] // amount * amount)
+    if escrow < amount or not await place_bet(user.id, escrow, key):
+        await update.message.reply_text(
+            f"❌ Insufficient balance.\n💰 You have: ${format_number(user_data['balance'])}"
+        )
+        return
+
+    first_nonce = rng.nonce
+    session = AutoBet(amount, rounds, stop_loss, take_profit, user_data['win_streak'])
+    session.run(play_round, escrow)
+    # Winnings are played on from the escrow, so what comes back is the escrow plus the net
+    await settle([Settlement(user.id, game, session.wagered, session.returned, key, session.played,
+                             session.winnings, session.streak, session.best_streak, escrow + session.net)])
+
+    stopped = {
+        'stop-loss': "🛑 Stopped: stop-loss reached",
+        'take-profit': "🎯 Stopped: take-profit reached",
+        'balance': "💸 Stopped: out of balance",
+    }.get(session.stopped_by, "✅ All rounds played")
+    await update.message.reply_text(
+        f"🤖 <b>AUTOBET - {game.upper()} {pick.upper()}</b>\n\n"
+        f"🎮 Rounds: {session.played}/{rounds}\n"
+        f"🏆 Wins: {session.wins} ({session.wins / session.played:.0%})\n"
+        f"💰 Wagered: ${session.wagered:.2f}\n"
+        f"{'📈' if session.net >= 0 else '📉'} Net: {'+' if session.net >= 0 else '-'}${abs(session.net):.2f}\n"
+        f"🔥 Best streak: {session.best_streak}\n"
+        f"{stopped}\n\n"
+        f"💳 Balance: ${format_number(user_data['balance'])}\n"
+        f"🔐 Nonces {first_nonce}-{rng.nonce - 1} · /fair to verify",
+        parse_mode='HTML'
+    )
+
+
+async def turbo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Toggle turbo mode, which settles dice and coinflip bets at once instead of after the animation"""
+    user = update.effective_user
+    chat = update.effective_chat
+    user_data = db.get_user(user.id, user.username)
+    args = [arg.lower() for arg in context.args or []]
+    for_chat = 'chat' in args
+    settings = context.chat_data if for_chat else user_data
+
+    if 'on' in args or 'off' in args:
+        if for_chat and chat.type != ChatType.PRIVATE:
+            member = await context.bot.get_chat_member(chat.id, user.id)
+            if member.status not in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+                await update.message.reply_text("❌ Only chat admins can change turbo mode for the chat.")
+                return
+        settings['turbo'] = 'on' in args
+        if not for_chat:
+            db.commit(user.id)
+
+    mine = "ON" if user_data.get('turbo') else "OFF"
+    chat_wide = "ON" if context.chat_data.get('turbo') else "OFF"
+    await update.message.reply_text(
+        "⚡ <b>TURBO MODE</b>\n\n"
+        f"👤 You: {mine}\n"
+        f"💬 This chat: {chat_wide}\n\n"
+        "In turbo, dice and coinflip results are drawn from your provably-fair seeds and "
+        "settled instantly, with no animation.\n\n"
+        "/turbo on|off - for you\n"
+        "/turbo chat on|off - for everyone here (admins)",
+        parse_mode='HTML'
+    )
+
+
+async def fair_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Provably-fair seeds: show the commitment, change the client seed, or verify draws"""
+    user_id = update.effective_user.id
+    args = context.args or []
+
+    # '/fair table ...' is about the seeds this chat's shared tables draw from
+    owner = user_id
+    if args and args[0] == 'table':
+        owner = update.effective_chat.id
+        args = args[1:]
+
+    if args and args[0] in ('seed', 'rotate') and owner == user_id and context.user_data.get('blackjack_hand'):
+        # Revealing the seed mid-hand would reveal the rest of the shoe
+        await update.message.reply_text("❌ Finish your blackjack hand before changing seeds.")
+        return
+
+    if args and args[0] in ('seed', 'rotate'):
+        client_seed = args[1][:64] if args[0] == 'seed' and len(args) > 1 else None
+        old = db.fairness.rotate(owner, client_seed)
+        new = db.fairness.commitment(owner)
+        msg = (
+            "🔐 <b>SEEDS ROTATED</b>\n\n"
+            f"Revealed server seed:\n<code>{old['server_seed']}</code>\n"
+            f"(hash <code>{old['server_seed_hash']}</code>)\n"
+            f"Client seed: <code>{html.escape(old['client_seed'])}</code>\n"
+            f"Draws used: {old['nonce']}\n\n"
+            f"New server seed hash:\n<code>{new['server_seed_hash']}</code>\n"
+            f"New client seed: <code>{html.escape(new['client_seed'])}</code>"
+        )
+    elif args and args[0] == 'verify' and len(args) >= 4:
+        try:
+            nonce = int(args[3])
+            count = min(int(args[4]), 20) if len(args) > 4 else 1
+            draws = verify(args[1], args[2], nonce, count)
+        except ValueError:
+            await update.message.reply_text("❌ Usage: /fair verify <server_seed> <client_seed> <nonce> [count]")
+            return
+        msg = "🔐 <b>DRAWS</b>\n\n" + "\n".join(f"#{nonce + i}: {draw:.10f}" for i, draw in enumerate(draws))
+    else:
+        current = db.fairness.commitment(owner)
+        msg = (
+            "🔐 <b>PROVABLY FAIR</b>\n\n"
+            f"Server seed hash:\n<code>{current['server_seed_hash']}</code>\n"
+            f"Client seed: <code>{html.escape(current['client_seed'])}</code>\n"
+            f"Next nonce: {current['nonce']}\n\n"
+            "Draw n is HMAC-SHA256(server seed, \"client seed:⌊n/8⌋\"), word n mod 8 ÷ 2³².\n\n"
+            "/fair seed &lt;text&gt; - Set your client seed (reveals the current server seed)\n"
+            "/fair rotate - Reveal the server seed and start a new one\n"
+            "/fair verify &lt;server&gt; &lt;client&gt; &lt;nonce&gt; [count] - Re-derive draws\n"
+            "/fair table [seed|rotate] - The same for this chat's shared tables"
+        )
+
+    await update.message.reply_text(msg, parse_mode='HTML')
+
+
 class DealerBot:
     """Dealer bot for monitoring and handling challenges"""
-    
+
+    def __init__(self):
+        self.expiries = DeadlineScheduler(self._expire)
+        self._expiry_handles = {}
+        self._app = None
+
+    def schedule_expiry(self, challenge_id: str, delay: float = CHALLENGE_EXPIRY):
+        """Refund the challenge exactly `delay` seconds from now unless it is cancelled first"""
+        self._expiry_handles[challenge_id] = self.expiries.schedule(delay, challenge_id)
+
+    def cancel_expiry(self, challenge_id: str) -> bool:
+        """Call once a challenge is accepted or declined; O(1)"""
+        handle = self._expiry_handles.pop(challenge_id, None)
+        return handle is not None and self.expiries.cancel(handle)
+
+    async def _refund(self, challenge_id: str):
+        """Return the escrowed stake and drop the challenge; the ledger key makes a repeat harmless"""
+        challenge = db.dice_challenges[challenge_id]
+        await credit(challenge['challenger_id'], challenge['amount'], f"challenge:{challenge_id}:refund", 'refund')
+        db.dice_challenges.pop(challenge_id)
+        db.commit_challenge(challenge_id)
+        return challenge
+
+    async def _expire(self, challenge_ids):
+        """Refund every challenge in a batch that hit its deadline, then notify the challengers"""
+        refunded = []
+        for challenge_id in challenge_ids:
+            self._expiry_handles.pop(challenge_id, None)
+            challenge = db.dice_challenges.get(challenge_id)
+            if challenge is None or challenge['status'] != 'pending':
+                continue
+            refunded.append(await self._refund(challenge_id))
+
+        if not refunded or self._app is None:
+            return
+
+        slots = asyncio.Semaphore(REFUND_NOTIFY_CONCURRENCY)
+
+        async def notify(challenge):
+            async with slots:
+                try:
+                    await self._app.bot.send_message(
+                        chat_id=challenge['challenger_id'],
+                        text=f"⏱ Your dice challenge expired. ${challenge['amount']:.2f} refunded.",
+                        rate_limit_args={'priority': NOTIFICATION}
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not notify {challenge['challenger_id']} of refund: {e}")
+
+        await asyncio.gather(*(notify(challenge) for challenge in refunded))
+
+    async def recover_escrows(self):
+        """Resume the expiry of challenges saved before a restart and refund any that were cut off"""
+        now = time.time()
+        resumed = refunded = 0
+        for challenge_id, challenge in list(db.dice_challenges.items()):
+            if challenge['status'] == 'pending':
+                self.schedule_expiry(challenge_id, max(0.0, challenge['created_at'] + CHALLENGE_EXPIRY - now))
+                resumed += 1
+            else:
+                # The game was interrupted mid-play, so its outcome is unknown; give the stake back
+                await self._refund(challenge_id)
+                refunded += 1
+        if resumed or refunded:
+            logger.info(f"Recovered challenge escrows: {resumed} resumed, {refunded} refunded")
+
     async def monitor_challenges(self, app):
-        """Monitor active challenges and clean up expired ones"""
-        while True:
-            await asyncio.sleep(60)
-            
-            if hasattr(db, 'dice_challenges'):
-                current_time = asyncio.get_event_loop().time()
-                expired = []
-                
-                for challenge_id, challenge in db.dice_challenges.items():
-                    if current_time - challenge['created_at'] > 300:
-                        expired.append(challenge_id)
-                
-                for challenge_id in expired:
-                    challenge = db.dice_challenges[challenge_id]
-                    challenger_data = db.get_user(challenge['challenger_id'])
-                    challenger_data['balance'] += challenge['amount']
-                    
-                    try:
-                        await app.bot.send_message(
-                            chat_id=challenge['challenger_id'],
-                            text=f"⏱ Your dice challenge expired. ${challenge['amount']:.2f} refunded."
-                        )
-                    except:
-                        pass
-                    
-                    del db.dice_challenges[challenge_id]
+        """Recover saved challenges, then fire expiries at their deadlines"""
+        self._app = app
+        await self.recover_escrows()
+        await self.expiries.run()
 
 
 dealer_bot = DealerBot()
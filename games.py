@@ -1,5 +1,37 @@
+import math
 import random
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import BLACKJACK_DECKS, BLACKJACK_PENETRATION, CRASH_HOUSE_EDGE, CRASH_MAX_MULTIPLIER
+
+
+def _roulette_bets(red_numbers: List[int]) -> List[Tuple[Tuple[str, object], Tuple[int, ...], int]]:
+    """Every distinct roulette bet as (key, winning pockets, payout per unit staked)"""
+    red = set(red_numbers)
+    bets = [(('number', n), (n,), 35) for n in range(37)]
+    splits = [(0, 1), (0, 2), (0, 3)]
+    splits += [(n, n + 1) for n in range(1, 36) if n % 3 != 0]
+    splits += [(n, n + 3) for n in range(1, 34)]
+    bets += [(('split', pair), pair, 17) for pair in sorted(splits)]
+    bets += [(('dozen', d), tuple(range(12 * d - 11, 12 * d + 1)), 2) for d in (1, 2, 3)]
+    bets += [(('column', c), tuple(range(c, 37, 3)), 2) for c in (1, 2, 3)]
+    bets += [
+        (('red', None), tuple(n for n in range(1, 37) if n in red), 1),
+        (('black', None), tuple(n for n in range(1, 37) if n not in red), 1),
+        (('odd', None), tuple(range(1, 37, 2)), 1),
+        (('even', None), tuple(range(2, 37, 2)), 1),
+    ]
+    return bets
+
+
+def _roulette_index(bets) -> Dict[Tuple[str, object], int]:
+    return {key: i for i, (key, _, _) in enumerate(bets)}
+
+
+def _roulette_table(bets) -> Tuple[Tuple[float, ...], ...]:
+    return tuple(
+        tuple(float(payout) if pocket in pockets else 0.0 for _, pockets, payout in bets) for pocket in range(37)
+    )
 
 
 class RouletteGame:
@@ -7,9 +39,15 @@ class RouletteGame:
     RED_NUMBERS = [1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36]
     BLACK_NUMBERS = [2, 4, 6, 8, 10, 11, 13, 15, 17, 20, 22, 24, 26, 28, 29, 31, 33, 35]
     
+    # PAYOUT_TABLE[pocket][bet] is the winnings per unit staked, 0 if the bet loses;
+    # BET_INDEX maps ('split', (1, 2)), ('dozen', 3), ('red', None), ... to the bet's column
+    BETS = _roulette_bets(RED_NUMBERS)
+    BET_INDEX = _roulette_index(BETS)
+    PAYOUT_TABLE = _roulette_table(BETS)
+    
     @staticmethod
-    def spin() -> int:
-        return random.randint(0, 36)
+    def spin(rng=random) -> int:
+        return rng.randint(0, 36)
     
     @staticmethod
     def get_color(number: int) -> str:
@@ -17,26 +55,72 @@ class RouletteGame:
             return "🟢"
         return "🔴" if number in RouletteGame.RED_NUMBERS else "⚫"
     
+    @staticmethod
+    def bet_index(bet_type: str, selection=None) -> Optional[int]:
+        """Column of a bet in PAYOUT_TABLE, or None if there is no such bet"""
+        if bet_type == 'split':
+            try:
+                selection = tuple(sorted(selection))
+            except TypeError:
+                return None
+        elif bet_type in ('red', 'black', 'odd', 'even'):
+            selection = None
+        return RouletteGame.BET_INDEX.get((bet_type, selection))
+    
+    @staticmethod
+    def describe(index: int) -> str:
+        bet_type, selection = RouletteGame.BETS[index][0]
+        if selection is None:
+            return bet_type
+        if bet_type == 'split':
+            return f"split {selection[0]}/{selection[1]}"
+        return f"{bet_type} {selection}"
+    
     @staticmethod
     def calculate_payout(bet_type: str, bet_number: Optional[int], result: int, amount: float) -> float:
-        if bet_type == "number" and bet_number == result:
-            return amount * 35
-        elif bet_type == "red" and result in RouletteGame.RED_NUMBERS:
-            return amount
-        elif bet_type == "black" and result in RouletteGame.BLACK_NUMBERS:
-            return amount
-        elif bet_type == "odd" and result % 2 == 1 and result != 0:
-            return amount
-        elif bet_type == "even" and result % 2 == 0 and result != 0:
-            return amount
-        elif bet_type == "dozen":
-            if bet_number == 1 and 1 <= result <= 12:
-                return amount * 2
-            elif bet_number == 2 and 13 <= result <= 24:
-                return amount * 2
-            elif bet_number == 3 and 25 <= result <= 36:
-                return amount * 2
-        return 0.0
+        index = RouletteGame.bet_index(bet_type, bet_number)
+        if index is None:
+            return 0.0
+        return amount * RouletteGame.PAYOUT_TABLE[result][index]
+
+
+class RouletteSlip:
+    """
+    Every bet one player puts on a single spin.
+    
+    Bets are stored as (PAYOUT_TABLE column, amount), so settling a spin reads one table row
+    for the whole slip, however many straights, splits, colours, dozens and columns it holds.
+    """
+    
+    __slots__ = ('bets',)
+    
+    def __init__(self):
+        self.bets: List[Tuple[int, float]] = []
+    
+    def __len__(self) -> int:
+        return len(self.bets)
+    
+    def add(self, bet_type: str, selection, amount: float):
+        index = RouletteGame.bet_index(bet_type, selection)
+        if index is None:
+            raise ValueError(f"Unknown roulette bet: {bet_type} {selection}")
+        if amount <= 0:
+            raise ValueError("Bet amount must be positive")
+        self.bets.append((index, amount))
+    
+    @property
+    def stake(self) -> float:
+        return sum(amount for _, amount in self.bets)
+    
+    def settle(self, result: int) -> List[float]:
+        """Winnings for each bet on the slip, in order; 0 for the ones that lost"""
+        row = RouletteGame.PAYOUT_TABLE[result]
+        return [amount * row[index] for index, amount in self.bets]
+    
+    def returned(self, result: int) -> float:
+        """Stakes of the winning bets plus their winnings"""
+        row = RouletteGame.PAYOUT_TABLE[result]
+        return sum(amount * (row[index] + 1) for index, amount in self.bets if row[index])
 
 
 class BlackjackGame:
@@ -47,9 +131,12 @@ class BlackjackGame:
         'J': 10, 'Q': 10, 'K': 10
     }
     
+    RANKS = tuple(CARD_VALUES)
+    
     @staticmethod
-    def deal_card() -> str:
-        return random.choice(list(BlackjackGame.CARD_VALUES.keys()))
+    def deal_card(rng=random) -> str:
+        """One card from an infinite deck; tables deal from a BlackjackShoe"""
+        return rng.choice(BlackjackGame.RANKS)
     
     @staticmethod
     def calculate_hand_value(cards: List[str]) -> int:
@@ -67,11 +154,88 @@ class BlackjackGame:
         return len(cards) == 2 and BlackjackGame.calculate_hand_value(cards) == 21
 
 
+class BlackjackHand:
+    """Cards plus a running total and the number of aces still counted as 11"""
+    
+    __slots__ = ('cards', 'total', 'soft_aces')
+    
+    def __init__(self, cards: Iterable[str] = ()):
+        self.cards: List[str] = []
+        self.total = 0
+        self.soft_aces = 0
+        for card in cards:
+            self.add(card)
+    
+    def add(self, card: str) -> int:
+        self.cards.append(card)
+        self.total += BlackjackGame.CARD_VALUES[card]
+        if card == 'A':
+            self.soft_aces += 1
+        while self.total > 21 and self.soft_aces:
+            self.total -= 10
+            self.soft_aces -= 1
+        return self.total
+    
+    @property
+    def is_soft(self) -> bool:
+        return self.soft_aces > 0
+    
+    @property
+    def is_blackjack(self) -> bool:
+        return len(self.cards) == 2 and self.total == 21
+    
+    @property
+    def is_bust(self) -> bool:
+        return self.total > 21
+
+
+class BlackjackShoe:
+    """
+    Several decks shuffled together and dealt from the top.
+    
+    Drawing just advances a position. Once `penetration` of the shoe has been dealt,
+    needs_shuffle() asks for a reshuffle before the next round. Every shuffle starts from
+    the unshuffled shoe and takes one rng.random() per card. So with a provably-fair rng,
+    BlackjackShoe(decks, penetration, rng) replayed from shuffle_nonce rebuilds the order.
+    """
+    
+    # Cards one round can use at most, so a round never runs past the end of the shoe
+    _ROUND_RESERVE = 24
+    
+    def __init__(self, decks: int = BLACKJACK_DECKS, penetration: float = BLACKJACK_PENETRATION, rng=random):
+        self.decks = decks
+        self.cards: List[str] = []
+        size = len(BlackjackGame.RANKS) * 4 * decks
+        self.cut = max(0, min(int(size * penetration), size - self._ROUND_RESERVE))
+        self.position = 0
+        self.shuffle_nonce: Optional[int] = None
+        self.seed_hash: Optional[str] = None
+        self.shuffle(rng)
+    
+    def shuffle(self, rng=random):
+        self.shuffle_nonce = getattr(rng, 'nonce', None)
+        self.seed_hash = getattr(rng, 'server_seed_hash', None)
+        cards = list(BlackjackGame.RANKS) * (4 * self.decks)
+        for i in range(len(cards) - 1, 0, -1):
+            j = int(rng.random() * (i + 1))
+            cards[i], cards[j] = cards[j], cards[i]
+        self.cards = cards
+        self.position = 0
+    
+    def needs_shuffle(self) -> bool:
+        return self.position >= self.cut
+    
+    def draw(self) -> str:
+        card = self.cards[self.position]
+        self.position += 1
+        return card
+
+
 class BasketballGame:
     
     @staticmethod
-    def shoot() -> bool:
-        return random.random() < 0.55
+    def shoot(rng=random) -> bool:
+        return rng.random() < 0.55
     
     @staticmethod
     def calculate_payout(prediction: str, result: bool, amount: float) -> float:
@@ -83,8 +247,8 @@ class BasketballGame:
 class SoccerGame:
     
     @staticmethod
-    def kick() -> bool:
-        return random.random() < 0.45
+    def kick(rng=random) -> bool:
+        return rng.random() < 0.45
     
     @staticmethod
     def calculate_payout(prediction: str, result: bool, amount: float) -> float:
@@ -96,8 +260,8 @@ class SoccerGame:
 class BowlingGame:
     
     @staticmethod
-    def roll() -> str:
-        roll = random.random()
+    def roll(rng=random) -> str:
+        roll = rng.random()
         if roll < 0.10:
             return "strike"
         elif roll < 0.50:
@@ -116,17 +280,15 @@ class BowlingGame:
 class CrashGame:
     
     @staticmethod
-    def generate_multiplier() -> float:
-        rand = random.random()
-        
-        if rand < 0.33:
-            return round(random.uniform(1.0, 1.5), 2)
-        elif rand < 0.66:
-            return round(random.uniform(1.5, 3.0), 2)
-        elif rand < 0.90:
-            return round(random.uniform(3.0, 10.0), 2)
-        else:
-            return round(random.uniform(10.0, 50.0), 2)
+    def generate_multiplier(rng=random) -> float:
+        """Crash point with P(point >= x) = (1 - edge) / x, so every cash-out target has the same RTP"""
+        # Floored to the cent, so rounding never lifts the crash point past a target
+        point = math.floor(100 * (1 - CRASH_HOUSE_EDGE) / (1 - rng.random())) / 100
+        return min(max(point, 1.0), CRASH_MAX_MULTIPLIER)
+    
+    @staticmethod
+    def valid_cashout(cashout_at: float) -> bool:
+        return 1.0 < cashout_at <= CRASH_MAX_MULTIPLIER
     
     @staticmethod
     def did_crash(multiplier: float, cashout_at: float) -> Tuple[bool, float]:
@@ -138,8 +300,8 @@ class CrashGame:
 class DiceGame:
     
     @staticmethod
-    def roll() -> int:
-        return random.randint(1, 6)
+    def roll(rng=random) -> int:
+        return rng.randint(1, 6)
     
     @staticmethod
     def calculate_payout(prediction: str, result: int, amount: float) -> float:
@@ -159,11 +321,76 @@ class DiceGame:
 class CoinFlipGame:
     
     @staticmethod
-    def flip() -> str:
-        return random.choice(['heads', 'tails'])
+    def flip(rng=random) -> str:
+        return rng.choice(['heads', 'tails'])
     
     @staticmethod
     def calculate_payout(prediction: str, result: str, amount: float) -> float:
         if prediction == result:
             return amount
         return 0.0
+
+
+class AutoBet:
+    """
+    The same bet played up to `rounds` times in one pass, for /autobet.
+    
+    run() takes a function that plays one round and returns its winnings (0 if lost). It
+    stops early once the net loss reaches stop_loss, the net profit reaches take_profit, or
+    the bankroll can't cover another bet. Nothing here touches balances; the caller settles
+    wagered and returned totals in one go.
+    """
+    
+    __slots__ = ('bet', 'rounds', 'stop_loss', 'take_profit', 'played', 'wins', 'winnings',
+                 'returned', 'streak', 'best_streak', 'stopped_by')
+    
+    def __init__(self, bet: float, rounds: int, stop_loss: Optional[float] = None,
+                 take_profit: Optional[float] = None, streak: int = 0):
+        self.bet = bet
+        self.rounds = rounds
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.played = 0
+        self.wins = 0
+        self.winnings = 0.0   # Profit from the rounds that won
+        self.returned = 0.0   # Stakes and winnings paid back
+        self.streak = streak
+        self.best_streak = streak
+        self.stopped_by: Optional[str] = None
+    
+    @property
+    def wagered(self) -> float:
+        return self.bet * self.played
+    
+    @property
+    def net(self) -> float:
+        return self.returned - self.wagered
+    
+    def run(self, play_round: Callable[[], float], bankroll: float) -> 'AutoBet':
+        bet = self.bet
+        while self.played < self.rounds:
+            if bankroll < bet:
+                self.stopped_by = 'balance'
+                break
+            won = play_round()
+            self.played += 1
+            if won > 0:
+                self.wins += 1
+                self.winnings += won
+                self.returned += bet + won
+                bankroll += won
+                self.streak += 1
+                if self.streak > self.best_streak:
+                    self.best_streak = self.streak
+            else:
+                bankroll -= bet
+                self.streak = 0
+            
+            net = self.returned - bet * self.played
+            if self.stop_loss is not None and -net >= self.stop_loss:
+                self.stopped_by = 'stop-loss'
+                break
+            if self.take_profit is not None and net >= self.take_profit:
+                self.stopped_by = 'take-profit'
+                break
+        return self
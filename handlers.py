@@ -1,7 +1,9 @@
 from telegram.ext import CommandHandler, ContextTypes
 from database import db
-from utils import validate_bet, format_balance, check_daily_reward
+from utils import validate_bet, format_balance, check_daily_reward, format_number
 from games import roll_dice, coin_flip
+from config import REFERRAL_COMMISSIONS
+from referrals import referral_graph
 import time
 import random
 
@@ -85,9 +87,69 @@ async def bonus(update, context):
 
 async def profile(update, context):
     user_id = update.effective_user.id
-    player = db.get_player(user_id)
-    check_daily_reward(player, user_id, db)  # Check for daily reward
-    await update.message.reply_text(f"Profile:\nBalance: {format_balance(player['balance'])}\nTotal Wagered: ${player['total_wagered']:.2f}\nAchievements: {', '.join(player['achievements'] or ['None'])}")
+    player = db.get_user(user_id)
+    rank = db.get_rank(user_id)
+    await update.message.reply_text(
+        f"Profile:\nBalance: {format_number(player['balance'])}\n"
+        f"Rank: #{rank}\n"
+        f"Total Wagered: ${player['total_wagered']:.2f}\n"
+        f"Achievements: {', '.join(player['achievements'] or ['None'])}"
+    )
+
+LEADERBOARD_METRICS = {
+    'balance': ('balance', '💰 Balance'),
+    'wagered': ('total_wagered', '🎲 Wagered'),
+    'won': ('total_won', '🏆 Won'),
+    'streak': ('max_win_streak', '🔥 Win Streak'),
+    'xp': ('xp', '⭐ XP'),
+}
+
+async def leaderboard(update, context):
+    """/leaderboard [balance|wagered|won|streak|xp] [daily|weekly|all]"""
+    user_id = update.effective_user.id
+    args = [arg.lower() for arg in context.args]
+    metric_name = next((arg for arg in args if arg in LEADERBOARD_METRICS), 'balance')
+    window = next((arg for arg in args if arg in ('daily', 'weekly', 'all')), 'all')
+    metric, title = LEADERBOARD_METRICS[metric_name]
+    if metric == 'balance' and window != 'all':
+        await update.message.reply_text("Balance is only ranked all-time. Try /leaderboard wagered weekly")
+        return
+
+    lines = [f"🏆 <b>LEADERBOARD</b> - {title} ({window})\n"]
+    for position, (uid, value) in enumerate(db.top_players(metric, window), start=1):
+        player = db.find_user(uid)
+        name = f"@{player['username']}" if player and player['username'] else f"Player {uid}"
+        shown = format_number(value) if metric in ('balance', 'total_wagered', 'total_won') else f"{value:g}"
+        lines.append(f"{position}. {name} - {shown}")
+    rank = db.get_rank(user_id, metric, window)
+    lines.append(f"\n📍 Your rank: {f'#{rank}' if rank else 'unranked'}")
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+async def referral_command(update, context):
+    """/referral [claim] - your link, downline totals and commission"""
+    user_id = update.effective_user.id
+    args = [arg.lower() for arg in context.args or []]
+    if 'claim' in args:
+        paid = referral_graph.claim(user_id)
+        if not paid:
+            await update.message.reply_text("Nothing to claim yet. Commission accrues as your referrals play.")
+            return
+        await update.message.reply_text(f"💸 Claimed {format_number(paid)} in referral commission!")
+        return
+
+    totals = referral_graph.summary(user_id)
+    rates = " / ".join(f"{rate * 100:g}%" for rate in REFERRAL_COMMISSIONS)
+    await update.message.reply_text(
+        "👥 <b>REFERRALS</b>\n\n"
+        f"🔗 https://t.me/{context.bot.username}?start=ref{user_id}\n\n"
+        f"Direct referrals: {totals['direct']}\n"
+        f"Downline ({len(REFERRAL_COMMISSIONS)} levels): {totals['downline']}\n"
+        f"Wagered by downline: {format_number(totals['wagered'])}\n"
+        f"Commission earned: {format_number(totals['earned'])}\n"
+        f"Unclaimed: {format_number(totals['unclaimed'])}\n\n"
+        f"You earn {rates} of every bet placed by players you refer, by level. /referral claim to collect.",
+        parse_mode='HTML'
+    )
 
 async def help_command(update, context):
     help_text = "/start - Start the bot\n/balance - Check your balance\n/dice <amount> <number> - Bet on a dice roll (1-6)\n/coinflip <amount> <heads/tails> - Flip a coin\n/bonus - Claim your $5 bonus (wager $5 to unlock)\n/profile - View your stats\n/help - Show this message"
@@ -0,0 +1,285 @@
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_MAX_LEVELS = 24  # Comfortably covers 2**24 (~16M) ranked users
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next: List[Optional['_Node']] = [None] * levels
+        self.width: List[int] = [1] * levels
+
+
+_TAIL = _Node((float('inf'), 0), 0)
+
+
+def _random_levels() -> int:
+    levels = 1
+    while levels < _MAX_LEVELS and random.random() < 0.5:
+        levels += 1
+    return levels
+
+
+class RankIndex:
+    """
+    Order-statistics index over user scores, highest score first.
+
+    An indexable skip list keyed on (-score, user_id), so ties rank by user id. Updates and
+    rank lookups are O(log n), reading the top k is O(k). Searches start at the highest level
+    in use rather than _MAX_LEVELS, so a small index stays cheap.
+    """
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVELS)
+        self._head.next = [_TAIL] * _MAX_LEVELS
+        self._level = 1  # Levels in use; the head's widths above it are reset as they come into use
+        self._size = 0
+        self._scores: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._scores
+
+    def update(self, user_id: int, score: float):
+        """Insert the user or move them to their new score"""
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+        self._insert((-score, user_id))
+        self._scores[user_id] = score
+
+    def score(self, user_id: int) -> Optional[float]:
+        return self._scores.get(user_id)
+
+    def discard(self, user_id: int):
+        score = self._scores.pop(user_id, None)
+        if score is not None:
+            self._remove((-score, user_id))
+
+    def load(self, scores: Iterable[Tuple[int, float]]):
+        """Replace the contents with (user_id, score) pairs, built in one pass over them sorted"""
+        self.__init__()
+        self._scores = dict(scores)
+        last = [self._head] * _MAX_LEVELS  # The rightmost node so far at each level
+        last_position = [0] * _MAX_LEVELS
+        for position, key in enumerate(sorted((-score, user_id) for user_id, score in self._scores.items()), 1):
+            levels = _random_levels()
+            node = _Node(key, levels)
+            for level in range(levels):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+            self._level = max(self._level, levels)
+        self._size = len(self._scores)
+        for level in range(self._level):
+            last[level].next[level] = _TAIL
+            last[level].width[level] = self._size + 1 - last_position[level]
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        """The highest `limit` users as (user_id, score)"""
+        result = []
+        node = self._head.next[0]
+        while node is not _TAIL and len(result) < limit:
+            result.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return result
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based position of the user, or None if they are not indexed"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+
+        key = (-score, user_id)
+        position = 0
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def _insert(self, key):
+        levels = _random_levels()
+        # New top levels only hold the head, whose link there spans every node to the tail
+        for level in range(self._level, levels):
+            self._head.width[level] = self._size + 1
+        self._level = max(self._level, levels)
+
+        chain = [self._head] * self._level
+        steps_at_level = [0] * self._level
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new_node = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self._level):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def _remove(self, key):
+        chain = [self._head] * self._level
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+
+        levels = len(target.next)
+        for level in range(levels):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+        for level in range(levels, self._level):
+            chain[level].width[level] -= 1
+        self._size -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is _TAIL:
+            self._level -= 1
+
+
+DAY = 86400
+
+# How each metric combines across the days of a window
+METRICS = {
+    'total_wagered': 'sum',
+    'total_won': 'sum',
+    'xp': 'sum',
+    'max_win_streak': 'max',
+}
+WINDOWS = {'daily': 1, 'weekly': 7}
+
+
+class TimedLeaderboards:
+    """
+    Daily and weekly leaderboards fed by per-day counters.
+
+    Each settled bet bumps today's counter for the player (O(1)) and their score on every
+    window board. When the day rolls over, only the users in the bucket that fell out of a
+    window are touched; nothing ever rescans the whole user table.
+    """
+
+    def __init__(self):
+        self._days: Dict[int, Dict[str, Dict[int, float]]] = {}
+        self._boards: Dict[Tuple[str, str], RankIndex] = {
+            (window, metric): RankIndex() for window in WINDOWS for metric in METRICS
+        }
+        self._today: Optional[int] = None
+        self._changes: Dict[Tuple[int, str, int], float] = {}
+
+    def record(self, user_id: int, now: float, **values: float):
+        """Add one bet's contribution; values are keyed by metric name"""
+        day = int(now // DAY)
+        self._roll(day)
+        bucket = self._days.setdefault(day, {})
+
+        for metric, value in values.items():
+            if not value:
+                continue
+            counters = bucket.setdefault(metric, {})
+            if METRICS[metric] == 'sum':
+                counters[user_id] = counters.get(user_id, 0) + value
+            elif value > counters.get(user_id, 0):
+                counters[user_id] = value
+            else:
+                continue
+            self._changes[(day, metric, user_id)] = counters[user_id]
+
+            for window in WINDOWS:
+                board = self._boards[(window, metric)]
+                score = board.score(user_id) or 0
+                board.update(user_id, score + value if METRICS[metric] == 'sum' else max(score, value))
+
+    def top(self, metric: str, window: str, limit: int, now: float) -> List[Tuple[int, float]]:
+        self._roll(int(now // DAY))
+        return self._boards[(window, metric)].top(limit)
+
+    def rank(self, metric: str, window: str, user_id: int, now: float) -> Optional[int]:
+        self._roll(int(now // DAY))
+        return self._boards[(window, metric)].rank(user_id)
+
+    def _window_value(self, metric: str, user_id: int, first_day: int) -> float:
+        values = [
+            self._days[day].get(metric, {}).get(user_id, 0)
+            for day in self._days if day >= first_day
+        ]
+        if METRICS[metric] == 'sum':
+            return sum(values)
+        return max(values, default=0)
+
+    def _roll(self, day: int):
+        """Expire the buckets that fell out of each window since the last call"""
+        if self._today is not None and day <= self._today:
+            return
+        previous = self._today
+        self._today = day
+
+        if previous is not None:
+            for window, span in WINDOWS.items():
+                first_day = day - span + 1
+                for expired_day in range(previous - span + 1, first_day):
+                    for metric, counters in self._days.get(expired_day, {}).items():
+                        board = self._boards[(window, metric)]
+                        for user_id in counters:
+                            value = self._window_value(metric, user_id, first_day)
+                            if value:
+                                board.update(user_id, value)
+                            else:
+                                board.discard(user_id)
+
+        oldest = day - max(WINDOWS.values()) + 1
+        for old_day in [d for d in self._days if d < oldest]:
+            del self._days[old_day]
+
+    def drain_changes(self) -> List[Tuple[int, str, int, float]]:
+        """Counters changed since the last call as (day, metric, user_id, value), for storage"""
+        changes = [(day, metric, user_id, value) for (day, metric, user_id), value in self._changes.items()]
+        self._changes = {}
+        return changes
+
+    def counters(self) -> List[Tuple[int, str, int, float]]:
+        """Every live counter, for snapshots"""
+        return [
+            (day, metric, user_id, value)
+            for day, bucket in self._days.items()
+            for metric, counters in bucket.items()
+            for user_id, value in counters.items()
+        ]
+
+    def load_counters(self, rows, now: float):
+        """Restore counters from storage and rebuild the window boards from them"""
+        for day, metric, user_id, value in rows:
+            if metric in METRICS:
+                self._days.setdefault(int(day), {}).setdefault(metric, {})[int(user_id)] = value
+
+        self._today = int(now // DAY)
+        for old_day in [d for d in self._days if d <= self._today - max(WINDOWS.values())]:
+            del self._days[old_day]
+
+        for (window, metric), board in self._boards.items():
+            first_day = self._today - WINDOWS[window] + 1
+            for user_id in {u for day, bucket in self._days.items() if day >= first_day
+                            for u in bucket.get(metric, ())}:
+                board.update(user_id, self._window_value(metric, user_id, first_day))
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from config import LEDGER_FSYNC_INTERVAL, LEDGER_FSYNC_BATCH, LEDGER_RECENT_KEYS, LEDGER_CHECKPOINT_ENTRIES
+
+Account = Union[int, str]
+
+# System accounts on the other side of every user posting
+HOUSE = 'house'    # Stakes lost and payouts made
+PROMO = 'promo'    # Achievement rewards, referral bonuses
+EQUITY = 'equity'  # Opening balances carried over from before the ledger existed
+
+
+class Ledger:
+    """
+    Append-only double-entry ledger of every balance movement.
+
+    Each entry moves an amount from one account to another, so all balances always sum to
+    zero; user accounts are user ids, system accounts are the strings above. Balances are
+    derived by replaying the file and then kept current in memory. An entry can carry an
+    idempotency key (an update or callback query id); a key already seen in the last
+    `recent_keys` entries is rejected. Entries are written through a buffer and fsynced in
+    batches by run(), every LEDGER_FSYNC_INTERVAL seconds or LEDGER_FSYNC_BATCH entries.
+
+    Every LEDGER_CHECKPOINT_ENTRIES entries, and on close, run() also writes the balances and
+    recent keys to a checkpoint file along with the ledger's length at that point; load() starts
+    from the checkpoint and replays only the entries after it. The ledger file itself stays
+    the complete history.
+    """
+
+    def __init__(self, filename: str, recent_keys: int = LEDGER_RECENT_KEYS):
+        self.filename = filename
+        self.checkpoint_filename = filename + '.checkpoint'
+        self._balances: Dict[Account, float] = {}
+        self._recent: 'OrderedDict[str, None]' = OrderedDict()
+        self._recent_limit = recent_keys
+        self._file = None
+        self._unsynced = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.entries = 0
+        self._checkpointed = 0  # self.entries as of the last checkpoint
+
+    def load(self):
+        """Rebuild balances and the recent-key index from the last checkpoint and the entries after it"""
+        if not os.path.exists(self.filename):
+            return
+        good = self._load_checkpoint()
+        try:
+            with open(self.filename, 'rb') as f:
+                f.seek(good)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self._apply(entry['k'], entry['s'], entry['d'], entry['a'])
+                    good += len(line)
+            if good < os.path.getsize(self.filename):
+                # Drop a torn final write so new entries don't land after it
+                with open(self.filename, 'r+b') as f:
+                    f.truncate(good)
+        except Exception as e:
+            print(f"Error loading ledger: {e}")
+
+    def _load_checkpoint(self) -> int:
+        """Restore state from the checkpoint; returns the ledger offset to replay from"""
+        if not os.path.exists(self.checkpoint_filename):
+            return 0
+        try:
+            with open(self.checkpoint_filename) as f:
+                checkpoint = json.load(f)
+            # A ledger cut short by a crash before its fsync no longer matches the checkpoint
+            if checkpoint['o'] > os.path.getsize(self.filename):
+                return 0
+            self._balances = {account: balance for account, balance in checkpoint['b']}
+            self._recent = OrderedDict.fromkeys(checkpoint['r'])
+            self.entries = self._checkpointed = checkpoint['e']
+            return checkpoint['o']
+        except Exception as e:
+            print(f"Error loading ledger checkpoint, replaying in full: {e}")
+            self._balances, self._recent, self.entries = {}, OrderedDict(), 0
+            return 0
+
+    def seen(self, key: Optional[str]) -> bool:
+        return key is not None and key in self._recent
+
+    def balance(self, account: Account) -> Optional[float]:
+        """Derived balance, or None if the account has no entries yet"""
+        return self._balances.get(account)
+
+    def open_account(self, user_id: int, balance: float):
+        """Carry a user's existing balance into the ledger the first time they post"""
+        if user_id not in self._balances:
+            self.transfer(f"open:{user_id}", EQUITY, user_id, balance, 'opening balance')
+
+    def transfer(self, key: Optional[str], source: Account, dest: Account, amount: float, memo: str = '') -> bool:
+        """Move amount from source to dest; False if key was already posted"""
+        if self.seen(key):
+            return False
+        self._apply(key, source, dest, amount)
+        self._write({'k': key, 's': source, 'd': dest, 'a': amount, 'm': memo, 't': time.time()})
+        return True
+
+    def mark(self, key: str, memo: str = '') -> bool:
+        """Post a key with no money attached, to make a non-monetary step idempotent; False if already posted"""
+        return self.transfer(key, HOUSE, HOUSE, 0.0, memo)
+
+    def _apply(self, key: Optional[str], source: Account, dest: Account, amount: float):
+        self._balances[source] = self._balances.get(source, 0.0) - amount
+        self._balances[dest] = self._balances.get(dest, 0.0) + amount
+        self.entries += 1
+        if key is not None:
+            self._recent[key] = None
+            if len(self._recent) > self._recent_limit:
+                self._recent.popitem(last=False)
+
+    def _write(self, entry: dict):
+        try:
+            if self._file is None:
+                self._file = open(self.filename, 'a', buffering=1 << 20)
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self._unsynced += 1
+            if self._unsynced >= LEDGER_FSYNC_BATCH and self._wakeup is not None:
+                self._wakeup.set()
+        except Exception as e:
+            print(f"Error writing ledger: {e}")
+
+    def sync(self):
+        """Flush and fsync everything written so far"""
+        if self._file is None or not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _checkpoint_state(self) -> dict:
+        """The state to checkpoint, as of everything flushed so far"""
+        self._checkpointed = self.entries
+        return {
+            'o': self._file.tell() if self._file is not None else os.path.getsize(self.filename),
+            'e': self.entries,
+            'b': list(self._balances.items()),  # Pairs, so user ids stay ints
+            'r': list(self._recent),
+        }
+
+    def _write_checkpoint(self, checkpoint: dict):
+        """Replace the checkpoint file; safe to run in a worker thread"""
+        try:
+            tmp = self.checkpoint_filename + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(checkpoint, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.checkpoint_filename)
+        except Exception as e:
+            print(f"Error writing ledger checkpoint: {e}")
+
+    async def run(self):
+        """Background task that group-commits entries so handlers never wait on fsync"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), LEDGER_FSYNC_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._file is None or not self._unsynced:
+                continue
+            try:
+                # Buffer flush stays on the loop; only the fsync itself goes to a thread
+                self._file.flush()
+                self._unsynced = 0
+                checkpoint = None
+                if self.entries - self._checkpointed >= LEDGER_CHECKPOINT_ENTRIES:
+                    checkpoint = self._checkpoint_state()
+                await asyncio.to_thread(os.fsync, self._file.fileno())
+                # Written only once the entries it covers are durable
+                if checkpoint is not None:
+                    await asyncio.to_thread(self._write_checkpoint, checkpoint)
+            except Exception as e:
+                print(f"Error syncing ledger: {e}")
+
+    def backup(self, name: str) -> Optional[str]:
+        if not os.path.exists(self.filename):
+            return None
+        self.sync()
+        backup_filename = f"{name}.ledger"
+        shutil.copy2(self.filename, backup_filename)
+        return backup_filename
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            if self.entries > self._checkpointed:
+                self._write_checkpoint(self._checkpoint_state())
+            self._file.close()
+            self._file = None
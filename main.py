@@ -1,9 +1,9 @@
 import logging
 import asyncio
 from telegram import Update, BotCommand
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, MAX_CONCURRENT_UPDATES
 from database import db
 from handlers import (
     start, 
@@ -22,10 +22,20 @@ from game_handlers import (
     dice_command, 
     dice_challenge, 
     coinflip_command, 
+    fair_command,
+    roulette_command,
+    crash_command,
+    autobet_command,
+    turbo_command,
     dealer_bot
 )
 from callback_handlers import handle_callback
-from text_handler import handle_text_bet
+from text_handler import handle_text_bet, settlements
+from tables import tables
+from escrow import pending_bets
+from update_processor import ChatOrderedUpdateProcessor
+from ratelimit import enforce_limits
+from send_queue import SendQueue
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -41,11 +51,13 @@ async def error_handler(update, context):
 
 
 async def periodic_save(app):
-    """Auto-save database every 5 minutes"""
+    """Persist changed users on the storage backend's interval without blocking the event loop"""
     while True:
-        await asyncio.sleep(300)
-        db.save_data()
-        logger.info("Database auto-saved")
+        await asyncio.sleep(db.storage.save_interval)
+        if await db.save_data_async():
+            logger.debug("Database auto-saved")
+        logger.debug(f"Update processor: {app.update_processor.stats()}")
+        logger.debug(f"Send queue: {app.bot.rate_limiter.stats()}")
 
 
 async def start_dealer_bot(app):
@@ -71,6 +83,10 @@ async def setup_commands(app):
         BotCommand("dice", "🎲 Play dice game (PvP available!)"),
         BotCommand("dice_challenge", "⚔️ Challenge another player to dice"),
         BotCommand("coinflip", "🪙 Play coin flip game"),
+        BotCommand("roulette", "🎰 Bet on the shared roulette table"),
+        BotCommand("crash", "🚀 Join the shared crash round"),
+        BotCommand("autobet", "🤖 Play many dice/coinflip rounds at once"),
+        BotCommand("turbo", "⚡ Instant dice/coinflip results"),
         
         # Profile & Social
         BotCommand("profile", "👤 View your profile & stats"),
@@ -78,6 +94,7 @@ async def setup_commands(app):
         BotCommand("leaderboard", "📊 View top 10 players"),
         BotCommand("referral", "👥 Get your referral link & earnings"),
         BotCommand("stats", "📈 View global casino statistics"),
+        BotCommand("fair", "🔐 Provably-fair seeds & verification"),
     ]
     
     await app.bot.set_my_commands(commands)
@@ -97,7 +114,17 @@ def main():
     print("🎰 Antaria Casino Bot Starting...")
     print("=" * 50)
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    update_processor = ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES)
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(update_processor)
+        .rate_limiter(SendQueue())
+        .build()
+    )
+
+    # Rate limits and game cooldowns run before every other handler group
+    application.add_handler(TypeHandler(Update, enforce_limits), group=-1)
 
     # Core commands
     application.add_handler(CommandHandler("start", start))
@@ -121,6 +148,11 @@ def main():
     application.add_handler(CommandHandler("dice", dice_command))
     application.add_handler(CommandHandler("dice_challenge", dice_challenge))
     application.add_handler(CommandHandler("coinflip", coinflip_command))
+    application.add_handler(CommandHandler("roulette", roulette_command))
+    application.add_handler(CommandHandler("crash", crash_command))
+    application.add_handler(CommandHandler("autobet", autobet_command))
+    application.add_handler(CommandHandler("turbo", turbo_command))
+    application.add_handler(CommandHandler("fair", fair_command))
 
     # Callback handlers
     application.add_handler(CallbackQueryHandler(handle_callback))
@@ -135,6 +167,10 @@ def main():
     loop = asyncio.get_event_loop()
     loop.create_task(periodic_save(application))
     loop.create_task(start_dealer_bot(application))
+    loop.create_task(settlements.run())
+    loop.create_task(db.ledger.run())
+    loop.create_task(tables.run(application))
+    loop.create_task(pending_bets.recover())
     
     # Setup commands menu (run after bot starts)
     loop.create_task(setup_commands(application))
@@ -0,0 +1,60 @@
+"""
+Import an existing JSON database (snapshot plus journal) into the SQLite backend.
+
+Usage:
+    python migrate.py [casino_data.json] [casino_data.db]
+
+Run it with the bot stopped, then start the bot with STORAGE_BACKEND=sqlite.
+"""
+
+import os
+import sys
+
+from challenges import ChallengeStore
+from leaderboard import TimedLeaderboards
+from storage import JsonStorage, SqliteStorage
+
+
+class _Snapshot:
+    """Just enough of Database for JsonStorage.load to fill in"""
+
+    def __init__(self):
+        self.users = {}
+        self.jackpot_pool = 5000.0
+        self.global_stats = {
+            'total_bets': 0,
+            'total_wagered': 0.0,
+            'total_won': 0.0,
+            'total_players': 0
+        }
+        self.boards = TimedLeaderboards()
+        self.dice_challenges = ChallengeStore()
+
+
+def migrate(json_filename: str, sqlite_filename: str):
+    source = _Snapshot()
+    JsonStorage(json_filename).load(source)
+
+    target = SqliteStorage(sqlite_filename)
+    try:
+        target.import_users(source.users, source.jackpot_pool, source.global_stats, source.boards.counters(),
+                            source.dice_challenges.to_dict())
+    finally:
+        target.close()
+
+    print(f"Migrated {len(source.users)} users from {json_filename} to {sqlite_filename}")
+
+
+def main():
+    json_filename = sys.argv[1] if len(sys.argv) > 1 else 'casino_data.json'
+    sqlite_filename = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_filename)[0] + '.db'
+
+    if not os.path.exists(json_filename):
+        print(f"❌ {json_filename} not found")
+        sys.exit(1)
+
+    migrate(json_filename, sqlite_filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import ACHIEVEMENTS
+
+# Bit of each achievement in UserRecord.achievement_bits; new achievements go at the end of ACHIEVEMENTS
+ACHIEVEMENT_BITS: Dict[str, int] = {achievement_id: 1 << i for i, achievement_id in enumerate(ACHIEVEMENTS)}
+
+
+def _to_epoch(value) -> Optional[float]:
+    """Timestamps used to be stored as ISO strings; accept those as well as epoch floats"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+class UserRecord:
+    """
+    Compact per-user record.
+
+    Numeric fields are plain attributes, timestamps are epoch floats, the LTC address is
+    derived from the user id, achievements are bits of one int and the referral list is only
+    allocated once used.
+    Handlers still use it like the old dict: user['balance'] += amount, user.get('xp', 0).
+    """
+
+    FIELDS: Tuple[str, ...] = (
+        'balance', 'username', 'total_wagered', 'total_won', 'games_played',
+        'last_bonus', 'bonus_streak', 'referred_by', 'level', 'xp',
+        'win_streak', 'max_win_streak', 'created_at', 'last_seen',
+        'bonus_locked', 'playthrough_required', 'bonus_wagered', 'wagered_since_withdrawal', 'turbo',
+        'achievement_bits', 'downline_count', 'referred_wagered', 'referral_earnings', 'referral_unclaimed',
+    )
+    LIST_FIELDS: Tuple[str, ...] = ('achievements', 'referrals')
+    TIMESTAMP_FIELDS: Tuple[str, ...] = ('last_bonus', 'created_at', 'last_seen')
+    _READABLE = frozenset(FIELDS + LIST_FIELDS + ('ltc_address',))
+    _WRITABLE = frozenset(FIELDS + LIST_FIELDS)
+
+    __slots__ = ('user_id', '_referrals', '_balance', '_listener') + tuple(f for f in FIELDS if f != 'balance')
+
+    def __init__(self, user_id: int, now: float, balance: float = 1000.0):
+        self.user_id = user_id
+        self._listener = None
+        self._balance = balance
+        self.username = ''
+        self.total_wagered = 0.0
+        self.total_won = 0.0
+        self.games_played = 0
+        self.last_bonus = None
+        self.bonus_streak = 0
+        self.referred_by = None
+        self.level = 1
+        self.xp = 0
+        self.win_streak = 0
+        self.max_win_streak = 0
+        self.created_at = now
+        self.last_seen = now
+        self.bonus_locked = 0.0
+        self.playthrough_required = 0.0
+        self.bonus_wagered = 0.0
+        self.wagered_since_withdrawal = 0.0
+        self.turbo = False
+        self.achievement_bits = 0
+        self.downline_count = 0  # Referred players within REFERRAL_COMMISSIONS levels below this one
+        self.referred_wagered = 0.0
+        self.referral_earnings = 0.0
+        self.referral_unclaimed = 0.0
+        self._referrals = None
+
+    @property
+    def balance(self) -> float:
+        return self._balance
+
+    @balance.setter
+    def balance(self, value: float):
+        self._balance = value
+        if self._listener is not None:
+            self._listener(self)
+
+    def watch_balance(self, listener: Optional[Callable[['UserRecord'], None]]):
+        """Call listener(record) after every balance change, e.g. to keep a rank index current"""
+        self._listener = listener
+
+    @property
+    def achievements(self) -> List[str]:
+        """Ids of the unlocked achievements, in ACHIEVEMENTS order; a copy, set it to change them"""
+        bits = self.achievement_bits
+        return [achievement_id for achievement_id, bit in ACHIEVEMENT_BITS.items() if bits & bit]
+
+    @achievements.setter
+    def achievements(self, value: List[str]):
+        self.achievement_bits = sum(ACHIEVEMENT_BITS[achievement_id] for achievement_id in set(value)
+                                    if achievement_id in ACHIEVEMENT_BITS)
+
+    @property
+    def referrals(self) -> List[int]:
+        if self._referrals is None:
+            self._referrals = []
+        return self._referrals
+
+    @referrals.setter
+    def referrals(self, value: List[int]):
+        self._referrals = list(value)
+
+    @property
+    def ltc_address(self) -> str:
+        return f"LTC{self.user_id % 1000000}xyz"
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._READABLE:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self.TIMESTAMP_FIELDS:
+            value = _to_epoch(value)
+        elif key not in self._WRITABLE:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._READABLE
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.FIELDS + self.LIST_FIELDS + ('ltc_address',)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict for serialization; lists are copied so the result can leave the event loop"""
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data['referrals'] = list(self._referrals or ())
+        return data
+
+    @classmethod
+    def from_dict(cls, user_id: int, data: Dict[str, Any]) -> 'UserRecord':
+        """Build a record from a stored dict, including the old ISO-timestamp and achievement-list layouts"""
+        record = cls(user_id, _to_epoch(data.get('created_at')) or datetime.now().timestamp())
+        for field in cls.FIELDS:
+            if field in data:
+                record[field] = data[field]
+        if data.get('achievements') and 'achievement_bits' not in data:
+            record.achievements = data['achievements']
+        if data.get('referrals'):
+            record._referrals = list(data['referrals'])
+        return record
+
+    def __repr__(self) -> str:
+        return f"UserRecord({self.user_id}, balance={self.balance})"
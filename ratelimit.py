@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from config import ADMIN_IDS, GAME_COOLDOWNS, RATE_LIMIT_MAX, RATE_LIMIT_WINDOW
+
+# Results of RateLimiter.check
+ALLOWED = 0
+FLOODING = 1
+COOLDOWN = 2
+
+
+class _UserLimit:
+    __slots__ = ('tokens', 'updated', 'last_bets')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.last_bets: Optional[Dict[str, float]] = None  # Only allocated once the user bets
+
+
+class RateLimiter:
+    """
+    Per-user token bucket plus per-game bet cooldowns.
+
+    A bucket holds up to `capacity` updates and refills at capacity/window per second, so a
+    user gets RATE_LIMIT_MAX updates per RATE_LIMIT_WINDOW with bursts allowed. State is one
+    small record per active user, kept in recency order; users idle long enough that their
+    bucket is full and every cooldown has passed are evicted from the front as others arrive.
+    """
+
+    def __init__(self, capacity: int = RATE_LIMIT_MAX, window: float = RATE_LIMIT_WINDOW,
+                 cooldowns: Optional[Dict[str, float]] = None):
+        self.capacity = capacity
+        self.refill_rate = capacity / window
+        self.cooldowns = GAME_COOLDOWNS if cooldowns is None else cooldowns
+        self.idle_after = max([window] + list(self.cooldowns.values()))
+        self._users: 'OrderedDict[int, _UserLimit]' = OrderedDict()
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def check(self, user_id: int, game: Optional[str] = None, now: Optional[float] = None) -> int:
+        """Take a token for one update (a bet on `game` if given); ALLOWED, FLOODING or COOLDOWN"""
+        if now is None:
+            now = time.monotonic()
+
+        limit = self._users.get(user_id)
+        if limit is None:
+            limit = self._users[user_id] = _UserLimit(self.capacity, now)
+        else:
+            self._users.move_to_end(user_id)
+            limit.tokens = min(self.capacity, limit.tokens + (now - limit.updated) * self.refill_rate)
+            limit.updated = now
+        self._evict_idle(now)
+
+        # A bet still cooling down is turned away without spending a token, so retrying it
+        # doesn't count towards flooding
+        cooldown = self.cooldowns.get(game) if game is not None else None
+        if cooldown is not None and limit.last_bets is not None:
+            last = limit.last_bets.get(game)
+            if last is not None and now - last < cooldown:
+                self.rejected += 1
+                return COOLDOWN
+
+        if limit.tokens < 1:
+            self.rejected += 1
+            return FLOODING
+        limit.tokens -= 1
+
+        if cooldown is not None:
+            if limit.last_bets is None:
+                limit.last_bets = {}
+            limit.last_bets[game] = now
+        return ALLOWED
+
+    def remaining_cooldown(self, user_id: int, game: str, now: Optional[float] = None) -> float:
+        limit = self._users.get(user_id)
+        if limit is None or not limit.last_bets or game not in limit.last_bets:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self.cooldowns[game] - (now - limit.last_bets[game]))
+
+    def _evict_idle(self, now: float):
+        users = self._users
+        cutoff = now - self.idle_after
+        while users:
+            user_id = next(iter(users))
+            if users[user_id].updated > cutoff:
+                break
+            del users[user_id]
+
+
+limiter = RateLimiter()
+
+
+def _bet_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    """The game this update places a bet on, if it places one"""
+    if update.callback_query is not None:
+        data = update.callback_query.data or ''
+        # Only two clicks take a stake: picking a crash target (crash_<amount> just offers the
+        # targets) and dealing a blackjack hand; hits, stands and challenge answers don't
+        if data.startswith('crash_cashout_'):
+            return 'crash'
+        game, _, rest = data.partition('_')
+        return game if game == 'blackjack' and rest.isdigit() else None
+
+    message = update.message
+    if message is None or not message.text:
+        return None
+    if message.text.startswith('/dice_challenge'):
+        return 'dice'
+    if message.text.startswith(('/roulette', '/crash')):
+        return message.text[1:].split(None, 1)[0].split('@')[0]
+    if message.text.startswith('/autobet'):
+        words = message.text.split()
+        return words[1].lower() if len(words) > 1 else None
+    if not message.text.startswith('/') and context.user_data:
+        return context.user_data.get('game_state', {}).get('type')
+    return None
+
+
+async def enforce_limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs ahead of every handler group; stops dispatch for users over their limits"""
+    user = update.effective_user
+    if user is None or user.id in ADMIN_IDS:
+        return
+
+    game = _bet_game(update, context)
+    result = limiter.check(user.id, game)
+    if result == ALLOWED:
+        return
+
+    if result == COOLDOWN:
+        wait = limiter.remaining_cooldown(user.id, game)
+        notice = f"⏳ Slow down! You can play {game} again in {wait:.1f}s."
+        if update.callback_query is not None:
+            await update.callback_query.answer(notice)
+        elif update.message is not None:
+            await update.message.reply_text(notice)
+    elif update.callback_query is not None:
+        # Flooding gets no message, but the button's spinner still has to stop
+        await update.callback_query.answer()
+    raise ApplicationHandlerStop
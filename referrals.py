@@ -0,0 +1,94 @@
+from typing import Dict, List, Sequence
+
+from achievements import achievement_engine
+from config import REFERRAL_COMMISSIONS
+from database import db
+from models import UserRecord
+from wallet import grant
+
+
+class ReferralGraph:
+    """
+    Who referred whom, with every referrer's downline totals kept current.
+
+    The edges live on the user records: referred_by points up, referrals lists the players
+    directly below. Each referrer up to len(rates) levels above a player carries running
+    totals for that downline (players, volume wagered, commission earned), updated when a
+    referral is added or a bet settles, so reading them never walks the graph. Commission
+    accrues per settled stake at the rate for its level and is paid out by claim().
+    """
+
+    def __init__(self, rates: Sequence[float] = REFERRAL_COMMISSIONS):
+        self.rates = tuple(rates)
+
+    def upline(self, user_data: UserRecord) -> List[UserRecord]:
+        """The referrers above a player, nearest first, as far as commissions reach"""
+        chain = []
+        while user_data.referred_by is not None and len(chain) < len(self.rates):
+            user_data = db.load_user(user_data.referred_by)
+            if user_data is None:
+                break
+            chain.append(user_data)
+        return chain
+
+    def add(self, referrer_id: int, referee_id: int) -> bool:
+        """Link a player to their referrer; False for self-referrals and players already in the graph"""
+        if referrer_id == referee_id:
+            return False
+        referee = db.get_user(referee_id)
+        # A player with a downline of their own could close a cycle, and their totals would
+        # have to be carried up; only players not yet in the graph can be referred
+        if referee.referred_by is not None or referee.referrals:
+            return False
+        referrer = db.get_user(referrer_id)
+
+        referee.referred_by = referrer_id
+        referrer.referrals.append(referee_id)
+        upline = self.upline(referee)
+        for user_data in upline:
+            user_data.downline_count += 1
+        db.commit(referee_id, *(user_data.user_id for user_data in upline))
+        return True
+
+    def record_wager(self, user_data: UserRecord, stake: float) -> List[int]:
+        """Add a settled stake to the totals and commissions of the referrers above the player;
+        returns their ids, for the caller to commit"""
+        if user_data.referred_by is None:
+            return []
+        referrer_ids = []
+        for rate, referrer in zip(self.rates, self.upline(user_data)):
+            commission = stake * rate
+            referrer.referred_wagered += stake
+            referrer.referral_earnings += commission
+            referrer.referral_unclaimed += commission
+            referrer_ids.append(referrer.user_id)
+        return referrer_ids
+
+    def claim(self, user_id: int) -> float:
+        """Pay out the commission accrued since the last claim; returns the amount paid"""
+        user_data = db.get_user(user_id)
+        amount = round(user_data.referral_unclaimed, 2)
+        if amount < 0.01:
+            return 0.0
+        # Lifetime earnings only grow between claims, so they make the payout's key unique
+        key = f"referral:{user_id}:claim:{user_data.referral_earnings:.6f}"
+        paid = grant(user_id, amount, key, 'referral commission', commit=False)
+        user_data.referral_unclaimed = 0.0
+        achievement_engine.recheck(user_data, ('balance',), commit=False)
+        db.commit(user_id)
+        return amount if paid else 0.0
+
+    def summary(self, user_id: int) -> Dict[str, float]:
+        """A referrer's totals, read straight off their record"""
+        user_data = db.get_user(user_id)
+        return {
+            'direct': len(user_data.referrals),
+            'downline': user_data.downline_count,
+            'wagered': user_data.referred_wagered,
+            'earned': user_data.referral_earnings,
+            'unclaimed': user_data.referral_unclaimed,
+        }
+
+
+# Global referral graph
+referral_graph = ReferralGraph()
@@ -0,0 +1,81 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineScheduler:
+    """
+    Deadlines kept in a min-heap and served by one background task.
+
+    schedule() is O(log n) and cancel() is O(1): cancelled entries are simply skipped when
+    they reach the top of the heap. Everything that is due at the same time is handed to the
+    handler as one batch, and batches run as their own tasks so a slow batch never delays
+    the next deadline.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[None]]):
+        self._handler = handler
+        self._heap: List[list] = []
+        self._counter = itertools.count()
+        self._active = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._batches: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return self._active
+
+    def schedule(self, delay: float, payload: Any) -> list:
+        """Hand payload to the handler after delay seconds; returns a handle for cancel()"""
+        entry = [asyncio.get_running_loop().time() + delay, next(self._counter), payload]
+        heapq.heappush(self._heap, entry)
+        self._active += 1
+        if self._wakeup is not None and self._heap[0] is entry:
+            self._wakeup.set()
+        return entry
+
+    def cancel(self, entry: list) -> bool:
+        """Drop a scheduled payload; False if it already fired or was cancelled"""
+        if entry[2] is None:
+            return False
+        entry[2] = None
+        self._active -= 1
+        return True
+
+    def _pop_due(self, now: float) -> List[Any]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[2] is not None:
+                due.append(entry[2])
+                entry[2] = None
+                self._active -= 1
+        return due
+
+    async def _run_batch(self, batch: List[Any]):
+        try:
+            await self._handler(batch)
+        except Exception as e:
+            logger.exception(f"Scheduled batch of {len(batch)} failed: {e}")
+
+    async def run(self):
+        """Background task: sleep until the earliest deadline, then fire everything due"""
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        while True:
+            due = self._pop_due(loop.time())
+            if due:
+                task = asyncio.create_task(self._run_batch(due))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - loop.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
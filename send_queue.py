@@ -0,0 +1,267 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (
+    SEND_GLOBAL_RATE, SEND_GROUP_RATE, SEND_GROUP_WINDOW, SEND_MAX_RETRIES, SEND_PRIVATE_RATE,
+    SEND_PRIVATE_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first. Pass rate_limit_args={'priority': ...} to override.
+RESULT = 0        # Game outcomes and the dice/edits that lead up to them
+REPLY = 1         # Direct replies to a user's command
+NOTIFICATION = 2  # Unprompted messages such as refunds and announcements
+PRIORITY_NAMES = {RESULT: 'result', REPLY: 'reply', NOTIFICATION: 'notification'}
+
+_EDIT_ENDPOINTS = frozenset({'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption'})
+# Calls that post to a chat and count against its message limits; everything else, such as
+# getChatMember or answerCallbackQuery, goes straight through
+_SHAPED_ENDPOINTS = _EDIT_ENDPOINTS | frozenset({
+    'sendMessage', 'forwardMessage', 'copyMessage', 'sendPhoto', 'sendAudio', 'sendDocument', 'sendVideo',
+    'sendAnimation', 'sendVoice', 'sendVideoNote', 'sendMediaGroup', 'sendLocation', 'sendVenue',
+    'sendContact', 'sendPoll', 'sendDice', 'sendSticker', 'sendInvoice', 'sendGame',
+})
+_DEFAULT_PRIORITY = {
+    'sendDice': RESULT,
+    'editMessageText': RESULT,
+    'editMessageReplyMarkup': RESULT,
+    'editMessageCaption': RESULT,
+}
+
+
+def _is_group(chat_id) -> bool:
+    """Groups and channels have negative ids (or @usernames); private chats are positive"""
+    return isinstance(chat_id, str) or chat_id < 0
+
+
+def _copy_result(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'edit_key', 'call', 'future', 'queued_at', 'retries')
+
+    def __init__(self, priority: int, seq: int, chat_id, edit_key, call, future, queued_at: float):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.edit_key = edit_key
+        self.call = call
+        self.future = future
+        self.queued_at = queued_at
+        self.retries = 0
+
+    def __lt__(self, other: '_Request') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendQueue(BaseRateLimiter):
+    """
+    Outbound dispatcher for every Bot API call that posts to a chat.
+
+    Calls are queued by priority class and sent by one task, spaced to stay under
+    SEND_GLOBAL_RATE per second overall, SEND_GROUP_RATE per SEND_GROUP_WINDOW in each
+    group chat and SEND_PRIVATE_RATE per SEND_PRIVATE_WINDOW in each private chat. A chat
+    that is out of budget is parked so it doesn't hold up the others. An edit to a message
+    that already has an edit waiting replaces it, and both callers get the result of the
+    newest. Other calls (answerCallbackQuery, getChatMember, setMyCommands, ...) go straight
+    through. A RetryAfter from Telegram drains the chat's budget for the penalty, and the
+    call is queued again.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, group_rate: float = SEND_GROUP_RATE,
+                 group_window: float = SEND_GROUP_WINDOW, private_rate: float = SEND_PRIVATE_RATE,
+                 private_window: float = SEND_PRIVATE_WINDOW, max_retries: int = SEND_MAX_RETRIES):
+        self._interval = 1 / global_rate
+        # (capacity, refill per second) of a chat's bucket, for private chats and for groups
+        self._limits = {False: (private_rate, private_rate / private_window),
+                        True: (group_rate, group_rate / group_window)}
+        self._max_retries = max_retries
+
+        self._ready: List[_Request] = []
+        self._parked: List[Tuple[float, _Request]] = []
+        self._edits: Dict[Tuple[Any, Any], _Request] = {}
+        self._chats: 'OrderedDict[Any, List[float]]' = OrderedDict()  # chat_id -> [tokens, updated]
+        self._next_send = 0.0
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight = set()
+        self._waits: Dict[int, Deque[float]] = {priority: deque(maxlen=2000) for priority in PRIORITY_NAMES}
+        self._sent: Dict[int, int] = {priority: 0 for priority in PRIORITY_NAMES}
+        self.collapsed = 0
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._ready) + len(self._parked)
+
+    def __bool__(self) -> bool:
+        # ExtBot tests `if not self.rate_limiter`; an empty queue must still count as set
+        return True
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None or endpoint not in _SHAPED_ENDPOINTS or self._task is None:
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get('priority', _DEFAULT_PRIORITY.get(endpoint, REPLY))
+        call = (callback, args, kwargs)
+
+        edit_key = None
+        if endpoint in _EDIT_ENDPOINTS and data.get('message_id') is not None:
+            edit_key = (chat_id, data['message_id'])
+            waiting = self._edits.get(edit_key)
+            if waiting is not None:
+                # Only the newest text matters; reuse the queued slot and its future
+                waiting.call = call
+                self.collapsed += 1
+                return await asyncio.shield(waiting.future)
+
+        loop = asyncio.get_running_loop()
+        request = _Request(priority, next(self._counter), chat_id, edit_key, call,
+                           loop.create_future(), loop.time())
+        if edit_key is not None:
+            self._edits[edit_key] = request
+        heapq.heappush(self._ready, request)
+        self._wakeup.set()
+        return await asyncio.shield(request.future)
+
+    def _chat_delay(self, chat_id, now: float) -> float:
+        """Seconds until the chat has budget for another message; takes a token if it has"""
+        capacity, refill = self._limits[_is_group(chat_id)]
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = [capacity, now]
+        else:
+            self._chats.move_to_end(chat_id)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+            bucket[1] = now
+
+        # Chats that have been quiet long enough to refill completely need no state
+        while self._chats:
+            oldest = next(iter(self._chats))
+            tokens, updated = self._chats[oldest]
+            oldest_capacity, oldest_refill = self._limits[_is_group(oldest)]
+            if oldest == chat_id or tokens + (now - updated) * oldest_refill < oldest_capacity:
+                break
+            del self._chats[oldest]
+
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / refill
+        bucket[0] -= 1
+        return 0.0
+
+    def _unpark(self, now: float):
+        while self._parked and self._parked[0][0] <= now:
+            heapq.heappush(self._ready, heapq.heappop(self._parked)[1])
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self._unpark(now)
+
+            wait = None
+            if self._next_send > now:
+                wait = self._next_send - now
+            elif self._ready:
+                request = heapq.heappop(self._ready)
+                delay = self._chat_delay(request.chat_id, now)
+                if delay:
+                    # Park the whole chat's message; the rest of the queue keeps moving
+                    heapq.heappush(self._parked, (now + delay, request))
+                    continue
+                self._next_send = now + self._interval
+                self._send(request, now)
+                continue
+            elif self._parked:
+                wait = self._parked[0][0] - now
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _send(self, request: _Request, now: float):
+        if request.edit_key is not None and self._edits.get(request.edit_key) is request:
+            del self._edits[request.edit_key]
+        if request.retries == 0:
+            self._waits[request.priority].append(now - request.queued_at)
+            self._sent[request.priority] += 1
+
+        task = asyncio.create_task(self._call(request))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _call(self, request: _Request):
+        callback, args, kwargs = request.call
+        try:
+            result = await callback(*args, **kwargs)
+        except RetryAfter as e:
+            if request.retries >= self._max_retries:
+                if not request.future.done():
+                    request.future.set_exception(e)
+                return
+            request.retries += 1
+            now = asyncio.get_running_loop().time()
+            retry_at = now + e.retry_after
+            # Drain the chat's budget so its other messages wait out the penalty too
+            _, refill = self._limits[_is_group(request.chat_id)]
+            self._chats[request.chat_id] = [1 - e.retry_after * refill, now]
+            logger.warning(f"Flood limit hit in chat {request.chat_id}, retrying in {e.retry_after}s")
+
+            newer = self._edits.get(request.edit_key) if request.edit_key is not None else None
+            if newer is not None:
+                # A newer edit of the same message is already queued; answer with its result
+                newer.future.add_done_callback(lambda done: _copy_result(done, request.future))
+                return
+            if request.edit_key is not None:
+                self._edits[request.edit_key] = request
+            heapq.heappush(self._parked, (retry_at, request))
+            self._wakeup.set()
+            return
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+        if not request.future.done():
+            request.future.set_result(result)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Queue wait per priority class over the most recent sends, in milliseconds"""
+        report = {}
+        for priority, name in PRIORITY_NAMES.items():
+            waits = sorted(self._waits[priority])
+            report[name] = {
+                'sent': self._sent[priority],
+                'queued': sum(1 for r in self._ready if r.priority == priority)
+                          + sum(1 for _, r in self._parked if r.priority == priority),
+                'p50_ms': waits[len(waits) // 2] * 1000 if waits else 0.0,
+                'p95_ms': waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+                'max_ms': waits[-1] * 1000 if waits else 0.0,
+            }
+        return report
@@ -0,0 +1,144 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from achievements import achievement_engine
+from database import db
+from referrals import referral_graph
+from utils import get_xp_for_bet
+from wallet import credit
+
+logger = logging.getLogger(__name__)
+
+
+class Settlement:
+    """
+    One staked bet and what its outcome pays back, ready to settle.
+
+    `returned` is stake plus winnings (0 on a loss, the stake on a push). A keyed record is
+    credited under f"{key}:payout" and, once fully applied, posts f"{key}:settled" to the
+    ledger, so settling the same record twice moves money and counts its stats once.
+    A record may cover several rounds of the same bet (autobet); it then carries the
+    winnings of the rounds that won, the streak the rounds ended on and the best one
+    reached along the way, and the amount to pay if that differs from `returned`.
+    """
+
+    __slots__ = ('user_id', 'game', 'stake', 'returned', 'key', 'rounds', 'winnings', 'streak',
+                 'best_streak', 'payout', 'xp', 'unlocked', 'settled')
+
+    def __init__(self, user_id: int, game: str, stake: float, returned: float, key: Optional[str] = None,
+                 rounds: int = 1, winnings: Optional[float] = None, streak: Optional[int] = None,
+                 best_streak: Optional[int] = None, payout: Optional[float] = None):
+        self.user_id = user_id
+        self.game = game
+        self.stake = stake
+        self.returned = returned
+        self.key = key
+        self.rounds = rounds
+        self.winnings = max(0.0, returned - stake) if winnings is None else winnings
+        self.streak = streak
+        self.best_streak = best_streak
+        self.payout = returned if payout is None else payout  # What is credited
+        self.xp = 0
+        self.unlocked: List[Tuple[str, float]] = []  # Achievements this bet unlocked, with rewards
+        self.settled = False
+
+    @property
+    def won(self) -> bool:
+        return self.returned > self.stake
+
+    @property
+    def push(self) -> bool:
+        return self.returned == self.stake
+
+
+def _apply(record: Settlement) -> Dict[str, float]:
+    """Every side effect of a settled bet on the player's record, the globals and the leaderboards;
+    returns the fields it changed with their new values, plus the size of one bet as 'stake'"""
+    user_data = db.get_user(record.user_id)
+    stake, winnings = record.stake, record.winnings
+    streak = user_data['win_streak']
+
+    user_data['total_wagered'] += stake
+    user_data['games_played'] += record.rounds
+    user_data['total_won'] += winnings
+    user_data['wagered_since_withdrawal'] = user_data.get('wagered_since_withdrawal', 0) + stake
+    if user_data.get('playthrough_required', 0) > 0:
+        user_data['bonus_wagered'] = user_data.get('bonus_wagered', 0) + stake
+
+    if record.streak is not None:
+        user_data['win_streak'] = record.streak
+    elif record.won:
+        user_data['win_streak'] += 1
+    elif not record.push:
+        user_data['win_streak'] = 0
+    best = max(user_data['win_streak'], record.best_streak or 0)
+    new_best = best > user_data['max_win_streak']
+    if new_best:
+        user_data['max_win_streak'] = best
+
+    db.global_stats['total_bets'] += record.rounds
+    db.global_stats['total_wagered'] += stake
+    db.global_stats['total_won'] += winnings
+
+    record.xp = get_xp_for_bet(stake / record.rounds) * record.rounds
+    user_data['xp'] = user_data.get('xp', 0) + record.xp
+    db.record_bet(record.user_id, stake, winnings, record.xp)
+
+    changed = {
+        'games_played': user_data['games_played'],
+        'total_wagered': user_data['total_wagered'],
+        'stake': stake / record.rounds,
+    }
+    if winnings:
+        changed['total_won'] = user_data['total_won']
+    if record.xp:
+        changed['xp'] = user_data['xp']
+    if user_data['win_streak'] != streak:
+        changed['win_streak'] = max(user_data['win_streak'], record.best_streak or 0)
+    if new_best:
+        changed['max_win_streak'] = best
+    if record.payout > 0:
+        changed['balance'] = user_data['balance']
+    return changed
+
+
+async def settle(records: Iterable[Settlement]) -> List[Settlement]:
+    """
+    Pay out and account for a batch of bets whose stakes were taken when they were placed.
+
+    Each record is credited, then applied to stats, XP, leaderboards and the referrers' commissions,
+    then checked against the achievement rules on the fields it changed; everyone involved is committed
+    once at the end. A failure in one record is logged and leaves it unsettled without stopping the
+    rest of the batch.
+    """
+    records = list(records)
+    touched = {record.user_id for record in records}
+    ranked = set()  # Fields any record in the batch changed, so the rest aren't reindexed
+    for record in records:
+        # A record settled twice (a retried update, a recovered round) moves no money and counts
+        # no stats the second time. Nothing from here to the mark suspends, so no other task can
+        # settle the same record in between; marking last means a failure can be retried.
+        settled_key = f"{record.key}:settled" if record.key else None
+        if db.ledger.seen(settled_key):
+            logger.info(f"{record.game} bet {record.key} for {record.user_id} was already settled")
+            continue
+        try:
+            if record.payout > 0:
+                key = f"{record.key}:payout" if record.key else None
+                await credit(record.user_id, record.payout, key, 'push' if record.push else 'payout', commit=False)
+            changed = _apply(record)
+            ranked.update(changed)
+            touched.update(referral_graph.record_wager(db.get_user(record.user_id), record.stake))
+            if settled_key:
+                db.ledger.mark(settled_key, 'settled')
+            record.settled = True
+        except Exception as e:
+            logger.exception(f"Failed to settle {record.game} bet {record.key} for {record.user_id}: {e}")
+            continue
+        # Money and stats are in; a failing achievement check mustn't unsettle the bet
+        try:
+            record.unlocked = achievement_engine.check(db.get_user(record.user_id), changed, commit=False)
+        except Exception as e:
+            logger.exception(f"Achievement check for {record.user_id} failed: {e}")
+    db.commit(*touched, fields=ranked)
+    return records
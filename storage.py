@@ -0,0 +1,614 @@
+import asyncio
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+from config import JOURNAL_FSYNC, SQLITE_FLUSH_INTERVAL, SQLITE_CACHE_SIZE, SQLITE_CACHE_IDLE, BACKUP_INTERVAL
+from leaderboard import DAY, WINDOWS, RankIndex
+from models import UserRecord
+
+# Fields both backends rank from in-memory indexes; SQLite also stores them as columns
+RANKED_FIELDS = ('balance', 'total_wagered', 'total_won', 'max_win_streak', 'xp')
+
+
+def _default_stats(total_players: int = 0) -> Dict[str, Any]:
+    return {
+        'total_bets': 0,
+        'total_wagered': 0.0,
+        'total_won': 0.0,
+        'total_players': total_players
+    }
+
+
+class _RankedStorage:
+    """Rankings served from an in-memory RankIndex per ranked field, for either backend"""
+
+    def __init__(self):
+        self.rank_indexes = {field: RankIndex() for field in RANKED_FIELDS}
+
+    def _balance_changed(self, user_data: UserRecord):
+        self.rank_indexes['balance'].update(user_data.user_id, user_data.balance)
+
+    def _reindex(self, user_data: UserRecord, fields: Iterable[str] = RANKED_FIELDS):
+        for field in fields:
+            self.rank_indexes[field].update(user_data.user_id, user_data[field])
+
+    def _reindex_committed(self, db, user_ids, fields: Optional[Iterable[str]]):
+        """Reindex committed users on the fields that changed; balance ranks follow the balance listener"""
+        ranked = [field for field in (RANKED_FIELDS if fields is None else fields)
+                  if field in RANKED_FIELDS and field != 'balance']
+        for user_id in user_ids:
+            if user_id in db.users:
+                self._reindex(db.users[user_id], ranked)
+
+    def top_users(self, db, field: str, limit: int) -> List[Tuple[int, float]]:
+        """Top users by a ranked field, read straight from its index"""
+        if field not in RANKED_FIELDS:
+            raise ValueError(f"Not a ranked field: {field}")
+        return self.rank_indexes[field].top(limit)
+
+    def rank(self, db, field: str, user_id: int) -> Optional[int]:
+        """1-based position of the user by a ranked field"""
+        if field not in RANKED_FIELDS:
+            raise ValueError(f"Not a ranked field: {field}")
+        return self.rank_indexes[field].rank(user_id)
+
+
+class JsonStorage(_RankedStorage):
+    """Whole database in memory, persisted as a JSON snapshot plus an append-only journal"""
+
+    save_interval = BACKUP_INTERVAL
+
+    def __init__(self, filename: str):
+        super().__init__()
+        self.filename = filename
+        self._journal_prefix = os.path.splitext(filename)[0]
+        self._journal = None
+        self.journal_seq = 0
+        self._dirty: Set[int] = set()
+        self._fragments: Dict[int, str] = {}
+        # Held from capturing a snapshot until it is published, so snapshots land in order
+        self._snapshot_lock = threading.Lock()
+        self._challenges_dirty = False
+        self.usernames: Dict[str, int] = {}
+
+    def fetch_user(self, user_id: int) -> Optional[UserRecord]:
+        """Every user is already in memory, so there is nothing to fetch"""
+        return None
+
+    def user_ids(self, db) -> List[int]:
+        return list(db.users)
+
+    def touch(self, user_id: int):
+        """Every user stays in memory, so there is no cache to keep them in"""
+
+    def attach(self, user_data: UserRecord):
+        """Index the user and keep their balance rank current as it changes"""
+        user_data.watch_balance(self._balance_changed)
+        self._reindex(user_data)
+        if user_data.username:
+            self.usernames[user_data.username.lower()] = user_data.user_id
+
+    def index_username(self, user_id: int, old: str, new: str):
+        if old and self.usernames.get(old.lower()) == user_id:
+            del self.usernames[old.lower()]
+        if new:
+            self.usernames[new.lower()] = user_id
+
+    def lookup_username(self, username: str) -> Optional[int]:
+        return self.usernames.get(username.lower())
+
+    def commit(self, db, user_ids, fields: Optional[Iterable[str]] = None):
+        """Append the current state of the given users and the globals to the journal; `fields`
+        narrows the ranked fields to reindex to those that changed"""
+        lines = [
+            json.dumps({'u': user_id, 'd': db.users[user_id].to_dict()}, separators=(',', ':'))
+            for user_id in user_ids if user_id in db.users
+        ]
+        globals_record = {'g': db.global_stats, 'j': db.jackpot_pool}
+        counters = db.boards.drain_changes()
+        if counters:
+            globals_record['c'] = counters
+        lines.append(json.dumps(globals_record, separators=(',', ':')))
+        self._dirty.update(user_ids)
+        self._reindex_committed(db, user_ids, fields)
+        self._append(lines)
+
+    def commit_challenge(self, db, challenge_id: str):
+        """Journal a challenge's current state, or its removal"""
+        record = {'ch': challenge_id, 'd': db.dice_challenges.get(challenge_id)}
+        self._challenges_dirty = True
+        self._append([json.dumps(record, separators=(',', ':'))])
+
+    def _append(self, lines: List[str]):
+        try:
+            if self._journal is None:
+                self._journal = open(self._segment_filename(self.journal_seq), 'a')
+            self._journal.write('\n'.join(lines) + '\n')
+            self._journal.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(self._journal.fileno())
+        except Exception as e:
+            print(f"Error writing journal: {e}")
+
+    def _segment_filename(self, seq: int) -> str:
+        return f"{self._journal_prefix}.{seq}.journal"
+
+    def _journal_segments(self) -> List[Tuple[int, str]]:
+        """Existing journal segments as (sequence, path), oldest first"""
+        segments = []
+        for path in glob.glob(f"{glob.escape(self._journal_prefix)}.*.journal"):
+            seq = path[len(self._journal_prefix) + 1:-len('.journal')]
+            if seq.isdigit():
+                segments.append((int(seq), path))
+        return sorted(segments)
+
+    def _begin_snapshot(self, db) -> Dict[str, Any]:
+        """Capture everything a snapshot needs; this is the only part that runs on the event loop"""
+        dirty = {}
+        for user_id in self._dirty:
+            user_data = db.users.get(user_id)
+            if user_data is not None:
+                dirty[user_id] = user_data.to_dict()
+        self._dirty = set()
+        self._challenges_dirty = False
+
+        # New mutations go to a fresh segment so the snapshot can retire the old ones
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self.journal_seq += 1
+
+        return {
+            'dirty': dirty,
+            'users': set(db.users),
+            'counters': db.boards.counters(),
+            'challenges': db.dice_challenges.to_dict(),
+            'jackpot_pool': db.jackpot_pool,
+            'global_stats': dict(db.global_stats),
+            'journal_seq': self.journal_seq,
+        }
+
+    def _write_snapshot(self, job: Dict[str, Any]):
+        """Serialize changed users and atomically publish the snapshot; safe to run in a worker thread"""
+        for user_id, user_data in job['dirty'].items():
+            self._fragments[user_id] = json.dumps(user_data, separators=(',', ':'))
+        # Users dropped from memory since the last snapshot leave it too
+        for user_id in self._fragments.keys() - job['users']:
+            del self._fragments[user_id]
+
+        header = json.dumps({
+            'jackpot_pool': job['jackpot_pool'],
+            'global_stats': job['global_stats'],
+            'journal_seq': job['journal_seq'],
+            'counters': job['counters'],
+            'challenges': job['challenges'],
+            'version': '2.4'
+        }, separators=(',', ':'))
+        fragments = list(self._fragments.items())
+
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, 'w') as f:
+            f.write('{"users":{')
+            # Write in chunks so the event loop thread gets the GIL back between them
+            for i in range(0, len(fragments), 1000):
+                chunk = ','.join(f'"{user_id}":{fragment}' for user_id, fragment in fragments[i:i + 1000])
+                f.write(chunk if i == 0 else ',' + chunk)
+            f.write(f'}},{header[1:]}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, self.filename)
+
+        for seq, path in self._journal_segments():
+            if seq < job['journal_seq']:
+                os.remove(path)
+
+    def save(self, db):
+        """Write a snapshot and retire the journal segments it supersedes; waits for one running
+        in a worker thread to finish first, so the newer snapshot is the one that lands"""
+        with self._snapshot_lock:
+            job = self._begin_snapshot(db)
+            try:
+                self._write_snapshot(job)
+            except Exception as e:
+                self._dirty.update(job['dirty'])
+                self._challenges_dirty = True
+                print(f"Error saving database: {e}")
+
+    def _write_snapshot_and_release(self, job: Dict[str, Any]):
+        try:
+            self._write_snapshot(job)
+        finally:
+            self._snapshot_lock.release()
+
+    async def save_async(self, db) -> bool:
+        """Like save, but serializes and writes in a worker thread so handlers keep running"""
+        if not (self._dirty or self._challenges_dirty):
+            return False
+        # Released by the worker once the snapshot is published, even if this task is cancelled
+        if not self._snapshot_lock.acquire(blocking=False):
+            return False
+
+        job = self._begin_snapshot(db)
+        try:
+            await asyncio.to_thread(self._write_snapshot_and_release, job)
+            return True
+        except Exception as e:
+            self._dirty.update(job['dirty'])
+            self._challenges_dirty = True
+            print(f"Error saving database: {e}")
+            return False
+
+    def load(self, db):
+        """Load the JSON snapshot, then replay the journal tail"""
+        counters = []
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r') as f:
+                    data = json.load(f)
+
+                db.users = {int(k): UserRecord.from_dict(int(k), v) for k, v in data.get('users', {}).items()}
+                db.jackpot_pool = data.get('jackpot_pool', 5000.0)
+                db.global_stats = data.get('global_stats', _default_stats(len(db.users)))
+                self.journal_seq = data.get('journal_seq', 0)
+                counters.extend(data.get('counters', []))
+                db.dice_challenges.load(data.get('challenges', {}))
+
+                print(f"Database loaded: {len(db.users)} users")
+            except Exception as e:
+                print(f"Error loading database: {e}")
+        elif not self._journal_segments():
+            print("No existing database found. Creating new one.")
+
+        self.replay_journal(db, counters)
+        db.boards.load_counters(counters, time.time())
+        for user_data in db.users.values():
+            self.attach(user_data)
+        # Nothing is cached in serialized form yet, so the first snapshot writes everyone
+        self._dirty = set(db.users)
+
+    def replay_journal(self, db, counters: list):
+        """Apply journal records written after the last snapshot; leaderboard counters go to `counters`"""
+        replayed = 0
+        for seq, path in self._journal_segments():
+            if seq < self.journal_seq:
+                continue
+            self.journal_seq = seq
+
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append; everything before it is intact
+                        break
+
+                    if 'u' in record:
+                        user_id = int(record['u'])
+                        db.users[user_id] = UserRecord.from_dict(user_id, record['d'])
+                    elif 'ch' in record:
+                        if record['d'] is None:
+                            db.dice_challenges.pop(record['ch'])
+                        else:
+                            db.dice_challenges.add(record['ch'], record['d'])
+                        replayed += 1
+                        continue
+                    db.global_stats = record.get('g', db.global_stats)
+                    db.jackpot_pool = record.get('j', db.jackpot_pool)
+                    counters.extend(record.get('c', ()))
+                    replayed += 1
+
+        if replayed:
+            print(f"Journal replayed: {replayed} records")
+
+    def backup(self, name: str) -> str:
+        """Copy the latest snapshot to name.json"""
+        backup_filename = f"{name}.json"
+        with open(self.filename, 'r') as original:
+            data = original.read()
+
+        with open(backup_filename, 'w') as backup:
+            backup.write(data)
+        return backup_filename
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+class SqliteStorage(_RankedStorage):
+    """
+    Users live in SQLite; Database.users is a write-back cache of recently active players.
+
+    Rankings still come from in-memory indexes over every stored user, loaded from the ranked
+    columns at startup and kept current as cached users change, so a rank lookup doesn't
+    count rows. That costs a few small nodes per user, far less than caching their records.
+    """
+
+    save_interval = SQLITE_FLUSH_INTERVAL
+
+    UPSERT_USER = (
+        "INSERT INTO users (user_id, username, balance, total_wagered, total_won, max_win_streak, xp, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, balance = excluded.balance, "
+        "total_wagered = excluded.total_wagered, total_won = excluded.total_won, "
+        "max_win_streak = excluded.max_win_streak, xp = excluded.xp, data = excluded.data"
+    )
+    UPSERT_META = (
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+    )
+    UPSERT_COUNTER = (
+        "INSERT INTO counters (day, metric, user_id, value) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(day, metric, user_id) DO UPDATE SET value = excluded.value"
+    )
+    UPSERT_CHALLENGE = (
+        "INSERT INTO challenges (challenge_id, data) VALUES (?, ?) "
+        "ON CONFLICT(challenge_id) DO UPDATE SET data = excluded.data"
+    )
+    SELECT_USER = "SELECT data FROM users WHERE user_id = ?"
+    SELECT_USERNAME = "SELECT user_id FROM users WHERE username = ? COLLATE NOCASE LIMIT 1"
+
+    def __init__(self, filename: str):
+        super().__init__()
+        self.filename = filename
+        self._conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._conn_lock = threading.Lock()
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._in_flight: Dict[int, Dict[str, Any]] = {}
+        self._used: Dict[int, float] = {}  # When each cached user was last loaded, looked up or committed
+        self._meta: Optional[Dict[str, Any]] = None
+        self._counters: Dict[Tuple[int, str, int], float] = {}
+        self._challenges: Dict[str, Optional[Dict[str, Any]]] = {}  # None marks a removal
+        self._renamed: Dict[str, int] = {}
+        self._flush_running = False
+
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id INTEGER PRIMARY KEY, username TEXT, balance REAL, total_wagered REAL, "
+                "total_won REAL, max_win_streak INTEGER, xp INTEGER, data TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "day INTEGER, metric TEXT, user_id INTEGER, value REAL, PRIMARY KEY (day, metric, user_id))"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS challenges (challenge_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username COLLATE NOCASE)")
+            for field in RANKED_FIELDS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_users_{field} ON users ({field} DESC, user_id)")
+
+    def fetch_user(self, user_id: int) -> Optional[UserRecord]:
+        """Load a user evicted from (or never loaded into) the cache"""
+        user_data = self._pending.get(user_id) or self._in_flight.get(user_id)
+        if user_data is None:
+            with self._conn_lock:
+                row = self._conn.execute(self.SELECT_USER, (user_id,)).fetchone()
+            if row is None:
+                return None
+            user_data = json.loads(row[0])
+        return UserRecord.from_dict(user_id, user_data)
+
+    def user_ids(self, db) -> List[int]:
+        """Every stored user plus any created since the last flush"""
+        with self._conn_lock:
+            stored = [row[0] for row in self._conn.execute("SELECT user_id FROM users")]
+        return list(set(stored).union(db.users, self._pending, self._in_flight))
+
+    def touch(self, user_id: int):
+        """Keep a cached user from being evicted; last_seen only tracks the player's own activity"""
+        self._used[user_id] = time.time()
+
+    def attach(self, user_data: UserRecord):
+        """Note when the user entered the cache and keep their balance rank current as it changes"""
+        self.touch(user_data.user_id)
+        user_data.watch_balance(self._balance_changed)
+        self._reindex(user_data)
+
+    def index_username(self, user_id: int, old: str, new: str):
+        """Remember renames until they are flushed to the username column"""
+        if old and self._renamed.get(old.lower()) == user_id:
+            del self._renamed[old.lower()]
+        if new:
+            self._renamed[new.lower()] = user_id
+
+    def lookup_username(self, username: str) -> Optional[int]:
+        user_id = self._renamed.get(username.lower())
+        if user_id is not None:
+            return user_id
+        with self._conn_lock:
+            row = self._conn.execute(self.SELECT_USERNAME, (username,)).fetchone()
+        return row[0] if row else None
+
+    def commit(self, db, user_ids, fields: Optional[Iterable[str]] = None):
+        """Queue the given users and the globals for the next batched flush; `fields` narrows the
+        ranked fields to reindex to those that changed"""
+        for user_id in user_ids:
+            user_data = db.users.get(user_id)
+            if user_data is not None:
+                self._pending[user_id] = user_data.to_dict()
+                self.touch(user_id)
+        self._reindex_committed(db, user_ids, fields)
+        self._meta = {'jackpot_pool': db.jackpot_pool, 'global_stats': dict(db.global_stats)}
+        for day, metric, user_id, value in db.boards.drain_changes():
+            self._counters[(day, metric, user_id)] = value
+
+    def commit_challenge(self, db, challenge_id: str):
+        """Queue a challenge's current state, or its removal, for the next flush"""
+        challenge = db.dice_challenges.get(challenge_id)
+        self._challenges[challenge_id] = dict(challenge) if challenge is not None else None
+
+    def _flush(self, users: Dict[int, Dict[str, Any]], meta: Optional[Dict[str, Any]],
+               counters: Optional[Dict[Tuple[int, str, int], float]] = None,
+               challenges: Optional[Dict[str, Optional[Dict[str, Any]]]] = None):
+        """Write one batch in a single transaction; safe to run in a worker thread"""
+        rows = [
+            (user_id, user_data.get('username'), user_data['balance'], user_data['total_wagered'],
+             user_data['total_won'], user_data['max_win_streak'], user_data['xp'],
+             json.dumps(user_data, separators=(',', ':')))
+            for user_id, user_data in users.items()
+        ]
+        with self._conn_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(self.UPSERT_USER, rows)
+                if meta is not None:
+                    self._conn.executemany(
+                        self.UPSERT_META,
+                        [(key, json.dumps(value)) for key, value in meta.items()]
+                    )
+                if counters:
+                    self._conn.executemany(
+                        self.UPSERT_COUNTER,
+                        [(day, metric, user_id, value) for (day, metric, user_id), value in counters.items()]
+                    )
+                    self._conn.execute(
+                        "DELETE FROM counters WHERE day < ?",
+                        (int(time.time() // DAY) - max(WINDOWS.values()),)
+                    )
+                if challenges:
+                    self._conn.executemany(
+                        self.UPSERT_CHALLENGE,
+                        [(cid, json.dumps(data)) for cid, data in challenges.items() if data is not None]
+                    )
+                    self._conn.executemany(
+                        "DELETE FROM challenges WHERE challenge_id = ?",
+                        [(cid,) for cid, data in challenges.items() if data is None]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _forget_flushed_renames(self, users: Dict[int, Dict[str, Any]]):
+        """Names now in the username column no longer need the in-memory overlay"""
+        for user_id, user_data in users.items():
+            name = (user_data.get('username') or '').lower()
+            if self._renamed.get(name) == user_id:
+                del self._renamed[name]
+
+    def _take_batch(self):
+        self._in_flight, self._pending = self._pending, {}
+        meta, self._meta = self._meta, None
+        counters, self._counters = self._counters, {}
+        challenges, self._challenges = self._challenges, {}
+        return self._in_flight, meta, counters, challenges
+
+    def _restore_batch(self, meta, counters, challenges):
+        # Anything committed since the batch was taken is newer and wins
+        self._pending = {**self._in_flight, **self._pending}
+        self._counters = {**counters, **self._counters}
+        self._challenges = {**challenges, **self._challenges}
+        if self._meta is None:
+            self._meta = meta
+
+    def save(self, db):
+        """Flush every queued change synchronously"""
+        users, meta, counters, challenges = self._take_batch()
+        try:
+            self._flush(users, meta, counters, challenges)
+            self._forget_flushed_renames(users)
+        except Exception as e:
+            self._restore_batch(meta, counters, challenges)
+            print(f"Error saving database: {e}")
+        finally:
+            self._in_flight = {}
+
+    async def save_async(self, db) -> bool:
+        """Flush queued changes in a worker thread, then trim idle users from the cache"""
+        if self._flush_running or (not self._pending and self._meta is None and not self._challenges):
+            return False
+
+        self._flush_running = True
+        users, meta, counters, challenges = self._take_batch()
+        try:
+            await asyncio.to_thread(self._flush, users, meta, counters, challenges)
+            self._forget_flushed_renames(users)
+        except Exception as e:
+            self._restore_batch(meta, counters, challenges)
+            print(f"Error saving database: {e}")
+            return False
+        finally:
+            self._in_flight = {}
+            self._flush_running = False
+
+        if len(db.users) > SQLITE_CACHE_SIZE:
+            self._evict_idle(db)
+        return True
+
+    def _evict_idle(self, db):
+        """Drop cached users that are flushed and have been neither seen nor used for a while"""
+        cutoff = time.time() - SQLITE_CACHE_IDLE
+        idle = [
+            user_id for user_id, user_data in db.users.items()
+            if user_id not in self._pending and max(user_data.last_seen, self._used.get(user_id, 0.0)) < cutoff
+        ]
+        for user_id in idle:
+            del db.users[user_id]
+            self._used.pop(user_id, None)
+
+    def load(self, db):
+        """Load the globals; users are fetched lazily as they show up"""
+        with self._conn_lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            user_count = self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            counters = self._conn.execute(
+                "SELECT day, metric, user_id, value FROM counters WHERE day > ?",
+                (int(time.time() // DAY) - max(WINDOWS.values()),)
+            ).fetchall()
+            challenges = self._conn.execute("SELECT challenge_id, data FROM challenges").fetchall()
+            ranked = self._conn.execute(f"SELECT user_id, {', '.join(RANKED_FIELDS)} FROM users").fetchall()
+        for column, field in enumerate(RANKED_FIELDS, 1):
+            self.rank_indexes[field].load((row[0], row[column]) for row in ranked)
+        db.boards.load_counters(counters, time.time())
+        db.dice_challenges.load({cid: json.loads(data) for cid, data in challenges})
+
+        if not meta and not user_count:
+            print("No existing database found. Creating new one.")
+            return
+
+        db.jackpot_pool = json.loads(meta['jackpot_pool']) if 'jackpot_pool' in meta else 5000.0
+        db.global_stats = json.loads(meta['global_stats']) if 'global_stats' in meta else _default_stats(user_count)
+        print(f"Database loaded: {user_count} users")
+
+    def import_users(self, users: Dict[int, UserRecord], jackpot_pool: float, global_stats: Dict[str, Any],
+                     counters: List[Tuple[int, str, int, float]], challenges: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Bulk-load users, leaderboard counters and open challenges in one transaction, used by migrate.py"""
+        self._flush(
+            {user_id: user_data.to_dict() for user_id, user_data in users.items()},
+            {'jackpot_pool': jackpot_pool, 'global_stats': global_stats},
+            {(day, metric, user_id): value for day, metric, user_id, value in counters},
+            challenges
+        )
+
+    def backup(self, name: str) -> str:
+        """Online copy of the database to name.db"""
+        backup_filename = f"{name}.db"
+        target = sqlite3.connect(backup_filename)
+        try:
+            with self._conn_lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+        return backup_filename
+
+    def close(self):
+        with self._conn_lock:
+            self._conn.close()
+
+
+def create_storage(backend: str, filename: str):
+    """Storage for the configured backend; SQLite lives next to the JSON file with a .db suffix"""
+    if backend == 'sqlite':
+        return SqliteStorage(os.path.splitext(filename)[0] + '.db')
+    if backend == 'json':
+        return JsonStorage(filename)
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,296 @@
+import asyncio
+import html
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import JOURNAL_FSYNC, TABLE_BET_WINDOW, TABLE_MAX_BETS
+from database import db
+from games import CrashGame, RouletteGame, RouletteSlip
+from scheduler import DeadlineScheduler
+from send_queue import REPLY, RESULT
+from settlement import Settlement, settle
+from wallet import credit, place_bet
+
+logger = logging.getLogger(__name__)
+
+ROULETTE = 'roulette'
+CRASH = 'crash'
+
+# Bets listed on the table message; the rest are summarized so it stays under Telegram's limit
+_SHOWN_BETS = 30
+
+# The journal is rewritten once it holds this many more lines than unsettled rounds need
+_COMPACT_SLACK = 1000
+
+
+class TableBet:
+    __slots__ = ('user_id', 'name', 'key', 'stake', 'slip', 'cashout')
+
+    def __init__(self, user_id: int, name: str, key: str, stake: float,
+                 slip: Optional[RouletteSlip] = None, cashout: Optional[float] = None):
+        self.user_id = user_id
+        self.name = name
+        self.key = key          # Idempotency key of the stake; the payout uses f"{key}:payout"
+        self.stake = stake
+        self.slip = slip        # Roulette: every bet this player put on the spin
+        self.cashout = cashout  # Crash: the automatic cash-out multiplier
+
+    def returned(self, game: str, outcome) -> float:
+        """Stake plus winnings this bet gets back from the round's outcome"""
+        if game == ROULETTE:
+            return self.slip.returned(outcome)
+        success, multiplier = CrashGame.did_crash(outcome, self.cashout)
+        return self.stake * multiplier if success else 0.0
+
+    def describe(self, game: str) -> str:
+        if game == ROULETTE:
+            return ', '.join(f"{RouletteGame.describe(i)} ${amount:g}" for i, amount in self.slip.bets)
+        return f"${self.stake:g} @ {self.cashout:g}x"
+
+
+class TableRound:
+    __slots__ = ('round_id', 'chat_id', 'game', 'bets', 'closes_at', 'message_id')
+
+    def __init__(self, round_id: str, chat_id: int, game: str, closes_at: float):
+        self.round_id = round_id
+        self.chat_id = chat_id
+        self.game = game
+        self.bets: List[TableBet] = []
+        self.closes_at = closes_at
+        self.message_id: Optional[int] = None
+
+
+class TableManager:
+    """
+    Shared Crash and Roulette rounds, one table per chat and game.
+
+    The first bet opens a round with a TABLE_BET_WINDOW betting window, and later bets join it.
+    At the deadline one outcome is drawn from the chat's provably-fair stream. Every bet is
+    settled against it in one pass, and the table's single message is edited with the results.
+    A round costs one message plus edits, which SendQueue collapses, however many players join.
+    Stakes and each drawn outcome are journaled until the round settles. After a restart, a
+    round whose outcome was drawn is paid out, and any other unsettled round is refunded.
+    The journal is fsynced when a round opens, draws and settles, and it is rewritten to
+    just the unsettled rounds once settled ones make up most of it.
+    """
+
+    def __init__(self, filename: str, window: float = TABLE_BET_WINDOW):
+        self.filename = filename
+        self.window = window
+        self._rounds: Dict[Tuple[int, str], TableRound] = {}
+        self._closer = DeadlineScheduler(self._close_due)
+        self._counter = itertools.count()
+        self._file = None
+        self._lines = 0
+        self._unsettled: Dict[str, List[dict]] = {}  # Journal records of rounds not yet settled
+        self._bot = None
+
+    def __len__(self) -> int:
+        return len(self._rounds)
+
+    def open_round(self, chat_id: int, game: str) -> Optional[TableRound]:
+        return self._rounds.get((chat_id, game))
+
+    async def bet(self, bot, chat_id: int, game: str, bet: TableBet) -> Optional[str]:
+        """Take the stake and seat the bet in the chat's open round; returns an error message on failure"""
+        current = self._rounds.get((chat_id, game))
+        if current is not None and len(current.bets) >= TABLE_MAX_BETS:
+            return "❌ This round is full. Bet on the next one!"
+        if not await place_bet(bet.user_id, bet.stake, bet.key):
+            return "❌ Insufficient balance."
+
+        # No await from here until the bet is seated, so the round can't close in between
+        current = self._rounds.get((chat_id, game))
+        if current is None:
+            round_id = f"{chat_id}:{game}:{int(time.time())}:{next(self._counter)}"
+            current = TableRound(round_id, chat_id, game, time.time() + self.window)
+            self._rounds[(chat_id, game)] = current
+            self._closer.schedule(self.window, current)
+        current.bets.append(bet)
+        self._journal(dict(self._spec(game, bet), r=current.round_id, u=bet.user_id, k=bet.key, a=bet.stake),
+                      sync=len(current.bets) == 1)
+
+        self._bot = bot
+        await self._show(current, self._render_open(current), REPLY)
+        return None
+
+    @staticmethod
+    def _spec(game: str, bet: TableBet) -> dict:
+        """What the journal needs to settle a bet again after a restart"""
+        return {'g': game, 's': bet.slip.bets} if game == ROULETTE else {'g': game, 'c': bet.cashout}
+
+    @staticmethod
+    def _from_record(record: dict) -> TableBet:
+        slip = None
+        if record['g'] == ROULETTE:
+            slip = RouletteSlip()
+            slip.bets = [tuple(b) for b in record['s']]
+        return TableBet(record['u'], '', record['k'], record['a'], slip, record.get('c'))
+
+    def _journal(self, record: dict, sync: bool = False):
+        if record.get('settled'):
+            self._unsettled.pop(record['r'], None)
+            if not self._unsettled or self._lines > 2 * sum(map(len, self._unsettled.values())) + _COMPACT_SLACK:
+                self._rewrite()
+                return
+        else:
+            self._unsettled.setdefault(record['r'], []).append(record)
+        try:
+            if self._file is None:
+                self._file = open(self.filename, 'a')
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._file.flush()
+            if sync or JOURNAL_FSYNC:
+                os.fsync(self._file.fileno())
+            self._lines += 1
+        except Exception as e:
+            print(f"Error writing table journal: {e}")
+
+    def _rewrite(self):
+        """Replace the journal with just the records of unsettled rounds"""
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            tmp = self.filename + '.tmp'
+            with open(tmp, 'w') as f:
+                for records in self._unsettled.values():
+                    f.writelines(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.filename)
+            self._lines = sum(map(len, self._unsettled.values()))
+        except Exception as e:
+            print(f"Error compacting table journal: {e}")
+
+    async def _show(self, current: TableRound, text: str, priority: int):
+        """Send the table message the first time, edit it after that"""
+        try:
+            if current.message_id is None:
+                message = await self._bot.send_message(
+                    current.chat_id, text, parse_mode='HTML', rate_limit_args={'priority': priority}
+                )
+                current.message_id = message.message_id
+            else:
+                await self._bot.edit_message_text(
+                    text, chat_id=current.chat_id, message_id=current.message_id,
+                    parse_mode='HTML', rate_limit_args={'priority': priority}
+                )
+        except Exception as e:
+            logger.debug(f"Table message for {current.round_id} not updated: {e}")
+
+    @staticmethod
+    def _title(game: str) -> str:
+        return "🎰 <b>ROULETTE TABLE</b>" if game == ROULETTE else "🚀 <b>CRASH TABLE</b>"
+
+    def _render_open(self, current: TableRound) -> str:
+        seconds = max(0, round(current.closes_at - time.time()))
+        lines = [self._title(current.game), f"⏳ Bets close in {seconds}s\n"]
+        for bet in current.bets[:_SHOWN_BETS]:
+            lines.append(f"• {html.escape(bet.name)}: {bet.describe(current.game)}")
+        if len(current.bets) > _SHOWN_BETS:
+            lines.append(f"…and {len(current.bets) - _SHOWN_BETS} more")
+        return "\n".join(lines)
+
+    def _render_result(self, current: TableRound, outcome, nonce: int, returns: List[float]) -> str:
+        if current.game == ROULETTE:
+            headline = f"🎯 Ball lands on {RouletteGame.get_color(outcome)} {outcome}"
+        else:
+            headline = f"💥 Crashed at {outcome}x"
+        lines = [self._title(current.game), headline + "\n"]
+        ranked = sorted(zip(current.bets, returns), key=lambda pair: pair[1] - pair[0].stake, reverse=True)
+        for bet, returned in ranked[:_SHOWN_BETS]:
+            net = returned - bet.stake
+            mark = "🎉" if net > 0 else ("🤝" if net == 0 else "😔")
+            lines.append(f"{mark} {html.escape(bet.name)}: {'+' if net >= 0 else '-'}${abs(net):.2f}")
+        if len(ranked) > _SHOWN_BETS:
+            lines.append(f"…and {len(ranked) - _SHOWN_BETS} more")
+        lines.append(f"\n🔐 Table nonce {nonce} · /fair table to verify")
+        return "\n".join(lines)
+
+    async def _close_due(self, rounds: List[TableRound]):
+        await asyncio.gather(*(self._settle(current) for current in rounds))
+
+    async def _settle(self, current: TableRound):
+        del self._rounds[(current.chat_id, current.game)]
+
+        rng = db.fairness.rng(current.chat_id)
+        nonce = rng.nonce
+        if current.game == ROULETTE:
+            outcome = RouletteGame.spin(rng)
+        else:
+            outcome = CrashGame.generate_multiplier(rng)
+        # Once the outcome is on disk a restart finishes paying this round instead of refunding it
+        self._journal({'r': current.round_id, 'o': outcome}, sync=True)
+
+        returns = [bet.returned(current.game, outcome) for bet in current.bets]
+        await settle(
+            Settlement(bet.user_id, current.game, bet.stake, returned, bet.key)
+            for bet, returned in zip(current.bets, returns)
+        )
+        self._journal({'r': current.round_id, 'settled': True})
+        await self._show(current, self._render_result(current, outcome, nonce, returns), RESULT)
+
+    def _load(self) -> Dict[str, List[dict]]:
+        """Records of every round the journal holds unsettled"""
+        unsettled: Dict[str, List[dict]] = {}
+        if not os.path.exists(self.filename):
+            return unsettled
+        try:
+            with open(self.filename) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # A torn final line from a crash mid-write
+                    if record.get('settled'):
+                        unsettled.pop(record['r'], None)
+                    else:
+                        unsettled.setdefault(record['r'], []).append(record)
+        except Exception as e:
+            print(f"Error loading table journal: {e}")
+        return unsettled
+
+    async def recover(self):
+        """Finish rounds a restart cut off after their outcome was drawn; refund the rest"""
+        # Rounds opened since startup are already tracked, and settle or close on their own
+        live = set(self._unsettled)
+        unsettled = self._load()
+        self._unsettled = {**unsettled, **self._unsettled}
+        self._rewrite()
+        finished = refunded = 0
+        for round_id, records in unsettled.items():
+            if round_id in live:
+                continue
+            outcome = next((record['o'] for record in records if 'o' in record), None)
+            bets = [(record['g'], self._from_record(record)) for record in records if 'k' in record]
+            # Keyed like the live round, so nothing is paid or counted twice if recovery is interrupted too
+            if outcome is not None:
+                await settle(
+                    Settlement(bet.user_id, game, bet.stake, bet.returned(game, outcome), bet.key)
+                    for game, bet in bets
+                )
+            else:
+                for game, bet in bets:
+                    await credit(bet.user_id, bet.stake, f"{bet.key}:refund", 'refund')
+            self._journal({'r': round_id, 'settled': True})
+            if outcome is not None:
+                finished += 1
+            else:
+                refunded += 1
+        if finished or refunded:
+            logger.info(f"Recovered table rounds: {finished} settled, {refunded} refunded")
+
+    async def run(self, app):
+        """Background task: refund interrupted rounds, then close rounds as their windows end"""
+        self._bot = app.bot
+        await self.recover()
+        await self._closer.run()
+
+
+# Global table instance
+tables = TableManager(os.path.splitext(db.filename)[0] + '.tables')
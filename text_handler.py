@@ -1,20 +1,34 @@
 import asyncio
+import logging
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import DiceEmoji
 
 from database import db
-from games import DiceGame, CoinFlipGame
-from utils import check_achievements, get_xp_for_bet, format_number
-from config import ACHIEVEMENTS
+from escrow import pending_bets
+from games import DiceGame
+from settlement import Settlement, settle
+from utils import format_number
+from wallet import place_bet, already_settled, credit
+from config import ACHIEVEMENTS, ANIMATION_DELAY
+from scheduler import DeadlineScheduler
+from send_queue import RESULT
+
+logger = logging.getLogger(__name__)
 
 
 async def handle_text_bet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handle text-based betting for Antaria Casino with Telegram's animated emojis
     """
+    # A redelivered update must not place the same bet twice
+    key = f"update:{update.update_id}"
+    if already_settled(key):
+        return
+
     user_id = update.effective_user.id
-    user_data = db.get_user(user_id)
+    user_data = db.get_user(user_id, update.effective_user.username)
     text = update.message.text.strip()
 
     game_state = context.user_data.get('game_state', {})
@@ -62,159 +76,211 @@ async def handle_dice_bet(update, context, user_id, user_data, game_state, amoun
         await update.message.reply_text("❌ Invalid number. Please choose 1-6.")
         return
 
-    # Deduct bet
-    user_data['balance'] -= amount
-    user_data['total_wagered'] += amount
-    user_data['games_played'] += 1
+    # Take the stake up front so a concurrent bet can't spend it too
+    if not await place_bet(user_id, amount, f"update:{update.update_id}"):
+        await update.message.reply_text(
+            f"❌ Insufficient balance.\n"
+            f"💰 You have: ${format_number(user_data['balance'])}"
+        )
+        return
 
-    # Track for bonus system
-    user_data['wagered_since_withdrawal'] = user_data.get('wagered_since_withdrawal', 0) + amount
+    await roll_bet(context, user_data, {
+        'game': 'dice',
+        'bot': context.bot,
+        'chat_id': update.effective_chat.id,
+        'reply_to': update.message.message_id,
+        'user_id': user_id,
+        'key': f"update:{update.update_id}",
+        'amount': amount,
+        'prediction': predicted_number,
+    })
 
-    if user_data.get('playthrough_required', 0) > 0:
-        user_data['bonus_wagered'] = user_data.get('bonus_wagered', 0) + amount
 
-    db.global_stats['total_bets'] += 1
-    db.global_stats['total_wagered'] += amount
+async def handle_coinflip_bet(update, context, user_id, user_data, game_state, amount):
+    """Handle coinflip bet with Telegram's animated dart emoji (used for coin flip)"""
+    prediction = game_state.get('prediction')
 
-    # Send Telegram's animated dice emoji
-    dice_message = await context.bot.send_dice(
-        chat_id=update.effective_chat.id,
-        emoji=DiceEmoji.DICE
-    )
-    
-    # Telegram automatically animates for ~3 seconds
-    await asyncio.sleep(4)  # Wait for animation to complete
-    
-    result = dice_message.dice.value  # Get the actual result (1-6)
-
-    # Calculate win
-    won = result == predicted_number
-    
-    if won:
-        payout = amount * 5  # 5x payout
-        user_data['balance'] += amount + payout
-        user_data['total_won'] += payout
-        user_data['win_streak'] += 1
-        if user_data['win_streak'] > user_data['max_win_streak']:
-            user_data['max_win_streak'] = user_data['win_streak']
-
-        db.global_stats['total_won'] += payout
-
-        result_msg = (
-            f"🎉 <b>YOU WIN!</b>\n\n"
-            f"🎲 Result: {result}\n"
-            f"🎯 You predicted: {predicted_number}\n\n"
-            f"💰 Bet: ${amount:.2f}\n"
-            f"🏆 Won: ${payout:.2f}\n"
-            f"💳 Balance: ${format_number(user_data['balance'])}\n"
-            f"🔥 Win streak: {user_data['win_streak']}"
-        )
-    else:
-        user_data['win_streak'] = 0
+    if prediction not in ['heads', 'tails']:
+        await update.message.reply_text("❌ Invalid prediction. Choose heads or tails.")
+        return
 
-        result_msg = (
-            f"❌ <b>Better luck next time!</b>\n\n"
-            f"🎲 Result: {result}\n"
-            f"🎯 You predicted: {predicted_number}\n\n"
-            f"💰 Bet: ${amount:.2f}\n"
-            f"💳 Balance: ${format_number(user_data['balance'])}"
+    # Take the stake up front so a concurrent bet can't spend it too
+    if not await place_bet(user_id, amount, f"update:{update.update_id}"):
+        await update.message.reply_text(
+            f"❌ Insufficient balance.\n"
+            f"💰 You have: ${format_number(user_data['balance'])}"
         )
+        return
+
+    # Coin flips are rolled as dice too: 1-3 is heads, 4-6 tails
+    await roll_bet(context, user_data, {
+        'game': 'coinflip',
+        'bot': context.bot,
+        'chat_id': update.effective_chat.id,
+        'reply_to': update.message.message_id,
+        'user_id': user_id,
+        'key': f"update:{update.update_id}",
+        'amount': amount,
+        'prediction': prediction,
+    })
+
+
+def is_turbo(context, user_data) -> bool:
+    """Turbo is on for this player, or for everyone in this chat"""
+    return bool(user_data.get('turbo') or (context.chat_data or {}).get('turbo'))
+
+
+async def roll_bet(context, user_data, bet):
+    """Roll a staked bet's die and settle it: at once in turbo mode, else after the animation"""
+    if is_turbo(context, user_data):
+        # Drawn locally, so the result costs no Bot API round-trip and no animation wait
+        rng = db.fairness.rng(bet['user_id'])
+        bet['nonce'] = rng.nonce
+        bet['value'] = DiceGame.roll(rng)
+        await settle_due_bets([bet])
+        return
 
-    # Add XP
-    xp_gained = get_xp_for_bet(amount)
-    user_data['xp'] = user_data.get('xp', 0) + xp_gained
+    # Journaled until settled, so a restart during the animation settles or refunds it
+    pending_bets.open(bet['key'], bet['user_id'], bet['amount'], bet['game'], p=bet['prediction'])
 
-    # Check achievements
-    unlocked = check_achievements(user_id)
-    if unlocked:
-        for ach_id, reward in unlocked:
-            ach = ACHIEVEMENTS[ach_id]
-            result_msg += f"\n\n🏆 Achievement: {ach['name']}\n+${reward}"
+    # Send Telegram's animated dice emoji; the result is settled once the animation ends
+    try:
+        dice_message = await context.bot.send_dice(
+            chat_id=bet['chat_id'],
+            emoji=DiceEmoji.DICE
+        )
+    except Exception as e:
+        logger.warning(f"Failed to roll bet {bet['key']}, refunding: {e}")
+        await credit(bet['user_id'], bet['amount'], f"{bet['key']}:refund", 'refund')
+        pending_bets.close(bet['key'])
+        return
+    bet['value'] = dice_message.dice.value
+    pending_bets.open(bet['key'], bet['user_id'], bet['amount'], bet['game'], p=bet['prediction'], v=bet['value'])
+    settlements.schedule(ANIMATION_DELAY, bet)
 
-    await update.message.reply_text(result_msg, parse_mode='HTML')
 
+def _fairness_line(bet) -> str:
+    """Turbo results come from the player's seed stream and can be checked with /fair"""
+    if bet.get('nonce') is None:
+        return ""
+    return f"\n🔐 Nonce {bet['nonce']} · /fair to verify"
 
-async def handle_coinflip_bet(update, context, user_id, user_data, game_state, amount):
-    """Handle coinflip bet with Telegram's animated dart emoji (used for coin flip)"""
-    prediction = game_state.get('prediction')
 
-    if prediction not in ['heads', 'tails']:
-        await update.message.reply_text("❌ Invalid prediction. Choose heads or tails.")
-        return
+def _settlement(bet) -> Settlement:
+    """The settlement record for a rolled dice or coinflip bet"""
+    if bet['game'] == 'dice':
+        won = bet['value'] == bet['prediction']
+        multiplier = 6  # Stake back plus 5x
+    else:
+        # Map dice result to coin: 1-3=heads, 4-6=tails
+        won = ('heads' if bet['value'] <= 3 else 'tails') == bet['prediction']
+        multiplier = 2  # Stake back plus 1x
+    return Settlement(bet['user_id'], bet['game'], bet['amount'], bet['amount'] * multiplier if won else 0.0, bet['key'])
+
+
+def _recover_bet(bet) -> Optional[Settlement]:
+    """Rebuild a journaled bet cut off by a restart; None refunds one whose die never came back"""
+    if bet.get('v') is None:
+        return None
+    return _settlement({
+        'game': bet['g'],
+        'user_id': bet['u'],
+        'key': bet['k'],
+        'amount': bet['a'],
+        'prediction': bet['p'],
+        'value': bet['v'],
+    })
+
+
+pending_bets.register('dice', _recover_bet)
+pending_bets.register('coinflip', _recover_bet)
+
+
+async def settle_due_bets(batch):
+    """Resolve every bet whose animation has finished, then send all the results at once"""
+    records = await settle(_settlement(bet) for bet in batch)
+    replies = []
+    for bet, record in zip(batch, records):
+        if not record.settled:
+            continue  # Left journaled; settled on the next start
+        pending_bets.close(bet['key'])
+        if bet['game'] == 'dice':
+            result_msg = dice_result_message(bet, record)
+        else:
+            result_msg = coinflip_result_message(bet, record)
+        replies.append(bet['bot'].send_message(
+            chat_id=bet['chat_id'],
+            text=result_msg + _achievement_lines(record) + _fairness_line(bet),
+            reply_to_message_id=bet['reply_to'],
+            parse_mode='HTML',
+            rate_limit_args={'priority': RESULT}
+        ))
 
-    # Deduct bet
-    user_data['balance'] -= amount
-    user_data['total_wagered'] += amount
-    user_data['games_played'] += 1
+    for result in await asyncio.gather(*replies, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to send bet result: {result}")
 
-    # Track for bonus system
-    user_data['wagered_since_withdrawal'] = user_data.get('wagered_since_withdrawal', 0) + amount
 
-    if user_data.get('playthrough_required', 0) > 0:
-        user_data['bonus_wagered'] = user_data.get('bonus_wagered', 0) + amount
+settlements = DeadlineScheduler(settle_due_bets)
 
-    db.global_stats['total_bets'] += 1
-    db.global_stats['total_wagered'] += amount
 
-    # Send animated dice for coin flip (we'll use dice but interpret as coin)
-    dice_message = await context.bot.send_dice(
-        chat_id=update.effective_chat.id,
-        emoji=DiceEmoji.DICE
+def _achievement_lines(record: Settlement) -> str:
+    return "".join(
+        f"\n\n🏆 Achievement: {ACHIEVEMENTS[ach_id]['name']}\n+${reward}" for ach_id, reward in record.unlocked
     )
-    
-    await asyncio.sleep(4)  # Wait for animation
-    
-    dice_value = dice_message.dice.value  # 1-6
-    # Map dice result to coin: 1-3=heads, 4-6=tails
-    result = 'heads' if dice_value <= 3 else 'tails'
-    
-    result_emoji = "🦅" if result == "heads" else "🏛️"
 
-    # Calculate win
-    won = result == prediction
-    
-    if won:
-        payout = amount  # 2x total (1x profit)
-        user_data['balance'] += amount + payout
-        user_data['total_won'] += payout
-        user_data['win_streak'] += 1
-        if user_data['win_streak'] > user_data['max_win_streak']:
-            user_data['max_win_streak'] = user_data['win_streak']
 
-        db.global_stats['total_won'] += payout
+def dice_result_message(bet, record: Settlement) -> str:
+    """Result message for a settled dice bet"""
+    user_data = db.get_user(bet['user_id'])
+    amount = bet['amount']
+    predicted_number = bet['prediction']
+    result = bet['value']  # The actual result (1-6)
 
-        result_msg = (
+    if record.won:
+        return (
             f"🎉 <b>YOU WIN!</b>\n\n"
-            f"{result_emoji} Result: {result.upper()}\n"
-            f"🎯 You called: {prediction.upper()}\n\n"
+            f"🎲 Result: {result}\n"
+            f"🎯 You predicted: {predicted_number}\n\n"
             f"💰 Bet: ${amount:.2f}\n"
-            f"🏆 Won: ${payout:.2f}\n"
+            f"🏆 Won: ${record.winnings:.2f}\n"
             f"💳 Balance: ${format_number(user_data['balance'])}\n"
             f"🔥 Win streak: {user_data['win_streak']}"
         )
-    else:
-        user_data['win_streak'] = 0
+    return (
+        f"❌ <b>Better luck next time!</b>\n\n"
+        f"🎲 Result: {result}\n"
+        f"🎯 You predicted: {predicted_number}\n\n"
+        f"💰 Bet: ${amount:.2f}\n"
+        f"💳 Balance: ${format_number(user_data['balance'])}"
+    )
+
+
+def coinflip_result_message(bet, record: Settlement) -> str:
+    """Result message for a settled coinflip bet"""
+    user_data = db.get_user(bet['user_id'])
+    amount = bet['amount']
+    prediction = bet['prediction']
+    result = 'heads' if bet['value'] <= 3 else 'tails'
+    result_emoji = "🦅" if result == "heads" else "🏛️"
 
-        result_msg = (
-            f"❌ <b>Better luck next time!</b>\n\n"
+    if record.won:
+        return (
+            f"🎉 <b>YOU WIN!</b>\n\n"
             f"{result_emoji} Result: {result.upper()}\n"
             f"🎯 You called: {prediction.upper()}\n\n"
             f"💰 Bet: ${amount:.2f}\n"
-            f"💳 Balance: ${format_number(user_data['balance'])}"
+            f"🏆 Won: ${record.winnings:.2f}\n"
+            f"💳 Balance: ${format_number(user_data['balance'])}\n"
+            f"🔥 Win streak: {user_data['win_streak']}"
         )
-
-    # Add XP
-    xp_gained = get_xp_for_bet(amount)
-    user_data['xp'] = user_data.get('xp', 0) + xp_gained
-
-    # Check achievements
-    unlocked = check_achievements(user_id)
-    if unlocked:
-        for ach_id, reward in unlocked:
-            ach = ACHIEVEMENTS[ach_id]
-            result_msg += f"\n\n🏆 Achievement: {ach['name']}\n+${reward}"
-
-    await update.message.reply_text(result_msg, parse_mode='HTML')
+    return (
+        f"❌ <b>Better luck next time!</b>\n\n"
+        f"{result_emoji} Result: {result.upper()}\n"
+        f"🎯 You called: {prediction.upper()}\n\n"
+        f"💰 Bet: ${amount:.2f}\n"
+        f"💳 Balance: ${format_number(user_data['balance'])}"
+    )
 
 
 async def handle_casual_text(update, text, user_data):
@@ -1,7 +1,16 @@
+import random
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Union
 from database import db
-from config import ACHIEVEMENTS, REFERRAL_BONUS, REFEREE_BONUS
+from config import (
+    CRASH_HOUSE_EDGE, REFERRAL_BONUS, REFEREE_BONUS, DAILY_BONUS_MIN, DAILY_BONUS_MAX, BONUS_COOLDOWN,
+    STREAK_BONUS_DAYS, STREAK_BONUS_AMOUNT
+)
+from achievements import achievement_engine
+from models import UserRecord
+from referrals import referral_graph
+from wallet import grant
 
 
 def format_number(num: float) -> str:
@@ -12,55 +21,38 @@ def format_number(num: float) -> str:
     return f"${num:.2f}"
 
 
-def check_achievements(user_id: int):
-    user = db.get_user(user_id)
-    unlocked = []
-    
-    if 'first_bet' not in user['achievements'] and user['games_played'] >= 1:
-        if db.add_achievement(user_id, 'first_bet'):
-            reward = ACHIEVEMENTS['first_bet']['reward']
-            user['balance'] += reward
-            unlocked.append(('first_bet', reward))
-    
-    if 'veteran' not in user['achievements'] and user['games_played'] >= 100:
-        if db.add_achievement(user_id, 'veteran'):
-            reward = ACHIEVEMENTS['veteran']['reward']
-            user['balance'] += reward
-            unlocked.append(('veteran', reward))
-    
-    if 'whale' not in user['achievements'] and user['balance'] >= 10000:
-        if db.add_achievement(user_id, 'whale'):
-            reward = ACHIEVEMENTS['whale']['reward']
-            user['balance'] += reward
-            unlocked.append(('whale', reward))
-    
-    if 'lucky_7' not in user['achievements'] and user['win_streak'] >= 7:
-        if db.add_achievement(user_id, 'lucky_7'):
-            reward = ACHIEVEMENTS['lucky_7']['reward']
-            user['balance'] += reward
-            unlocked.append(('lucky_7', reward))
-    
-    if 'streak_master' not in user['achievements'] and user['bonus_streak'] >= 10:
-        if db.add_achievement(user_id, 'streak_master'):
-            reward = ACHIEVEMENTS['streak_master']['reward']
-            user['balance'] += reward
-            unlocked.append(('streak_master', reward))
-    
-    return unlocked
-
-
 def process_referral(referrer_id: int, referee_id: int) -> bool:
-    if db.add_referral(referrer_id, referee_id):
-        referrer = db.get_user(referrer_id)
-        referee = db.get_user(referee_id)
-        
-        referrer['balance'] += REFERRAL_BONUS
-        referee['balance'] += REFEREE_BONUS
+    if referral_graph.add(referrer_id, referee_id):
+        grant(referrer_id, REFERRAL_BONUS, f"referral:{referee_id}:referrer", 'referral bonus')
+        grant(referee_id, REFEREE_BONUS, f"referral:{referee_id}:referee", 'referee bonus')
+        for user_id in (referrer_id, referee_id):
+            achievement_engine.recheck(db.get_user(user_id), ('balance',))
         
         return True
     return False
 
 
+def check_daily_reward(user_data: UserRecord, user_id: int, db) -> float:
+    """Grant the daily bonus if it is due, plus the streak bonus every STREAK_BONUS_DAYS days in a
+    row; returns the amount granted"""
+    now = time.time()
+    last = user_data.last_bonus
+    if last is not None and now - last < BONUS_COOLDOWN:
+        return 0.0
+
+    # Claiming within a day of becoming eligible keeps the streak going
+    continued = last is not None and now - last < 2 * BONUS_COOLDOWN
+    user_data.bonus_streak = user_data.bonus_streak + 1 if continued else 1
+    user_data.last_bonus = now
+    amount = round(random.uniform(DAILY_BONUS_MIN, DAILY_BONUS_MAX), 2)
+    if user_data.bonus_streak % STREAK_BONUS_DAYS == 0:
+        amount += STREAK_BONUS_AMOUNT
+    grant(user_id, amount, f"bonus:{user_id}:{int(now)}", 'daily bonus', commit=False)
+    achievement_engine.recheck(user_data, ('bonus_streak', 'balance'), commit=False)
+    db.commit(user_id)
+    return amount
+
+
 def get_rank_from_level(level: int) -> str:
     if level >= 50:
         return "🌟 Legend"
@@ -83,19 +75,21 @@ def calculate_house_edge(game_type: str) -> float:
         'basketball': 10.0,
         'soccer': 10.0,
         'bowling': 5.0,
-        'crash': 3.0,
+        'crash': CRASH_HOUSE_EDGE * 100,
         'dice': 8.3,
         'coinflip': 0.0
     }
     return edges.get(game_type, 5.0)
 
 
-def format_time_ago(dt: Optional[datetime]) -> str:
+def format_time_ago(dt: Optional[Union[datetime, float]]) -> str:
     if not dt:
         return "Never"
     
     if isinstance(dt, str):
         dt = datetime.fromisoformat(dt)
+    elif isinstance(dt, (int, float)):
+        dt = datetime.fromtimestamp(dt)
     
     delta = datetime.now() - dt
     
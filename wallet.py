@@ -0,0 +1,45 @@
+from typing import Optional
+
+from database import db
+from ledger import HOUSE, PROMO
+
+
+# Every call below checks and posts without awaiting in between, and the event loop only
+# switches tasks at an await, so each one is atomic without a lock. Keep it that way: a
+# balance check and its posting split by an await would let two bets spend the same money.
+def _post(user_id: int, key: Optional[str], source, dest, amount: float, memo: str, commit: bool = True) -> bool:
+    """Record a movement in the ledger and refresh the user's cached balance from it; pass
+    commit=False when the caller commits the user itself, e.g. once for a batch"""
+    user_data = db.get_user(user_id)
+    db.ledger.open_account(user_id, user_data.balance)
+    if not db.ledger.transfer(key, source, dest, amount, memo):
+        return False
+    user_data['balance'] = db.ledger.balance(user_id)
+    if commit:
+        db.commit(user_id, fields=())
+    return True
+
+
+def already_settled(key: Optional[str]) -> bool:
+    """True if a retried update or callback with this key has already moved money"""
+    return db.ledger.seen(key)
+
+
+async def place_bet(user_id: int, amount: float, key: Optional[str] = None) -> bool:
+    """Atomically check and take the stake out of the balance; False if it can't be covered or key was seen"""
+    user_data = db.get_user(user_id)
+    if amount <= 0 or user_data['balance'] < amount:
+        return False
+    return _post(user_id, key, user_id, HOUSE, amount, 'stake')
+
+
+async def credit(user_id: int, amount: float, key: Optional[str] = None, memo: str = 'payout',
+                 commit: bool = True) -> bool:
+    """Pay a settled bet (stake plus winnings) or a refund back into the balance"""
+    return _post(user_id, key, HOUSE, user_id, amount, memo, commit)
+
+
+def grant(user_id: int, amount: float, key: Optional[str] = None, memo: str = 'reward',
+          commit: bool = True) -> bool:
+    """Pay a reward that doesn't come from a bet, e.g. achievements and referral bonuses"""
+    return _post(user_id, key, PROMO, user_id, amount, memo, commit)